@@ -1,14 +1,27 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
+from datetime import datetime, timezone
+from PIL import Image, UnidentifiedImageError
+import io
+import json
 import time
 import os
+import threading
 from pathlib import Path
 
+from app.services.executor import BoundedExecutor, ExecutorSaturatedError
+from app.services.indexer import ReadOnlyIndexError
+from app.services.metrics import StageTimer, metrics
+from app.services.pagination import ResultPager
+from app.services.reloader import IndexReloader
+from app.services.response_cache import create_response_cache
 from app.services.search_engine import SearchEngine
+from app.services.thumbnails import THUMBNAIL_CACHE_CONTROL, THUMBNAIL_URL_PREFIX, ThumbnailCache
 
 # =========================
 # CONFIGURATION
@@ -33,22 +46,166 @@ DEFAULT_TOP_K = 5
 DEFAULT_THRESHOLD = 0.2
 MAX_TOP_K = 20
 
+# Startup: serialized model cache (empty disables), load in the background
+# so /health/live answers at once, and pre-encode common prompts before ready
+MODEL_CACHE_PATH = os.getenv("MODEL_CACHE_PATH", "data/clip_model.pt")
+BACKGROUND_STARTUP = os.getenv("BACKGROUND_STARTUP", "1") == "1"
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+# Text encoder backend: torch, int8, torchscript or onnx (the last two need an
+# export from scripts/export_text_encoder.py at TEXT_ENCODER_PATH); stub gives
+# TEXT_ENCODER_STUB_DIM-dimensional pseudo-embeddings for benchmarks
+TEXT_ENCODER_BACKEND = os.getenv("TEXT_ENCODER_BACKEND", "torch")
+TEXT_ENCODER_PATH = os.getenv("TEXT_ENCODER_PATH", "")
+TEXT_ENCODER_STUB_DIM = int(os.getenv("TEXT_ENCODER_STUB_DIM", "512"))
+
+# Text embedding cache (size 0 disables it, TTL 0 means entries never expire)
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", "2048"))
+TEXT_CACHE_TTL_SECONDS = float(os.getenv("TEXT_CACHE_TTL_SECONDS", "0"))
+
+# Cross-request micro-batching of query encoding
+ENCODE_BATCHING = os.getenv("ENCODE_BATCHING", "1") == "1"
+ENCODE_MAX_BATCH_SIZE = int(os.getenv("ENCODE_MAX_BATCH_SIZE", "32"))
+ENCODE_MAX_WAIT_US = int(os.getenv("ENCODE_MAX_WAIT_US", "2000"))
+
+# Search runs on a bounded thread pool; requests beyond workers + queue get 503
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+SEARCH_QUEUE_SIZE = int(os.getenv("SEARCH_QUEUE_SIZE", "64"))
+
+# FAISS index: type/build parameters apply when the index is built,
+# nprobe/efSearch are server defaults that requests may override
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_BUILD_PARAMS = {
+    "nlist": int(os.getenv("FAISS_NLIST", "1024")),
+    "pq_m": int(os.getenv("FAISS_PQ_M", "64")),
+    "pq_nbits": int(os.getenv("FAISS_PQ_NBITS", "8")),
+    "hnsw_m": int(os.getenv("FAISS_HNSW_M", "32")),
+    "ef_construction": int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200")),
+}
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0")) or None
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0")) or None
+INDEX_LOAD_MODE = os.getenv("INDEX_LOAD_MODE", "mmap")
+# Rescore rerank_factor x top candidates against float32 embeddings (0 = off);
+# pairs with the compressed sq8/fp16 index types
+FAISS_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "0"))
+# Attribute filters matching at most this many images are scored exactly
+# instead of through the index with a selector (-1 = by index type: never for
+# flat/sq8/fp16, small matches on IVF and HNSW where selector recall drops)
+FAISS_FILTER_EXACT_MAX = int(os.getenv("FAISS_FILTER_EXACT_MAX", "-1"))
+# Sharded scatter-gather search: FAISS_SHARD_DIR holds shard_* directories from
+# scripts/build_shards.py (empty = one index); shards are searched on threads
+# (local) or worker processes (process), each within FAISS_SHARD_TIMEOUT_MS
+# from when the shard starts the query; a shard runs up to SEARCH_WORKERS at once
+FAISS_SHARD_DIR = os.getenv("FAISS_SHARD_DIR", "")
+FAISS_SHARD_MODE = os.getenv("FAISS_SHARD_MODE", "local")
+FAISS_SHARD_TIMEOUT_MS = float(os.getenv("FAISS_SHARD_TIMEOUT_MS", "1000"))
+MAX_NPROBE = 4096
+MAX_EF_SEARCH = 4096
+
+# /search/batch: max queries per request, queries per streamed chunk
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "256"))
+BATCH_STREAM_CHUNK = int(os.getenv("BATCH_STREAM_CHUNK", "16"))
+
+# Image-to-image search uploads larger than this are rejected
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Runtime ingestion: images per add request, pending changes before auto-compaction
+MAX_INGEST_BATCH = int(os.getenv("MAX_INGEST_BATCH", "256"))
+DELTA_COMPACT_THRESHOLD = int(os.getenv("DELTA_COMPACT_THRESHOLD", "5000"))
+
+# Whole-response cache for /search: memory (per process), redis (shared by all
+# workers at RESPONSE_CACHE_URL) or off; keys include the index generation, so
+# reloads and runtime changes never serve stale results (TTL 0 = no expiry)
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+
+# Cursor pagination: a paginated search ranks up to PAGINATION_DEPTH results
+# once and later pages are sliced from it; rankings are kept per process
+PAGINATION_DEPTH = int(os.getenv("PAGINATION_DEPTH", "1000"))
+PAGINATION_MAX_CURSORS = int(os.getenv("PAGINATION_MAX_CURSORS", "1024"))
+PAGINATION_TTL_SECONDS = float(os.getenv("PAGINATION_TTL_SECONDS", "900"))
+
+# Default of collapse_duplicates: keep only the best hit of each near-duplicate
+# group found by scripts/find_duplicates.py (no-op without data/duplicate_groups.npz)
+COLLAPSE_DUPLICATES = os.getenv("COLLAPSE_DUPLICATES", "0") == "1"
+
+# Add the per-stage latency breakdown of /search to SearchResponse.meta
+STAGE_TIMINGS_IN_META = os.getenv("STAGE_TIMINGS_IN_META", "0") == "1"
+
+# Resized variants are rendered into THUMBNAIL_CACHE_DIR (default data/thumbnails);
+# originals under /images get IMAGE_CACHE_CONTROL
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "")
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "85"))
+IMAGE_CACHE_CONTROL = os.getenv("IMAGE_CACHE_CONTROL", "public, max-age=86400")
+
 # =========================
 # PYDANTIC MODELS
 # =========================
 
+class SearchFilters(BaseModel):
+    """Attribute filters applied inside the index scan; all given conditions must hold."""
+    collections: Optional[List[str]] = Field(default=None, min_length=1, max_length=100)
+    orientations: Optional[List[Literal["landscape", "portrait", "square"]]] = Field(default=None, min_length=1)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    min_width: Optional[int] = Field(default=None, ge=1)
+    min_height: Optional[int] = Field(default=None, ge=1)
+    
+    def to_spec(self) -> Optional[Dict[str, Any]]:
+        """Filter spec for the index (see AttributeStore.mask), or None if empty."""
+        def timestamp(value: Optional[datetime]) -> Optional[int]:
+            if value is None:
+                return None
+            # Naive times are taken as UTC
+            return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+        
+        spec: Dict[str, Any] = {}
+        if self.collections:
+            spec["collection"] = sorted(set(self.collections))
+        if self.orientations:
+            spec["orientation"] = sorted(set(self.orientations))
+        if self.uploaded_after or self.uploaded_before:
+            spec["uploaded_at"] = [timestamp(self.uploaded_after), timestamp(self.uploaded_before)]
+        if self.min_width:
+            spec["width"] = [self.min_width, None]
+        if self.min_height:
+            spec["height"] = [self.min_height, None]
+        return spec or None
+
 class SearchRequest(BaseModel):
     """Search request schema with validation."""
     query: str = Field(..., min_length=1, max_length=500)
     top_k: int = Field(default=DEFAULT_TOP_K, ge=1, le=MAX_TOP_K)
     threshold: float = Field(default=DEFAULT_THRESHOLD, ge=0.0, le=1.0)
     use_enhancement: bool = Field(default=True)
+    nprobe: Optional[int] = Field(default=None, ge=1, le=MAX_NPROBE)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=MAX_EF_SEARCH)
+    # paginate=True returns next_cursor; send it back (same query) for the next top_k results
+    paginate: bool = Field(default=False)
+    cursor: Optional[str] = Field(default=None, max_length=64)
+    filters: Optional[SearchFilters] = None
+    collapse_duplicates: bool = Field(default=COLLAPSE_DUPLICATES)
+
+class SimilarSearchRequest(BaseModel):
+    """"More like this" request: an indexed image by id or file name."""
+    image_id: Optional[int] = Field(default=None, ge=0)
+    filename: Optional[str] = Field(default=None, min_length=1, max_length=255)
+    top_k: int = Field(default=DEFAULT_TOP_K, ge=1, le=MAX_TOP_K)
+    threshold: float = Field(default=DEFAULT_THRESHOLD, ge=0.0, le=1.0)
+    nprobe: Optional[int] = Field(default=None, ge=1, le=MAX_NPROBE)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=MAX_EF_SEARCH)
+    filters: Optional[SearchFilters] = None
+    collapse_duplicates: bool = Field(default=COLLAPSE_DUPLICATES)
 
 class SearchResultItem(BaseModel):
     """Individual search result."""
     rank: int
+    image_idx: int
     filename: str
     image_path: str
+    thumbnail_url: str = ""
     similarity_score: float
     confidence_percentage: str
     num_query_matches: int
@@ -61,6 +218,35 @@ class SearchResponse(BaseModel):
     enhanced_queries: List[str]
     results_count: int
     meta: Dict[str, Any]
+    next_cursor: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    """Many searches in one request; stream=True returns NDJSON as chunks finish."""
+    queries: List[SearchRequest] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    stream: bool = Field(default=False)
+
+class BatchSearchItem(BaseModel):
+    """Results for one query of a batch."""
+    index: int
+    query: str
+    results: List[SearchResultItem]
+    enhanced_queries: List[str]
+    results_count: int
+
+class BatchSearchResponse(BaseModel):
+    """Complete batch search response."""
+    items: List[BatchSearchItem]
+    timing_ms: float
+    queries_count: int
+    meta: Dict[str, Any]
+
+class AddImagesRequest(BaseModel):
+    """Images already copied into the images directory, to be indexed."""
+    filenames: List[str] = Field(..., min_length=1, max_length=MAX_INGEST_BATCH)
+
+class DeleteImagesRequest(BaseModel):
+    """Image ids to remove from the index."""
+    image_ids: List[int] = Field(..., min_length=1)
 
 class HealthResponse(BaseModel):
     """System health and status."""
@@ -71,6 +257,16 @@ class HealthResponse(BaseModel):
     embedding_dim: int
     total_images: int
     index_type: str
+    index_params: Dict[str, Any] = {}
+    read_only: bool = False
+    sharding: Dict[str, Any] = {}
+    index_generation: str = ""
+    text_encoder: Optional[str] = None
+    text_cache: Dict[str, Any] = {}
+    encode_batcher: Dict[str, Any] = {}
+    search_executor: Dict[str, Any] = {}
+    response_cache: Dict[str, Any] = {}
+    pagination: Dict[str, Any] = {}
 
 # =========================
 # FASTAPI APP INITIALIZATION
@@ -104,28 +300,107 @@ if IMAGES_DIR.exists():
 else:
     print(f"Warning: Images directory not found at {IMAGES_DIR}")
 
+thumbnail_cache = ThumbnailCache(
+    IMAGES_DIR,
+    Path(THUMBNAIL_CACHE_DIR) if THUMBNAIL_CACHE_DIR else BASE_DIR / "data" / "thumbnails",
+    quality=THUMBNAIL_QUALITY
+)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per route template (not per raw path)."""
+    metrics.request_started()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or ("/images" if request.url.path.startswith("/images/") else "unmatched")
+        metrics.request_finished(route_path, request.method, status, time.perf_counter() - started)
+
+@app.middleware("http")
+async def image_cache_headers(request: Request, call_next):
+    """Add a caching policy to original images served by the static mount."""
+    response = await call_next(request)
+    if request.url.path.startswith("/images/") and response.status_code in (200, 304):
+        response.headers.setdefault("Cache-Control", IMAGE_CACHE_CONTROL)
+    return response
+
 # Global search engine instance
 search_engine: Optional[SearchEngine] = None
+index_reloader: Optional[IndexReloader] = None
+
+# Readiness: "starting" -> "ready" | "failed"
+startup_state: Dict[str, Any] = {"stage": "starting", "error": None, "load_seconds": None}
+
+# Keeps CLIP encoding and FAISS scans off the event loop
+search_executor = BoundedExecutor(max_workers=SEARCH_WORKERS, max_queue_size=SEARCH_QUEUE_SIZE)
+
+# Rankings behind pagination cursors
+result_pager = ResultPager(max_entries=PAGINATION_MAX_CURSORS, ttl_seconds=PAGINATION_TTL_SECONDS)
+
+# Serialized /search responses (None when disabled)
+response_cache = create_response_cache(
+    RESPONSE_CACHE_BACKEND,
+    max_size=RESPONSE_CACHE_SIZE,
+    ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    url=RESPONSE_CACHE_URL
+)
 
 # =========================
 # LIFECYCLE EVENTS
 # =========================
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize search engine on startup."""
-    global search_engine
+def load_search_engine() -> SearchEngine:
+    """Load a search engine using the configured settings."""
+    index_options = {
+        "index_type": FAISS_INDEX_TYPE,
+        "build_params": FAISS_BUILD_PARAMS,
+        "nprobe": FAISS_NPROBE,
+        "ef_search": FAISS_EF_SEARCH,
+        "load_mode": INDEX_LOAD_MODE,
+        "rerank_factor": FAISS_RERANK_FACTOR,
+        "filter_exact_max": FAISS_FILTER_EXACT_MAX if FAISS_FILTER_EXACT_MAX >= 0 else None
+    }
+    if FAISS_SHARD_DIR:
+        index_options.update(
+            shard_dir=FAISS_SHARD_DIR,
+            shard_mode=FAISS_SHARD_MODE,
+            shard_timeout_ms=FAISS_SHARD_TIMEOUT_MS,
+            shard_concurrency=SEARCH_WORKERS
+        )
     
-    print("\n" + "=" * 70)
-    print(f"Starting {API_TITLE} v{API_VERSION}")
-    print("=" * 70)
+    return SearchEngine.load_from_disk(
+        device=DEVICE,
+        warmup=STARTUP_WARMUP,
+        text_cache_size=TEXT_CACHE_SIZE,
+        text_cache_ttl=TEXT_CACHE_TTL_SECONDS,
+        model_cache_path=MODEL_CACHE_PATH or None,
+        text_backend=TEXT_ENCODER_BACKEND,
+        text_backend_path=TEXT_ENCODER_PATH or None,
+        text_stub_dim=TEXT_ENCODER_STUB_DIM,
+        encode_batching=ENCODE_BATCHING,
+        encode_max_batch_size=ENCODE_MAX_BATCH_SIZE,
+        encode_max_wait_us=ENCODE_MAX_WAIT_US,
+        index_options=index_options
+    )
+
+def initialize_search_engine() -> None:
+    """Load the engine and publish it; records the outcome in startup_state."""
+    global search_engine, index_reloader
     
     try:
         start_time = time.time()
-        search_engine = SearchEngine.load_from_disk(device=DEVICE)
+        engine = load_search_engine()
+        index_reloader = IndexReloader(engine)
+        search_engine = engine
         load_time = time.time() - start_time
+        startup_state.update(stage="ready", load_seconds=round(load_time, 2))
         
-        status = search_engine.get_status()
+        status = engine.get_status()
         print(f"\n Search engine loaded successfully in {load_time:.2f}s")
         print(f"   Vectors indexed: {status['vectors_indexed']:,}")
         print(f"   Total images: {status['total_images']:,}")
@@ -134,14 +409,58 @@ async def startup_event():
         print("=" * 70 + "\n")
     
     except Exception as e:
+        startup_state.update(stage="failed", error=str(e))
         print(f"\nFailed to load search engine: {e}\n")
-        raise RuntimeError(f"Startup failed: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize search engine on startup (in the background unless disabled)."""
+    print("\n" + "=" * 70)
+    print(f"Starting {API_TITLE} v{API_VERSION}")
+    print("=" * 70)
+    
+    if BACKGROUND_STARTUP:
+        threading.Thread(target=initialize_search_engine, name="startup-loader", daemon=True).start()
+        return
+    
+    initialize_search_engine()
+    if startup_state["stage"] == "failed":
+        raise RuntimeError(f"Startup failed: {startup_state['error']}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown."""
+    search_executor.shutdown()
+    if search_engine is not None:
+        search_engine.close()
     print("\nShutting down Visual Semantic Search API\n")
 
+def build_meta() -> Dict[str, Any]:
+    """System metadata attached to every search response."""
+    status = search_engine.get_status()
+    return {
+        "device": status.get("device"),
+        "model": status.get("model"),
+        "index_type": status.get("index_type"),
+        "index_params": status.get("index_params"),
+        "index_version": status.get("index_version"),
+        "total_images": status.get("total_images")
+    }
+
+def filter_spec(filters: Optional[SearchFilters]) -> Optional[Dict[str, Any]]:
+    """Index filter spec of a request; 400 if filters are set but no attributes are loaded."""
+    spec = filters.to_spec() if filters is not None else None
+    if spec and not search_engine.index_manager.has_attributes:
+        raise HTTPException(
+            status_code=400,
+            detail="Filters need image attributes; build them with scripts/build_metadata.py --attributes"
+        )
+    return spec
+
+def engine_request(request: SearchRequest) -> Dict[str, Any]:
+    """SearchRequest as the dict SearchEngine.search_batch takes."""
+    return {**request.model_dump(exclude={"filters"}), "filters": filter_spec(request.filters)}
+
 # =========================
 # API ENDPOINTS
 # =========================
@@ -157,6 +476,65 @@ async def root():
         "health": "/health"
     }
 
+@app.get("/health/live", tags=["System"])
+async def liveness():
+    """Liveness probe: the process is up (fails only if startup failed)."""
+    if startup_state["stage"] == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup_state["error"]})
+    return {"status": "alive", "stage": startup_state["stage"]}
+
+@app.get("/health/ready", tags=["System"])
+async def readiness():
+    """Readiness probe: model and index are loaded and warmed up."""
+    if search_engine is None:
+        return JSONResponse(status_code=503, content={"status": "not_ready", **startup_state})
+    return {"status": "ready", **startup_state, "index_version": search_engine.index_version}
+
+def collect_metrics() -> str:
+    """Render /metrics: built-in histograms plus executor, cache and batcher state."""
+    executor = search_executor.get_status()
+    counters = {
+        "search_completed_total": ("Searches finished on the worker pool.", executor["completed"]),
+        "search_rejected_total": ("Searches rejected with 503 because the queue was full.", executor["rejected"])
+    }
+    gauges = {
+        "search_in_flight": ("Searches running or queued on the worker pool.", executor["in_flight"]),
+        "search_queued": ("Searches waiting for a worker.", executor["queued"]),
+        "engine_ready": ("1 once the model and index are loaded.", int(search_engine is not None))
+    }
+    histograms = {}
+    
+    if response_cache is not None:
+        cache = response_cache.get_status()
+        counters["response_cache_hits_total"] = ("Search responses served from the response cache.", cache["hits"])
+        counters["response_cache_misses_total"] = ("Search response cache misses.", cache["misses"])
+        counters["response_cache_errors_total"] = ("Failed response cache backend calls.", cache["errors"])
+    
+    thumbnails = thumbnail_cache.get_status()
+    counters["thumbnails_rendered_total"] = ("Thumbnail variants rendered by this process.", thumbnails["rendered"])
+    
+    engine = search_engine
+    if engine is not None:
+        status = engine.get_status()
+        text_cache = status["text_cache"]
+        counters["text_cache_hits_total"] = ("Query embedding cache hits.", text_cache["hits"])
+        counters["text_cache_misses_total"] = ("Query embedding cache misses.", text_cache["misses"])
+        gauges["text_cache_entries"] = ("Query embeddings in the cache.", text_cache["size"])
+        gauges["text_cache_hit_ratio"] = ("Query embedding cache hit ratio.", text_cache["hit_rate"])
+        gauges["index_vectors"] = ("Vectors searchable in the serving index.", status["vectors_indexed"])
+        gauges["index_version"] = ("Version of the serving index.", status["index_version"])
+        
+        if engine.batcher is not None:
+            gauges["encode_queue_depth"] = ("Texts waiting for an encoding batch.", engine.batcher.get_status()["queue_depth"])
+            histograms["encode_batch_size"] = ("Distinct texts per encoding batch.", engine.batcher.batch_size_hist)
+    
+    return metrics.render(counters=counters, gauges=gauges, histograms=histograms)
+
+@app.get("/metrics", tags=["System"])
+async def metrics_endpoint():
+    """Prometheus metrics: per-stage and per-route latency, counters, cache and queue state."""
+    return Response(content=collect_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health", tags=["System"], response_model=HealthResponse)
 async def health_check():
     """Check system health and get configuration details."""
@@ -175,35 +553,67 @@ async def health_check():
             vectors_indexed=status.get("vectors_indexed", 0),
             embedding_dim=status.get("embedding_dim", 0),
             total_images=status.get("total_images", 0),
-            index_type=status.get("index_type", "unknown")
+            index_type=status.get("index_type", "unknown"),
+            index_params=status.get("index_params", {}),
+            read_only=status.get("read_only", False),
+            sharding=status.get("sharding", {}),
+            index_generation=status.get("index_generation", ""),
+            text_encoder=status.get("text_encoder"),
+            text_cache=status.get("text_cache", {}),
+            encode_batcher=status.get("encode_batcher", {}),
+            search_executor=search_executor.get_status(),
+            response_cache=response_cache.get_status() if response_cache is not None else {"enabled": False},
+            pagination=result_pager.get_status()
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
+async def call_response_cache(method, *args):
+    """Call the response cache; shared backends do network I/O, so off the event loop."""
+    if response_cache.shared:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
 @app.post("/search", tags=["Search"], response_model=SearchResponse)
 async def search_images(request: SearchRequest):
-    """Semantic image search using natural language queries."""
+    """Semantic image search using natural language queries.
+    
+    Responses are cached per request and index generation; a hit returns the
+    stored body (timing_ms included) with X-Cache: HIT. With paginate=True
+    (or a cursor) results come in pages, see search_page().
+    """
     if search_engine is None:
         raise HTTPException(status_code=503, detail="Search engine not initialized")
     
+    if request.paginate or request.cursor:
+        return await search_page(request)
+    
+    cache_key = None
+    if response_cache is not None:
+        generation = search_engine.index_generation
+        cache_key = response_cache.key(generation, request.model_dump(mode="json"))
+        body = await call_response_cache(response_cache.get, cache_key)
+        if body is not None:
+            return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT"})
+    
     try:
         print(f"Search: '{request.query}' (k={request.top_k}, t={request.threshold})")
         
-        # Execute search
-        results, timing_ms = search_engine.search(
+        # Execute search on the worker pool
+        timer = StageTimer()
+        results, timing_ms, missing_shards = await search_executor.run(
+            search_engine.search_with_coverage,
             query=request.query,
             top_k=request.top_k,
             threshold=request.threshold,
-            use_enhancement=request.use_enhancement
+            use_enhancement=request.use_enhancement,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            timer=timer,
+            filters=filter_spec(request.filters),
+            collapse_duplicates=request.collapse_duplicates
         )
-        
-        # Transform image_path for React compatibility
-        # Change absolute paths to relative /images/ URLs
-        for result in results:
-            # Extract just the filename
-            filename = Path(result['image_path']).name
-            # Set to URL path that React can fetch
-            result['image_path'] = f"/images/{filename}"
+        timer.skip()
         
         # Get enhanced queries
         enhanced_queries = search_engine.enhance_query(
@@ -212,24 +622,39 @@ async def search_images(request: SearchRequest):
         )
         
         # Get system metadata
-        status = search_engine.get_status()
-        meta = {
-            "device": status.get("device"),
-            "model": status.get("model"),
-            "index_type": status.get("index_type"),
-            "total_images": status.get("total_images")
-        }
+        meta = build_meta()
+        if STAGE_TIMINGS_IN_META:
+            meta["stages_ms"] = timer.breakdown_ms()
+        if missing_shards:
+            # Results from the shards that answered only
+            meta["degraded"] = True
+            meta["missing_shards"] = missing_shards
         
         print(f"Found {len(results)} results in {timing_ms:.1f}ms")
         
-        return SearchResponse(
+        body = SearchResponse(
             query=request.query,
             results=results,
             timing_ms=timing_ms,
             enhanced_queries=enhanced_queries,
             results_count=len(results),
             meta=meta
-        )
+        ).model_dump_json()
+        timer.mark("serialize")
+        metrics.observe_stage("serialize", timer.stages["serialize"])
+        
+        # Not stored if the index changed while searching (the key names the old one)
+        # or a shard was left out (a later search may get complete results)
+        if cache_key is not None and search_engine.index_generation == generation and not missing_shards:
+            await call_response_cache(response_cache.put, cache_key, body.encode("utf-8"))
+        headers = {"X-Cache": "MISS"} if cache_key is not None else None
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    
+    except HTTPException:
+        raise
     
     except Exception as e:
         print(f"Search failed: {e}")
@@ -238,45 +663,446 @@ async def search_images(request: SearchRequest):
             detail=f"Search operation failed: {str(e)}"
         )
 
+def ranking_params(request: SearchRequest) -> Dict[str, Any]:
+    """Request fields that shape a paginated ranking; a cursor only serves requests that repeat them."""
+    return {
+        "query": request.query,
+        "filters": filter_spec(request.filters),
+        "threshold": request.threshold,
+        "use_enhancement": request.use_enhancement,
+        "collapse_duplicates": request.collapse_duplicates
+    }
+
+async def search_page(request: SearchRequest) -> SearchResponse:
+    """One page of a paginated search.
+    
+    Without a cursor the query is ranked PAGINATION_DEPTH deep on the worker
+    pool and kept; with one, the next top_k results are sliced from the kept
+    ranking (no model pass, no index search). next_cursor is None on the last page.
+    """
+    start_time = time.time()
+    if request.cursor:
+        try:
+            token, offset = result_pager.parse_cursor(request.cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        stored = result_pager.get(token)
+        if stored is None:
+            raise HTTPException(status_code=410, detail="Cursor expired; run the search again")
+        ranked, params = stored
+        mismatched = [name for name, value in ranking_params(request).items() if params.get(name) != value]
+        if mismatched:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cursor belongs to a search with different {', '.join(mismatched)}"
+            )
+    else:
+        try:
+            ranked = await search_executor.run(
+                search_engine.search_ranked,
+                query=request.query,
+                depth=PAGINATION_DEPTH,
+                threshold=request.threshold,
+                use_enhancement=request.use_enhancement,
+                nprobe=request.nprobe,
+                ef_search=request.ef_search,
+                timer=StageTimer(),
+                filters=filter_spec(request.filters),
+                collapse_duplicates=request.collapse_duplicates
+            )
+        except ExecutorSaturatedError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Search failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Search operation failed: {str(e)}")
+        token, offset = result_pager.store(ranked, ranking_params(request)), 0
+    
+    results, next_offset = search_engine.page(ranked, offset, request.top_k)
+    return SearchResponse(
+        query=ranked.query,
+        results=results,
+        timing_ms=(time.time() - start_time) * 1000,
+        enhanced_queries=ranked.enhanced_queries,
+        results_count=len(results),
+        meta={**build_meta(), "ranked_results": len(ranked), "offset": offset},
+        next_cursor=result_pager.cursor(token, next_offset) if next_offset < len(ranked) else None
+    )
+
 @app.get("/search", tags=["Search"], response_model=SearchResponse)
 async def search_images_get(
     query: str = Query(..., min_length=1, max_length=500),
     top_k: int = Query(default=DEFAULT_TOP_K, ge=1, le=MAX_TOP_K),
     threshold: float = Query(default=DEFAULT_THRESHOLD, ge=0.0, le=1.0),
-    use_enhancement: bool = Query(default=True)
+    use_enhancement: bool = Query(default=True),
+    nprobe: Optional[int] = Query(default=None, ge=1, le=MAX_NPROBE),
+    ef_search: Optional[int] = Query(default=None, ge=1, le=MAX_EF_SEARCH),
+    paginate: bool = Query(default=False),
+    cursor: Optional[str] = Query(default=None, max_length=64),
+    collection: Optional[List[str]] = Query(default=None),
+    orientation: Optional[List[Literal["landscape", "portrait", "square"]]] = Query(default=None),
+    uploaded_after: Optional[datetime] = Query(default=None),
+    uploaded_before: Optional[datetime] = Query(default=None),
+    min_width: Optional[int] = Query(default=None, ge=1),
+    min_height: Optional[int] = Query(default=None, ge=1),
+    collapse_duplicates: bool = Query(default=COLLAPSE_DUPLICATES)
 ):
-    """GET version of search endpoint."""
+    """GET version of search endpoint (repeat collection/orientation for several values)."""
+    filters = SearchFilters(
+        collections=collection,
+        orientations=orientation,
+        uploaded_after=uploaded_after,
+        uploaded_before=uploaded_before,
+        min_width=min_width,
+        min_height=min_height
+    )
     request = SearchRequest(
         query=query,
         top_k=top_k,
         threshold=threshold,
-        use_enhancement=use_enhancement
+        use_enhancement=use_enhancement,
+        nprobe=nprobe,
+        ef_search=ef_search,
+        paginate=paginate,
+        cursor=cursor,
+        filters=filters if filters.to_spec() else None,
+        collapse_duplicates=collapse_duplicates
     )
     return await search_images(request)
 
-@app.post("/admin/reload", tags=["Admin"])
+def build_batch_items(
+    queries: List[SearchRequest],
+    outputs: List[Any],
+    start: int = 0
+) -> List[BatchSearchItem]:
+    """Pair SearchEngine.search_batch outputs with their queries."""
+    return [
+        BatchSearchItem(
+            index=start + i,
+            query=request.query,
+            results=results,
+            enhanced_queries=enhanced_queries,
+            results_count=len(results)
+        )
+        for i, (request, (enhanced_queries, results)) in enumerate(zip(queries, outputs))
+    ]
+
+async def stream_batch(queries: List[SearchRequest], engine_requests: List[Dict[str, Any]]):
+    """Yield NDJSON lines, one per query, as each chunk of the batch completes."""
+    for start in range(0, len(queries), BATCH_STREAM_CHUNK):
+        chunk = queries[start:start + BATCH_STREAM_CHUNK]
+        try:
+            outputs, _ = await search_executor.run(
+                search_engine.search_batch, engine_requests[start:start + BATCH_STREAM_CHUNK]
+            )
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band and stop
+            print(f"Batch search failed: {e}")
+            yield json.dumps({"error": str(e), "index": start}) + "\n"
+            return
+        
+        for item in build_batch_items(chunk, outputs, start):
+            yield item.model_dump_json() + "\n"
+
+@app.post("/search/batch", tags=["Search"], response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest):
+    """Run many searches with one encode pass and one multi-row index search."""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    print(f"Batch search: {len(request.queries)} queries (stream={request.stream})")
+    
+    # Validated before streaming starts, while an error status can still be sent
+    engine_requests = [engine_request(query) for query in request.queries]
+    if request.stream:
+        return StreamingResponse(stream_batch(request.queries, engine_requests), media_type="application/x-ndjson")
+    
+    try:
+        outputs, timing_ms = await search_executor.run(search_engine.search_batch, engine_requests)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        print(f"Batch search failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Search operation failed: {str(e)}")
+    
+    print(f"Batch of {len(outputs)} done in {timing_ms:.1f}ms")
+    
+    return BatchSearchResponse(
+        items=build_batch_items(request.queries, outputs),
+        timing_ms=timing_ms,
+        queries_count=len(outputs),
+        meta=build_meta()
+    )
+
+@app.post("/search/similar", tags=["Search"], response_model=SearchResponse)
+async def search_similar(request: SimilarSearchRequest):
+    """Find images similar to an indexed image, using its stored embedding."""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    if (request.image_id is None) == (request.filename is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of image_id or filename")
+    
+    try:
+        results, timing_ms, source = await search_executor.run(
+            search_engine.search_similar,
+            image_id=request.image_id,
+            filename=request.filename,
+            top_k=request.top_k,
+            threshold=request.threshold,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            filters=filter_spec(request.filters),
+            collapse_duplicates=request.collapse_duplicates
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Similar search failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Search operation failed: {str(e)}")
+    
+    print(f"Similar to {source['filename']}: {len(results)} results in {timing_ms:.1f}ms")
+    
+    return SearchResponse(
+        query=f"similar:{source['filename'] or source['image_idx']}",
+        results=results,
+        timing_ms=timing_ms,
+        enhanced_queries=[],
+        results_count=len(results),
+        meta={**build_meta(), "source": source}
+    )
+
+@app.get("/related/{image_id}", tags=["Search"], response_model=SearchResponse)
+async def related_images(
+    image_id: int,
+    top_k: int = Query(default=DEFAULT_TOP_K, ge=1, le=MAX_TOP_K),
+    collapse_duplicates: bool = Query(default=COLLAPSE_DUPLICATES)
+):
+    """Related images of an indexed image from the precomputed neighbour table.
+    
+    A table lookup is answered inline; without a table (scripts/build_neighbors.py)
+    the neighbours are searched on the worker pool instead. meta.neighbors
+    says which ("table" or "search").
+    """
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    try:
+        related = search_engine.related_images(image_id, top_k, collapse_duplicates)
+        neighbors = "table"
+        if related is None:
+            results, timing_ms, _ = await search_executor.run(
+                search_engine.search_similar,
+                image_id=image_id,
+                top_k=top_k,
+                threshold=0.0,
+                collapse_duplicates=collapse_duplicates
+            )
+            related, neighbors = (results, timing_ms), "search"
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        print(f"Related images failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Search operation failed: {str(e)}")
+    
+    results, timing_ms = related
+    return SearchResponse(
+        query=f"related:{image_id}",
+        results=results,
+        timing_ms=timing_ms,
+        enhanced_queries=[],
+        results_count=len(results),
+        meta={**build_meta(), "neighbors": neighbors}
+    )
+
+def decode_upload(data: bytes) -> Image.Image:
+    """Fully decode uploaded image bytes (Pillow rejects decompression bombs)."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+@app.post("/search/image", tags=["Search"], response_model=SearchResponse)
+async def search_by_image(
+    file: UploadFile = File(...),
+    top_k: int = Form(default=DEFAULT_TOP_K, ge=1, le=MAX_TOP_K),
+    threshold: float = Form(default=DEFAULT_THRESHOLD, ge=0.0, le=1.0),
+    nprobe: Optional[int] = Form(default=None, ge=1, le=MAX_NPROBE),
+    ef_search: Optional[int] = Form(default=None, ge=1, le=MAX_EF_SEARCH)
+):
+    """Find images similar to an uploaded image."""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    data = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Uploaded image is too large")
+    
+    # Decoding a large upload is CPU work too, so it stays off the event loop
+    try:
+        image = await search_executor.run(decode_upload, data)
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Uploaded image has too many pixels")
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status_code=400, detail="Uploaded file is not a valid image")
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    
+    try:
+        results, timing_ms = await search_executor.run(
+            search_engine.search_by_image,
+            image,
+            top_k=top_k,
+            threshold=threshold,
+            nprobe=nprobe,
+            ef_search=ef_search
+        )
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        print(f"Image search failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Search operation failed: {str(e)}")
+    
+    print(f"Image search ({file.filename}): {len(results)} results in {timing_ms:.1f}ms")
+    
+    return SearchResponse(
+        query=f"image:{file.filename or 'upload'}",
+        results=results,
+        timing_ms=timing_ms,
+        enhanced_queries=[],
+        results_count=len(results),
+        meta=build_meta()
+    )
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+@app.get(THUMBNAIL_URL_PREFIX + "/{width}/{filename}", tags=["Images"])
+async def get_thumbnail(width: int, filename: str, request: Request):
+    """Serve a resized image variant with a strong ETag for cheap revalidation."""
+    try:
+        variant = await run_in_threadpool(thumbnail_cache.get, filename, width)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except OSError as e:
+        print(f"Thumbnail failed for {filename}: {e}")
+        raise HTTPException(status_code=415, detail="Image could not be decoded")
+    
+    if variant is None:
+        raise HTTPException(status_code=404, detail=f"Image not found: {filename}")
+    
+    path, etag = variant
+    headers = {"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+@app.post("/admin/reload", tags=["Admin"], status_code=202)
 async def reload_index():
-    """Reload the search index and models."""
-    global search_engine
+    """Rebuild the search index in the background and swap it in when validated."""
+    if search_engine is None or index_reloader is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    if not index_reloader.start():
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    
+    return {
+        "status": "accepted",
+        "message": "Index reload started",
+        "status_url": "/admin/reload/status",
+        "reload": index_reloader.get_status()
+    }
+
+@app.get("/admin/reload/status", tags=["Admin"])
+async def reload_status():
+    """Report progress of the last reload and the serving index version."""
+    if index_reloader is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    return index_reloader.get_status()
+
+@app.post("/admin/compact", tags=["Admin"], status_code=202)
+async def compact_index():
+    """Fold pending additions/deletions into a new base index in the background."""
+    if search_engine is None or index_reloader is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    if search_engine.index_manager.read_only:
+        raise HTTPException(status_code=409, detail="Compaction is not supported with a sharded index; rebuild the shards")
+    
+    if not index_reloader.start(compact=True):
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    
+    return {"status": "accepted", "status_url": "/admin/reload/status"}
+
+def maybe_compact() -> bool:
+    """Start a background compaction once enough changes are pending."""
+    pending = search_engine.index_manager.delta_size()
+    return pending >= DELTA_COMPACT_THRESHOLD and index_reloader.start(compact=True)
+
+@app.post("/admin/images", tags=["Admin"])
+async def add_images(request: AddImagesRequest):
+    """Encode images from the images directory and add them to the live index."""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    paths = []
+    for filename in request.filenames:
+        path = IMAGES_DIR / filename
+        if Path(filename).name != filename or not path.is_file():
+            raise HTTPException(status_code=404, detail=f"Image not found: {filename}")
+        paths.append(str(path))
     
     try:
-        print("\nReloading search engine...")
-        start_time = time.time()
-        
-        search_engine = SearchEngine.load_from_disk(device=DEVICE)
-        
-        load_time = time.time() - start_time
-        print(f"Reload complete in {load_time:.2f}s\n")
-        
-        return {
-            "status": "success",
-            "message": "Search engine reloaded successfully",
-            "load_time_seconds": round(load_time, 2)
-        }
+        image_ids = await search_executor.run(search_engine.add_images, paths)
+    except ReadOnlyIndexError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        print(f"Add images failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Add images failed: {str(e)}")
+    
+    return {
+        "status": "success",
+        "image_ids": image_ids,
+        "index_version": search_engine.index_version,
+        "compaction_started": maybe_compact()
+    }
+
+@app.post("/admin/images/delete", tags=["Admin"])
+async def delete_images(request: DeleteImagesRequest):
+    """Remove images from the live index by id."""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
     
+    try:
+        deleted = await search_executor.run(search_engine.delete_images, request.image_ids)
+    except ReadOnlyIndexError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Reload failed: {e}\n")
-        raise HTTPException(status_code=500, detail=f"Reload failed: {str(e)}")
+        print(f"Delete images failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Delete images failed: {str(e)}")
+    
+    return {
+        "status": "success",
+        "deleted_ids": deleted,
+        "not_found_ids": sorted(set(request.image_ids) - set(deleted)),
+        "index_version": search_engine.index_version,
+        "compaction_started": maybe_compact()
+    }
 
 # =========================
 # ERROR HANDLERS
@@ -284,14 +1110,20 @@ async def reload_index():
 
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    """Custom 404 handler."""
+    """Custom 404 handler; the detail of 404s raised by matched routes is kept."""
+    # The router only records an endpoint once a route or mount matched the path
+    if "endpoint" in request.scope:
+        detail = getattr(exc, "detail", "Not Found")
+    else:
+        detail = f"Endpoint {request.url.path} not found"
     return JSONResponse(
         status_code=404,
         content={
             "error": "Not Found",
-            "detail": f"Endpoint {request.url.path} not found",
+            "detail": detail,
             "timestamp": time.time()
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(500)
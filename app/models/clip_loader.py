@@ -1,23 +1,54 @@
+import os
+import time
 import torch
 import clip
-from typing import Tuple
+from pathlib import Path
+from PIL import Image, ImageEnhance
+from typing import Callable, Dict, List, Optional, Tuple
+from app.models.text_encoders import TextEncoder, create_text_encoder
+from app.services.cache import LRUCache
+from app.services.metrics import metrics
 
 class CLIPModelLoader:
     """Manages CLIP model loading and text encoding."""
     
-    def __init__(self, model_name: str = "ViT-B/32", device: str = "cuda"):
+    def __init__(
+        self,
+        model_name: str = "ViT-B/32",
+        device: str = "cuda",
+        text_cache_size: int = 2048,
+        text_cache_ttl: Optional[float] = None,
+        model_cache_path: Optional[str] = None,
+        text_backend: str = "torch",
+        text_backend_path: Optional[str] = None,
+        text_stub_dim: int = 512
+    ):
         self.model_name = model_name
+        self.model_cache_path = model_cache_path
+        self.text_backend = text_backend
+        self.text_backend_path = text_backend_path
+        self.text_stub_dim = text_stub_dim
+        self.text_encoder: Optional[TextEncoder] = None
         self.device = device if torch.cuda.is_available() else "cpu"
         self.model = None
         self.preprocess = None
+        self.text_cache = LRUCache(max_size=text_cache_size, ttl_seconds=text_cache_ttl)
         print(f"Initializing CLIP on {self.device}")
         
     def load(self) -> Tuple[torch.nn.Module, object]:
-        """Load CLIP model and preprocessing."""
+        """Load CLIP model and preprocessing (the stub text backend needs neither)."""
+        if self.text_backend == "stub":
+            if self.text_encoder is None:
+                self._create_text_encoder()
+            return self.model, self.preprocess
+        
         if self.model is None:
-            print(f"Loading {self.model_name}...")
-            self.model, self.preprocess = clip.load(self.model_name, device=self.device)
+            if not self._load_cached():
+                print(f"Loading {self.model_name}...")
+                self.model, self.preprocess = clip.load(self.model_name, device=self.device)
+                self._save_cached()
             self.model.eval()
+            self._create_text_encoder()
             
             if self.device == "cuda":
                 torch.cuda.empty_cache()
@@ -26,14 +57,150 @@ class CLIPModelLoader:
         
         return self.model, self.preprocess
     
+    def _create_text_encoder(self) -> None:
+        """Set up the configured text backend, falling back to eager PyTorch if it is unavailable."""
+        try:
+            self.text_encoder = create_text_encoder(
+                self.text_backend, self.model, self.device, self.text_backend_path,
+                stub_dim=self.text_stub_dim
+            )
+        except (ImportError, OSError, RuntimeError) as e:
+            print(f"Text encoder backend '{self.text_backend}' unavailable ({e}), using torch")
+            self.text_encoder = create_text_encoder("torch", self.model, self.device)
+        print(f"Text encoder backend: {self.text_encoder.backend}")
+    
+    def _model_dtype(self) -> torch.dtype:
+        """Weight precision clip.load gives on this device (fp16 on CUDA, fp32 on CPU)."""
+        return torch.float16 if self.device == "cuda" else torch.float32
+    
+    def _load_cached(self) -> bool:
+        """Load the serialized (model, preprocess) pair, skipping clip.load's JIT/download path.
+        
+        A cache written on another device is converted to fp32 on CPU (fp16
+        weights are slow or unsupported there) and ignored on CUDA.
+        """
+        path = self.model_cache_path
+        if not path or not Path(path).exists():
+            return False
+        
+        try:
+            checkpoint = torch.load(path, map_location=self.device, weights_only=False)
+            if checkpoint.get("model_name") != self.model_name:
+                print(f"Model cache {path} holds {checkpoint.get('model_name')}, ignoring it")
+                return False
+            
+            model = checkpoint["model"]
+            dtype = next(model.parameters()).dtype
+            if dtype != self._model_dtype():
+                if self.device != "cpu":
+                    print(f"Model cache {path} was saved on {checkpoint.get('device', 'unknown')} ({dtype}), ignoring it")
+                    return False
+                model = model.float()
+                print(f"Model cache {path} was saved on {checkpoint.get('device', 'unknown')} ({dtype}), converted to float32")
+            self.model, self.preprocess = model, checkpoint["preprocess"]
+        except Exception as e:
+            print(f"Could not load model cache {path}: {e}")
+            return False
+        
+        print(f"Loaded {self.model_name} from model cache {path}")
+        return True
+    
+    def _save_cached(self) -> None:
+        """Serialize the loaded model for the next cold start (best effort)."""
+        path = self.model_cache_path
+        if not path:
+            return
+        
+        tmp_path = f"{path}.tmp"
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            checkpoint = {
+                "model_name": self.model_name,
+                "device": self.device,
+                "dtype": str(next(self.model.parameters()).dtype),
+                "model": self.model,
+                "preprocess": self.preprocess
+            }
+            torch.save(checkpoint, tmp_path)
+            os.replace(tmp_path, path)
+            print(f"Saved model cache to {path}")
+        except Exception as e:
+            print(f"Could not save model cache {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize text the way the CLIP tokenizer sees it (case and whitespace)."""
+        return " ".join(text.split()).lower()
+    
     def encode_text(self, text: str) -> torch.Tensor:
-        """Encode text to normalized embedding."""
+        """Encode text to normalized embedding, using the LRU cache when possible."""
+        return self.encode_texts([text])
+    
+    def encode_texts(
+        self,
+        texts: List[str],
+        batch_encoder: Optional[Callable[[List[str]], torch.Tensor]] = None
+    ) -> torch.Tensor:
+        """Encode several texts in one batched forward pass, returning an (n, d) tensor.
+        
+        Cache misses go to batch_encoder when given (e.g. a shared micro-batcher),
+        otherwise straight to forward_texts.
+        """
+        cache_keys = [(self.model_name, self.normalize_text(text)) for text in texts]
+        rows: List[Optional[torch.Tensor]] = [self.text_cache.get(key) for key in cache_keys]
+        
+        # Encode each distinct uncached text once
+        pending: Dict[Tuple[str, str], List[int]] = {}
+        for i, (key, row) in enumerate(zip(cache_keys, rows)):
+            if row is None:
+                pending.setdefault(key, []).append(i)
+        
+        if pending:
+            batch_texts = [texts[positions[0]] for positions in pending.values()]
+            features = (batch_encoder or self.forward_texts)(batch_texts)
+            
+            for j, (key, positions) in enumerate(pending.items()):
+                # A copy, so the cache entry does not keep the whole batch tensor alive
+                row = features[j:j + 1].clone()
+                self.text_cache.put(key, row)
+                for i in positions:
+                    rows[i] = row
+        
+        return torch.cat(rows, dim=0)
+    
+    def forward_texts(self, texts: List[str]) -> torch.Tensor:
+        """Run the text tower on texts without consulting the cache."""
+        if self.text_encoder is None:
+            self.load()
+        
+        started = time.perf_counter()
+        tokens = clip.tokenize(texts, truncate=True)
+        tokenized = time.perf_counter()
+        features = self.text_encoder.encode(tokens)
+        if self.device == "cuda":
+            # Kernels run asynchronously; wait so the forward pass is not billed to the copy
+            torch.cuda.synchronize()
+        
+        metrics.observe_stage("tokenize", tokenized - started)
+        metrics.observe_stage("text_forward", time.perf_counter() - tokenized)
+        return features
+    
+    @staticmethod
+    def enhance_image(image: Image.Image) -> Image.Image:
+        """Apply the contrast/sharpness boost used when the corpus was embedded."""
+        image = ImageEnhance.Contrast(image).enhance(1.15)
+        return ImageEnhance.Sharpness(image).enhance(1.1)
+    
+    def encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """Encode RGB images to normalized embeddings, returning an (n, d) tensor."""
         if self.model is None:
             self.load()
         
+        batch = torch.stack([self.preprocess(self.enhance_image(image)) for image in images])
         with torch.no_grad():
-            tokens = clip.tokenize([text], truncate=True).to(self.device)
-            features = self.model.encode_text(tokens)
+            features = self.model.encode_image(batch.to(self.device))
             features = features / features.norm(dim=-1, keepdim=True)
         
         return features
@@ -0,0 +1,172 @@
+import copy
+import inspect
+import zlib
+import numpy as np
+import torch
+from pathlib import Path
+from typing import Optional
+
+# torch: eager PyTorch text tower (reference)
+# int8: dynamically quantized Linear layers, built from the loaded model at startup
+# torchscript: frozen TorchScript graph exported by scripts/export_text_encoder.py
+# onnx: ONNX Runtime session over an exported graph (needs onnxruntime)
+# stub: deterministic pseudo-embeddings without a model (benchmarks and tests)
+TEXT_BACKENDS = ("torch", "int8", "torchscript", "onnx", "stub")
+
+class TextTower(torch.nn.Module):
+    """CLIP's text encoder as a standalone module: token ids -> unnormalized features."""
+    
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.token_embedding = model.token_embedding
+        self.positional_embedding = model.positional_embedding
+        self.transformer = model.transformer
+        self.ln_final = model.ln_final
+        self.text_projection = model.text_projection
+    
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        x = self.token_embedding(tokens) + self.positional_embedding
+        x = x.permute(1, 0, 2)
+        x = self.transformer(x)
+        x = x.permute(1, 0, 2)
+        x = self.ln_final(x)
+        # Features of the end-of-text token (the highest id in each sequence)
+        return x[torch.arange(x.shape[0]), tokens.argmax(dim=-1)] @ self.text_projection
+
+class TextEncoder:
+    """Encodes CLIP token ids to normalized text embeddings."""
+    
+    backend = "torch"
+    
+    def __init__(self, model: torch.nn.Module, device: str = "cpu"):
+        self.model = model
+        self.device = device
+    
+    def encode(self, tokens: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            features = self.forward(tokens)
+        return features / features.norm(dim=-1, keepdim=True)
+    
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        return self.model.encode_text(tokens.to(self.device))
+
+class QuantizedTextEncoder(TextEncoder):
+    """Text tower with int8 dynamically quantized Linear layers (CPU only)."""
+    
+    backend = "int8"
+    
+    def __init__(self, model: torch.nn.Module):
+        tower = copy.deepcopy(TextTower(model)).float().cpu().eval()
+        super().__init__(torch.ao.quantization.quantize_dynamic(tower, {torch.nn.Linear}, dtype=torch.qint8))
+    
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        return self.model(tokens.cpu())
+
+class TorchScriptTextEncoder(TextEncoder):
+    """Frozen TorchScript text tower loaded from disk (CPU only)."""
+    
+    backend = "torchscript"
+    
+    def __init__(self, path: str):
+        super().__init__(torch.jit.load(path, map_location="cpu").eval())
+    
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        return self.model(tokens.cpu())
+
+class OnnxTextEncoder(TextEncoder):
+    """ONNX Runtime session over an exported text tower (CPU only)."""
+    
+    backend = "onnx"
+    
+    def __init__(self, path: str, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx text encoder backend needs onnxruntime (pip install onnxruntime)")
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        super().__init__(ort.InferenceSession(path, options, providers=["CPUExecutionProvider"]))
+        self.input_name = self.model.get_inputs()[0].name
+    
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        tokens = tokens.cpu().numpy().astype(np.int64)
+        return torch.from_numpy(self.model.run(None, {self.input_name: tokens})[0])
+
+class StubTextEncoder(TextEncoder):
+    """Deterministic random unit vectors seeded by the token ids; no CLIP weights needed.
+    
+    The same text always maps to the same vector, so caching, batching and
+    index search behave as with a real model at a fraction of the cost.
+    """
+    
+    backend = "stub"
+    
+    def __init__(self, dim: int = 512):
+        super().__init__(None)
+        self.dim = dim
+    
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        rows = tokens.cpu().numpy().astype(np.int64)
+        features = np.stack([
+            np.random.default_rng(zlib.crc32(row.tobytes())).standard_normal(self.dim)
+            for row in rows
+        ]).astype(np.float32)
+        return torch.from_numpy(features)
+
+def create_text_encoder(
+    backend: str,
+    model: torch.nn.Module,
+    device: str = "cpu",
+    path: Optional[str] = None,
+    stub_dim: int = 512
+) -> TextEncoder:
+    """Create the text encoder for a backend; exported backends need their file at path.
+    
+    The stub backend ignores path and returns stub_dim-dimensional vectors.
+    """
+    if backend not in TEXT_BACKENDS:
+        raise ValueError(f"Unknown text encoder backend '{backend}', expected one of {TEXT_BACKENDS}")
+    
+    if backend == "torch":
+        return TextEncoder(model, device)
+    if backend == "int8":
+        return QuantizedTextEncoder(model)
+    if backend == "stub":
+        return StubTextEncoder(stub_dim)
+    
+    if not path or not Path(path).exists():
+        raise FileNotFoundError(
+            f"No exported {backend} text encoder at {path}; run scripts/export_text_encoder.py"
+        )
+    if backend == "torchscript":
+        return TorchScriptTextEncoder(path)
+    return OnnxTextEncoder(path)
+
+def export_text_encoder(model: torch.nn.Module, backend: str, path: str, context_length: int = 77) -> None:
+    """Export the float32 text tower of a CLIP model as TorchScript or ONNX."""
+    tower = copy.deepcopy(TextTower(model)).float().cpu().eval()
+    example = torch.zeros((2, context_length), dtype=torch.long)
+    example[:, 0], example[:, 1] = 49406, 49407  # start/end-of-text tokens
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    
+    if backend == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(tower, example))
+        traced.save(path)
+    elif backend == "onnx":
+        # Newer torch defaults to the dynamo exporter; the tracing exporter needs no extra packages
+        legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(
+                tower, (example,), path,
+                input_names=["tokens"],
+                output_names=["features"],
+                dynamic_axes={"tokens": {0: "batch"}, "features": {0: "batch"}},
+                opset_version=17,
+                **legacy
+            )
+    else:
+        raise ValueError(f"Backend '{backend}' is not exported to a file")
@@ -0,0 +1,133 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+# Typed per-image attributes: categories match a list of values, numbers a [lo, hi] range
+CATEGORY_ATTRIBUTES = ("collection", "orientation")
+NUMBER_ATTRIBUTES = ("uploaded_at", "width", "height")
+ORIENTATIONS = ("landscape", "portrait", "square")
+
+def orientation_of(width: int, height: int) -> str:
+    """Orientation name of an image size."""
+    if width > height:
+        return "landscape"
+    return "portrait" if height > width else "square"
+
+def filter_key(filters: Optional[Dict[str, Any]]) -> str:
+    """Canonical string of a filter spec, for grouping and caching ("" = no filter)."""
+    return json.dumps(filters, sort_keys=True) if filters else ""
+
+class AttributeStore:
+    """Columnar attributes of every image id, with range indexes for numbers.
+    
+    Categories are stored as small integer codes plus a name table, numbers
+    as int64 columns with a precomputed sort order, so a range selects its
+    ids with two binary searches. Ids without attributes (missing files,
+    images added at runtime) have present=False and never match a filter.
+    
+    mask() turns a filter spec such as
+    
+        {"collection": ["nature"], "orientation": ["landscape"], "uploaded_at": [1704067200, None]}
+    
+    into a boolean eligibility array by image id; all conditions must hold.
+    """
+    
+    def __init__(
+        self,
+        present: np.ndarray,
+        codes: Dict[str, np.ndarray],
+        names: Dict[str, List[str]],
+        numbers: Dict[str, np.ndarray]
+    ):
+        self.present = np.asarray(present, dtype=bool)
+        self.codes = codes
+        self.names = names
+        self.numbers = numbers
+        self._code_of = {attr: {name: code for code, name in enumerate(table)} for attr, table in names.items()}
+        self._orders = {attr: np.argsort(values, kind="stable") for attr, values in numbers.items()}
+    
+    @classmethod
+    def from_records(cls, records: Sequence[Optional[Dict[str, Any]]]) -> "AttributeStore":
+        """Build a store from one attribute dict (or None) per image id."""
+        present = np.array([record is not None for record in records], dtype=bool)
+        codes, names = {}, {}
+        for attr in CATEGORY_ATTRIBUTES:
+            values = [str(record.get(attr) or "") if record else "" for record in records]
+            # Code 0 is the empty value of images without attributes
+            table = [""] + sorted(set(values) - {""})
+            code_of = {name: code for code, name in enumerate(table)}
+            dtype = np.uint8 if len(table) <= 256 else np.uint16 if len(table) <= 65536 else np.uint32
+            codes[attr] = np.array([code_of[value] for value in values], dtype=dtype)
+            names[attr] = table
+        
+        numbers = {
+            attr: np.array([int(record.get(attr) or 0) if record else 0 for record in records], dtype=np.int64)
+            for attr in NUMBER_ATTRIBUTES
+        }
+        return cls(present, codes, names, numbers)
+    
+    @classmethod
+    def load(cls, path: str) -> "AttributeStore":
+        """Read a store written by save()."""
+        with np.load(path, allow_pickle=False) as data:
+            names = json.loads(str(data["names"]))
+            return cls(
+                data["present"],
+                {attr: data[f"codes_{attr}"] for attr in CATEGORY_ATTRIBUTES},
+                names,
+                {attr: data[f"number_{attr}"] for attr in NUMBER_ATTRIBUTES}
+            )
+    
+    def save(self, path: str) -> None:
+        """Write the columns to a single .npz file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                present=self.present,
+                names=np.array(json.dumps(self.names)),
+                **{f"codes_{attr}": self.codes[attr] for attr in CATEGORY_ATTRIBUTES},
+                **{f"number_{attr}": self.numbers[attr] for attr in NUMBER_ATTRIBUTES}
+            )
+    
+    def __len__(self) -> int:
+        return len(self.present)
+    
+    def get(self, idx: int) -> Optional[Dict[str, Any]]:
+        """Attributes of an image id, or None if it has none."""
+        if not 0 <= idx < len(self) or not self.present[idx]:
+            return None
+        attributes = {attr: self.names[attr][int(self.codes[attr][idx])] for attr in CATEGORY_ATTRIBUTES}
+        attributes.update({attr: int(self.numbers[attr][idx]) for attr in NUMBER_ATTRIBUTES})
+        return attributes
+    
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Boolean array by image id: True where every condition of filters holds.
+        
+        Raises ValueError for unknown attributes; unknown category values
+        simply match nothing.
+        """
+        eligible = self.present.copy()
+        for attr, condition in filters.items():
+            if attr in CATEGORY_ATTRIBUTES:
+                wanted = [self._code_of[attr][value] for value in condition if value in self._code_of[attr]]
+                eligible &= np.isin(self.codes[attr], wanted)
+            elif attr in NUMBER_ATTRIBUTES:
+                lo, hi = condition
+                values, order = self.numbers[attr], self._orders[attr]
+                start = np.searchsorted(values, lo, side="left", sorter=order) if lo is not None else 0
+                end = np.searchsorted(values, hi, side="right", sorter=order) if hi is not None else len(values)
+                in_range = np.zeros(len(values), dtype=bool)
+                in_range[order[start:end]] = True
+                eligible &= in_range
+            else:
+                raise ValueError(f"Unknown attribute '{attr}'")
+        return eligible
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get image count and category sizes."""
+        return {
+            "images": int(self.present.sum()),
+            "collections": len(self.names["collection"]) - 1
+        }
@@ -0,0 +1,164 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+from app.services.metrics import Histogram
+
+class _PendingText:
+    """A text waiting to be encoded, with the future its caller waits on."""
+    
+    __slots__ = ("text", "caller", "future", "enqueued_at")
+    
+    def __init__(self, text: str, caller: int):
+        self.text = text
+        self.caller = caller
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class EncodingBatcher:
+    """Dynamic micro-batching of text encoding across concurrent requests.
+    
+    Callers submit texts and block on their rows. A single worker thread drains
+    the queue and runs one forward pass per batch, flushing when the batch is
+    full, when the oldest text has waited max_wait_us, or as soon as every
+    active caller has its texts in the batch (so a lone request never waits).
+    """
+    
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], torch.Tensor],
+        max_batch_size: int = 32,
+        max_wait_us: int = 2000
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_us = max(0, int(max_wait_us))
+        self._queue: "queue.Queue[_PendingText]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._active_callers = 0
+        self._next_caller = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.batch_size_hist = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_us_hist = Histogram([50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000])
+    
+    def start(self) -> None:
+        """Start the worker thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="encoding-batcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """Stop the worker thread after the current batch and fail texts still queued."""
+        with self._lock:
+            self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        
+        # Nothing is enqueued once _running is False, so this empties the queue for good
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Encoding batcher stopped"))
+    
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> torch.Tensor:
+        """Encode texts through the shared batches, returning an (n, d) tensor."""
+        with self._lock:
+            running = self._running
+            if running:
+                caller = self._next_caller
+                self._next_caller += 1
+                self._active_callers += 1
+                # Enqueued under the lock, so stop() either sees these texts or rejects them
+                pending = [_PendingText(text, caller) for text in texts]
+                for item in pending:
+                    self._queue.put(item)
+        if not running:
+            return self.encode_fn(texts)
+        
+        try:
+            return torch.cat([item.future.result(timeout=timeout) for item in pending], dim=0)
+        finally:
+            with self._lock:
+                self._active_callers -= 1
+    
+    def _collect(self) -> List[_PendingText]:
+        """Block for the first pending text, then gather a batch around it."""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        
+        batch = [first]
+        callers = {first.caller}
+        deadline = first.enqueued_at + self.max_wait_us / 1e6
+        
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                callers.add(batch[-1].caller)
+                continue
+            except queue.Empty:
+                pass
+            
+            # Nobody else is about to submit: flush instead of idling until the deadline
+            with self._lock:
+                if len(callers) >= self._active_callers:
+                    break
+            
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.0002)))
+                callers.add(batch[-1].caller)
+            except queue.Empty:
+                continue
+        
+        return batch
+    
+    def _run(self) -> None:
+        """Worker loop: collect a batch, encode distinct texts once, fan rows out."""
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+            
+            started = time.perf_counter()
+            for item in batch:
+                self.queue_wait_us_hist.observe((started - item.enqueued_at) * 1e6)
+            
+            unique_texts = list(dict.fromkeys(item.text for item in batch))
+            self.batch_size_hist.observe(len(unique_texts))
+            
+            try:
+                features = self.encode_fn(unique_texts)
+                # Copies, so a row kept by a caller (or its cache) does not pin the whole batch
+                rows = {text: features[i:i + 1].clone() for i, text in enumerate(unique_texts)}
+                for item in batch:
+                    item.future.set_result(rows[item.text])
+            except Exception as e:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get batching configuration and histograms."""
+        return {
+            "enabled": self._running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_us": self.max_wait_us,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_size_hist.get_status(),
+            "queue_wait_us": self.queue_wait_us_hist.get_status()
+        }
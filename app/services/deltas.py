@@ -0,0 +1,202 @@
+import os
+import threading
+import numpy as np
+import faiss
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers threads of one process
+    fcntl = None
+
+class DeltaState:
+    """Immutable snapshot of changes made on top of the base index.
+    
+    Added images live in a small exact ID-mapped index next to their raw vectors
+    and file names; deleted base images are tombstones excluded from base scans
+    through an ID selector. Every mutation builds a new snapshot, so searches
+    that already hold one are never affected.
+    """
+    
+    def __init__(
+        self,
+        dim: int,
+        ids: Optional[np.ndarray] = None,
+        vectors: Optional[np.ndarray] = None,
+        filenames: Optional[List[str]] = None,
+        tombstones: Optional[np.ndarray] = None
+    ):
+        self.dim = dim
+        self.ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self.vectors = vectors if vectors is not None else np.empty((0, dim), dtype=np.float32)
+        self.filenames = filenames or []
+        self.tombstones = tombstones if tombstones is not None else np.empty(0, dtype=np.int64)
+        self._positions = {int(image_id): i for i, image_id in enumerate(self.ids)}
+        self._deleted = set(int(image_id) for image_id in self.tombstones)
+        self._index = None
+        
+        # Set by the index manager when the snapshot is published
+        self.base_selector: Optional[faiss.IDSelector] = None
+        self.selector_refs: List[faiss.IDSelector] = []
+    
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        """Exact index over the added vectors, built on first use."""
+        if self._index is None and len(self.ids):
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+            index.add_with_ids(np.ascontiguousarray(self.vectors, dtype=np.float32), self.ids)
+            self._index = index
+        return self._index
+    
+    @property
+    def empty(self) -> bool:
+        return not len(self.ids) and not len(self.tombstones)
+    
+    def __contains__(self, image_id: int) -> bool:
+        return int(image_id) in self._positions
+    
+    def is_deleted(self, image_id: int) -> bool:
+        return int(image_id) in self._deleted
+    
+    def filename(self, image_id: int) -> Optional[str]:
+        pos = self._positions.get(int(image_id))
+        return self.filenames[pos] if pos is not None else None
+    
+    def find(self, filename: str) -> Optional[int]:
+        """Id of an added image by file name, or None."""
+        for image_id, name in zip(self.ids, self.filenames):
+            if name == filename:
+                return int(image_id)
+        return None
+    
+    def vector(self, image_id: int) -> Optional[np.ndarray]:
+        pos = self._positions.get(int(image_id))
+        return self.vectors[pos] if pos is not None else None
+    
+    def with_added(self, ids: np.ndarray, vectors: np.ndarray, filenames: List[str]) -> "DeltaState":
+        """Return a new snapshot including the added images."""
+        return DeltaState(
+            self.dim,
+            np.concatenate([self.ids, ids]),
+            np.concatenate([self.vectors, vectors]),
+            self.filenames + list(filenames),
+            self.tombstones
+        )
+    
+    def with_deleted(self, ids: np.ndarray) -> "DeltaState":
+        """Return a new snapshot without the given ids (added ones dropped, base ones tombstoned)."""
+        in_delta = np.isin(self.ids, ids)
+        keep = ~in_delta
+        base_ids = np.setdiff1d(ids, self.ids)
+        return DeltaState(
+            self.dim,
+            self.ids[keep],
+            self.vectors[keep],
+            [f for f, k in zip(self.filenames, keep) if k],
+            np.union1d(self.tombstones, base_ids).astype(np.int64)
+        )
+
+class DeltaLog:
+    """Append-only on-disk log of add/delete operations, one .npz file per operation.
+    
+    Workers sharing the directory append under a file lock, and the next
+    unissued image id is kept next to the log (it survives compaction), so
+    ids of images added and deleted again are never handed out twice.
+    """
+    
+    def __init__(self, directory: str = "data/index_deltas"):
+        self.directory = Path(directory)
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+    
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the log's cross-process lock (re-entrant within this process)."""
+        with self._thread_lock:
+            if not self._lock_depth:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._lock_file = open(self.directory / ".lock", "a")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth:
+                    # Closing the file releases the lock
+                    self._lock_file.close()
+                    self._lock_file = None
+    
+    def next_id(self) -> int:
+        """First image id never issued through this log (0 if none was)."""
+        path = self.directory / "next_id"
+        return int(path.read_text()) if path.exists() else 0
+    
+    def reserve_ids(self, count: int, floor: int) -> np.ndarray:
+        """Durably claim count new image ids, all >= floor."""
+        with self.locked():
+            start = max(self.next_id(), floor)
+            path = self.directory / "next_id"
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(str(start + count))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return np.arange(start, start + count, dtype=np.int64)
+    
+    def files(self) -> List[Path]:
+        """Logged operation files in replay order."""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.npz"))
+    
+    def _next_path(self, op: str) -> Path:
+        files = self.files()
+        seq = int(files[-1].name.split("_")[0]) + 1 if files else 1
+        return self.directory / f"{seq:08d}_{op}.npz"
+    
+    def append(
+        self,
+        op: str,
+        ids: np.ndarray,
+        vectors: Optional[np.ndarray] = None,
+        filenames: Optional[Iterable[str]] = None
+    ) -> Path:
+        """Durably record one operation before it is applied in memory."""
+        # The sequence number is only unique while the file is created under the lock
+        with self.locked():
+            path = self._next_path(op)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.asarray(ids, dtype=np.int64),
+                    vectors=np.asarray(vectors if vectors is not None else np.empty((0, 0)), dtype=np.float32),
+                    filenames=np.asarray(list(filenames or []), dtype=str)
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return path
+    
+    def replay(self, dim: int, files: Optional[List[Path]] = None) -> DeltaState:
+        """Rebuild the delta snapshot from logged operations."""
+        state = DeltaState(dim)
+        for path in files if files is not None else self.files():
+            op = path.stem.split("_", 1)[1]
+            with np.load(path) as data:
+                if op == "add":
+                    state = state.with_added(data["ids"], data["vectors"], list(data["filenames"]))
+                elif op == "delete":
+                    state = state.with_deleted(data["ids"])
+        return state
+    
+    def remove(self, files: List[Path]) -> None:
+        """Drop operation files that have been compacted into the base index."""
+        for path in files:
+            path.unlink(missing_ok=True)
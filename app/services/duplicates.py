@@ -0,0 +1,98 @@
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List
+
+def connected_components(num_nodes: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Component label (smallest member) of every node of an undirected edge list.
+
+    Vectorized min-label propagation with pointer jumping; converges in a
+    handful of passes for the small, dense clusters duplicates form.
+    """
+    labels = np.arange(num_nodes, dtype=np.int64)
+    while True:
+        lowest = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, lowest)
+        np.minimum.at(updated, b, lowest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+class DuplicateGroups:
+    """Near-duplicate clusters by image id, written by scripts/find_duplicates.py.
+    
+    group_of[id] is the cluster of an image (-1 for images without
+    duplicates); the members of cluster g are members[offsets[g]:offsets[g + 1]].
+    """
+    
+    def __init__(self, group_of: np.ndarray, offsets: np.ndarray, members: np.ndarray, threshold: float):
+        self.group_of = group_of
+        self.offsets = offsets
+        self.members = members
+        self.threshold = threshold
+    
+    @classmethod
+    def from_pairs(cls, num_ids: int, a: np.ndarray, b: np.ndarray, threshold: float) -> "DuplicateGroups":
+        """Cluster image ids linked by duplicate pairs (a[i], b[i])."""
+        labels = connected_components(num_ids, a, b)
+        linked = np.zeros(num_ids, dtype=bool)
+        linked[a] = linked[b] = True
+        
+        roots, group_of = np.unique(labels[linked], return_inverse=True)
+        members = np.flatnonzero(linked)
+        order = np.argsort(group_of, kind="stable")
+        
+        groups = np.full(num_ids, -1, dtype=np.int32)
+        groups[members] = group_of
+        offsets = np.zeros(len(roots) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(group_of, minlength=len(roots)))
+        return cls(groups, offsets, members[order].astype(np.int64), threshold)
+    
+    @classmethod
+    def load(cls, path: str) -> "DuplicateGroups":
+        """Read groups written by save()."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["group_of"], data["offsets"], data["members"], float(data["threshold"]))
+    
+    def save(self, path: str) -> None:
+        """Write the arrays to a single .npz file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                group_of=self.group_of,
+                offsets=self.offsets,
+                members=self.members,
+                threshold=np.float32(self.threshold)
+            )
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def group(self, image_id: int) -> List[int]:
+        """All ids in the cluster of an image (just the image if it has none)."""
+        if not 0 <= image_id < len(self.group_of) or self.group_of[image_id] < 0:
+            return [int(image_id)]
+        g = int(self.group_of[image_id])
+        return [int(i) for i in self.members[self.offsets[g]:self.offsets[g + 1]]]
+    
+    def first_of_groups(self, image_ids: np.ndarray) -> np.ndarray:
+        """Mask over ranked ids keeping only the first (best) hit of each cluster."""
+        image_ids = np.asarray(image_ids, dtype=np.int64)
+        groups = np.full(len(image_ids), -1, dtype=np.int64)
+        known = (image_ids >= 0) & (image_ids < len(self.group_of))
+        groups[known] = self.group_of[image_ids[known]]
+        
+        keep = groups < 0
+        _, first = np.unique(groups, return_index=True)
+        keep[first[groups[first] >= 0]] = True
+        return keep
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get cluster counts and the similarity threshold they were built with."""
+        return {
+            "groups": len(self),
+            "images": len(self.members),
+            "threshold": round(self.threshold, 4)
+        }
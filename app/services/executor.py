@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the executor queue is full and a task is rejected."""
+
+class BoundedExecutor:
+    """Thread pool for CPU-bound work with a bounded queue and immediate rejection.
+    
+    At most max_workers tasks run at once and at most max_queue_size more wait
+    for a worker. Anything beyond that is rejected right away so callers can
+    shed load instead of piling up latency.
+    """
+    
+    def __init__(self, max_workers: int = 4, max_queue_size: int = 32, name: str = "search"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue_size = max(0, int(max_queue_size))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+    
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue_size
+    
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+    
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn on the pool and await its result, or raise ExecutorSaturatedError."""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Search queue full ({self._in_flight}/{self.capacity} in flight)"
+                )
+            self._in_flight += 1
+        
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+    
+    def shutdown(self) -> None:
+        """Stop accepting work and wait for running tasks."""
+        self._executor.shutdown(wait=True)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get limits and current load."""
+        in_flight = self._in_flight
+        return {
+            "max_workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.max_workers),
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
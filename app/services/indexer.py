@@ -1,84 +1,913 @@
+import os
+import re
 import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import faiss
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from app.services.attributes import AttributeStore, filter_key
+from app.services.cache import LRUCache
+from app.services.deltas import DeltaLog, DeltaState
+from app.services.duplicates import DuplicateGroups
+from app.services.metadata_store import URL_PREFIX, MetadataStore
+from app.services.neighbors import NeighborTable
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "fp16")
+
+# Filter match counts up to which approximate indexes score exactly (see default_filter_exact_max)
+FILTER_EXACT_MAX = {"ivf": 2000, "hnsw": 1000}
+
+# Per-component scalar quantizers for the compressed flat index types
+_SQ_TYPES = {"sq8": faiss.ScalarQuantizer.QT_8bit, "fp16": faiss.ScalarQuantizer.QT_fp16}
+
+# full: embeddings and index read into RAM
+# mmap: embeddings memory-mapped, index opened with FAISS mmap flags
+# index_only: embeddings skipped unless the index has to be built
+LOAD_MODES = ("full", "mmap", "index_only")
+
+# Base files compaction rewrites; each is written as a new generation (see generation_path)
+BASE_FILES = ("embeddings", "index", "indices", "metadata_store", "neighbors")
+
+# Zero-copy mmap of flat codes where supported, plain mmap of IVF lists otherwise
+_MMAP_IO_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    nlist: int = 1024,
+    pq_m: int = 64,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    ids: Optional[np.ndarray] = None
+) -> faiss.Index:
+    """Build an inner-product FAISS index of the requested type over normalized embeddings.
+    
+    flat      exact brute-force scan (IndexFlatIP)
+    ivf_flat  inverted lists of raw vectors, scans nprobe of nlist clusters
+    ivf_pq    inverted lists of PQ codes (pq_m sub-quantizers x pq_nbits bits)
+    hnsw      graph index with hnsw_m links per node
+    sq8       exact scan over int8 scalar-quantized codes (4x smaller than float32)
+    fp16      exact scan over float16 codes (2x smaller than float32)
+    
+    When ids are given (one stable image id per row) the index is wrapped in an
+    IndexIDMap2 and returns those ids instead of row positions.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = np.ascontiguousarray(embeddings / norms, dtype='float32')
+    n, dim = embeddings.shape
+    
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type in _SQ_TYPES:
+        index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[index_type], faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        # FAISS wants ~39 training points per centroid
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    return index
+
+class ReadOnlyIndexError(RuntimeError):
+    """Raised when an index that cannot change at runtime (a sharded one) is asked to."""
+
+def merge_topk(
+    scores: Sequence[np.ndarray],
+    ids: Sequence[np.ndarray],
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge per-source (n, k_i) score/id blocks into the overall top-k per row."""
+    all_scores = np.concatenate(scores, axis=1)
+    all_ids = np.concatenate(ids, axis=1)
+    order = np.argsort(-all_scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(all_scores, order, axis=1), np.take_along_axis(all_ids, order, axis=1)
+
+def _extract_ivf(index: faiss.Index) -> Optional[faiss.IndexIVF]:
+    """Return the (downcast) IVF layer of an index, or None if it has none."""
+    try:
+        return faiss.downcast_index(faiss.extract_index_ivf(index))
+    except RuntimeError:
+        return None
+
+def default_filter_exact_max(index: faiss.Index) -> int:
+    """Largest filter match count scored exactly for an index type.
+    
+    Exhaustive indexes (flat, sq8, fp16) scan every eligible vector through
+    the selector anyway, so they never need it. IVF and HNSW lose recall
+    when few vectors pass the selector (sparse lists, a disconnected graph),
+    so small matches are scored exactly from the embeddings instead.
+    """
+    if _extract_ivf(index) is not None:
+        return FILTER_EXACT_MAX["ivf"]
+    if isinstance(_unwrap(index), faiss.IndexHNSW):
+        return FILTER_EXACT_MAX["hnsw"]
+    return 0
+
+def _save_npy(path: str, array: np.ndarray) -> None:
+    """np.save to an exact path (np.save would append .npy to a temp name)."""
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+def _replace_file(path: str, write) -> None:
+    """Write a file next to its target and rename it into place."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def generation_path(path: str, generation: int) -> str:
+    """File of one generation of a base file: data/faiss_index.bin -> data/faiss_index.g3.bin."""
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}.g{generation}{path.suffix}"))
+
+def generation_of(path: str) -> int:
+    """Generation of a resolved base file (0 for files written by the build scripts)."""
+    match = re.search(r"\.g(\d+)$", Path(path).stem)
+    return int(match.group(1)) if match else 0
+
+def base_file(path: str, generation: Optional[int] = None) -> str:
+    """File a base path resolves to now, or its file of the given generation if there is one."""
+    if generation is not None and Path(generation_path(path, generation)).exists():
+        return generation_path(path, generation)
+    return os.path.realpath(path)
+
+def _point_to(path: str, target: str) -> None:
+    """Atomically make path a symlink to target, a file in the same directory."""
+    tmp_path = f"{path}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(os.path.basename(target), tmp_path)
+    os.replace(tmp_path, path)
+
+def files_fingerprint(paths: Sequence[str]) -> str:
+    """Short digest of file names, sizes and mtimes (missing files included as such)."""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:-;".encode())
+    return digest.hexdigest()[:16]
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """Return the index under an ID map wrapper, downcast to its concrete type."""
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def _vector_storage(index: faiss.Index) -> Tuple[str, int]:
+    """Return (encoding, bytes per vector) of the codes a FAISS index scans."""
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        qtype = index.sq.qtype
+        encoding = {faiss.ScalarQuantizer.QT_8bit: "int8", faiss.ScalarQuantizer.QT_fp16: "float16"}.get(qtype, "sq")
+    elif isinstance(index, (faiss.IndexIVFPQ, faiss.IndexPQ)):
+        encoding = "pq"
+    else:
+        encoding = "float32"
+    return encoding, int(index.code_size)
+
+def describe_index(index: Optional[faiss.Index]) -> Dict[str, Any]:
+    """Report the type and tunable parameters of a FAISS index."""
+    if index is None:
+        return {}
+    
+    params: Dict[str, Any] = {
+        "type": type(_unwrap(index)).__name__,
+        "metric": "inner_product",
+        "id_mapped": hasattr(index, "id_map")
+    }
+    params["vector_encoding"], params["bytes_per_vector"] = _vector_storage(index)
+    
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        params.update({"nlist": ivf.nlist, "nprobe": ivf.nprobe})
+        if isinstance(ivf, faiss.IndexIVFPQ):
+            params.update({"pq_m": ivf.pq.M, "pq_nbits": ivf.pq.nbits})
+    
+    hnsw_index = _unwrap(index)
+    if isinstance(hnsw_index, faiss.IndexHNSW):
+        params.update({
+            "hnsw_m": hnsw_index.hnsw.nb_neighbors(1),
+            "ef_search": hnsw_index.hnsw.efSearch,
+            "ef_construction": hnsw_index.hnsw.efConstruction
+        })
+    
+    return params
 
 class FAISSIndexManager:
-    """Manages FAISS index loading and search operations."""
+    """Manages FAISS index loading and search operations.
+    
+    The base index is read-only (and usually memory-mapped). Images added or
+    deleted at runtime go to an append-only delta log and an in-memory
+    DeltaState; compact() folds them into a new base index on disk.
+    
+    Compaction writes each base file as a new generation next to it and only
+    re-points the configured name (a symlink) once a manager loaded from the
+    new generation serves. A manager keeps reading the files its paths
+    resolved to when it was loaded, so later switches never change its rows.
+    """
     
-    def __init__(self):
+    read_only = False
+    
+    def __init__(
+        self,
+        index_type: str = "flat",
+        build_params: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        load_mode: str = "full",
+        delta_dir: str = "data/index_deltas",
+        rerank_factor: int = 0,
+        filter_exact_max: Optional[int] = None
+    ):
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode '{load_mode}', expected one of {LOAD_MODES}")
+        
+        self.load_mode = load_mode
+        self.index_type = index_type
+        self.build_params = build_params or {}
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # > 0: fetch rerank_factor x more candidates and rescore them exactly
+        self.rerank_factor = max(0, int(rerank_factor))
+        # Filters matching at most this many base images are scored exactly
+        # (None: by index type, set once the index is loaded)
+        self.filter_exact_max_option = filter_exact_max
+        self.filter_exact_max = max(0, int(filter_exact_max or 0))
         self.index = None
+        self.id_mapped = False
         self.embeddings = None
         self.valid_indices = None
-        self.metadata = None
-        self.image_paths = []
+        self._id_order: Optional[np.ndarray] = None
+        self.embedding_dim = 0
+        self.metadata: Optional[MetadataStore] = None
+        self.attributes: Optional[AttributeStore] = None
+        self.duplicates: Optional[DuplicateGroups] = None
+        self.neighbors: Optional[NeighborTable] = None
+        # filter key -> (base selector, its bitmap, eligibility by image id)
+        self._filter_selectors = LRUCache(max_size=256)
+        self.paths: Dict[str, str] = {}
+        # Files actually read: the paths resolved at load time
+        self.files: Dict[str, str] = {}
+        self.generation = 0
+        self._compacted: Optional[Tuple[int, List[Path]]] = None
+        self.delta_log = DeltaLog(delta_dir)
+        self.delta: Optional[DeltaState] = None
+        self._next_id = 0
+        self._mutation_lock = threading.Lock()
         
     def load_from_disk(
         self,
         embeddings_path: str = "data/clip_embeddings_optimized.npy",
         faiss_index_path: str = "data/faiss_index.bin",
         metadata_path: str = "data/embedding_metadata.json",
-        indices_path: str = "data/valid_indices.npy"
+        indices_path: str = "data/valid_indices.npy",
+        metadata_store_path: str = "data/metadata.bin",
+        attributes_path: str = "data/attributes.npz",
+        duplicates_path: str = "data/duplicate_groups.npz",
+        neighbors_path: Optional[str] = "data/neighbors.npy",
+        generation: Optional[int] = None
     ) -> None:
-        """Load all index components from disk."""
-        print("Loading embeddings and index...")
+        """Load all index components from disk (attributes, duplicate groups and neighbours are optional).
+        
+        generation selects the base files of a compaction not switched to yet;
+        by default the current ones are read.
+        """
+        print(f"Loading embeddings and index ({self.load_mode})...")
+        self.paths = {
+            "embeddings": embeddings_path,
+            "index": faiss_index_path,
+            "metadata": metadata_path,
+            "indices": indices_path,
+            "metadata_store": metadata_store_path,
+            "attributes": attributes_path,
+            "duplicates": duplicates_path,
+            "neighbors": neighbors_path
+        }
+        self.files = {
+            key: base_file(path, generation) if key in BASE_FILES and path else path
+            for key, path in self.paths.items()
+        }
+        embeddings_path, faiss_index_path, indices_path, metadata_store_path, neighbors_path = (
+            self.files[key] for key in BASE_FILES
+        )
+        self.generation = generation if generation is not None else generation_of(faiss_index_path)
+        index_exists = Path(faiss_index_path).exists()
+        
+        # Metadata is independent of the vectors, so load it alongside them
+        metadata_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata-loader")
+        metadata_future = metadata_pool.submit(self._load_metadata, metadata_path, metadata_store_path)
+        metadata_pool.shutdown(wait=False)
         
-        # Load embeddings
-        self.embeddings = np.load(embeddings_path)
-        print(f"Loaded embeddings: {self.embeddings.shape}")
+        # Load embeddings (search never reads them, so mmap or skip when allowed)
+        if self.load_mode == "full":
+            self.embeddings = np.load(embeddings_path)
+            print(f"Loaded embeddings: {self.embeddings.shape}")
+        elif self.load_mode == "mmap" or not index_exists:
+            self.embeddings = np.load(embeddings_path, mmap_mode="r")
+            print(f"Memory-mapped embeddings: {self.embeddings.shape}")
+        else:
+            self.embeddings = None
+            print("Skipped embeddings (index_only)")
+        
+        # Load valid indices (row -> image id)
+        mmap_mode = None if self.load_mode == "full" else "r"
+        self.valid_indices = np.load(indices_path, mmap_mode=mmap_mode)
+        print(f"Loaded {len(self.valid_indices)} valid indices")
+        # Build scripts and compaction write ids in ascending order; keep a sorter otherwise
+        if len(self.valid_indices) > 1 and np.any(np.diff(self.valid_indices) < 0):
+            self._id_order = np.argsort(self.valid_indices, kind="stable")
         
-        # Load or create FAISS index
-        if Path(faiss_index_path).exists():
-            self.index = faiss.read_index(faiss_index_path)
+        # Load or create FAISS index (new indexes are ID-mapped by image id)
+        if index_exists:
+            self.index = self._read_index(faiss_index_path)
             print(f"Loaded FAISS index: {self.index.ntotal} vectors")
         else:
-            print("FAISS index not found, creating new...")
-            self.index = self._create_index(self.embeddings)
+            print(f"FAISS index not found, creating new ({self.index_type})...")
+            self.index = self._create_index(self.embeddings, self.valid_indices)
             faiss.write_index(self.index, faiss_index_path)
             print(f"Created and saved FAISS index")
         
-        # Load valid indices
-        self.valid_indices = np.load(indices_path)
-        print(f"Loaded {len(self.valid_indices)} valid indices")
+        self.id_mapped = hasattr(self.index, "id_map")
+        self.embedding_dim = self.index.d
+        self._apply_search_defaults()
+        if self.filter_exact_max_option is None:
+            self.filter_exact_max = default_filter_exact_max(self.index)
         
-        # Load metadata
+        # Metadata (compact store, converted once from the JSON if missing)
+        self.metadata = metadata_future.result()
+        print(f"Loaded metadata for {len(self.metadata)} images")
+        
+        if Path(attributes_path).exists():
+            self.attributes = AttributeStore.load(attributes_path)
+            print(f"Loaded attributes for {len(self.attributes)} images")
+        
+        if Path(duplicates_path).exists():
+            self.duplicates = DuplicateGroups.load(duplicates_path)
+            print(f"Loaded {len(self.duplicates)} duplicate groups")
+        
+        if neighbors_path and Path(neighbors_path).exists():
+            self.neighbors = NeighborTable.load(neighbors_path)
+            print(f"Memory-mapped neighbours of {len(self.neighbors)} images")
+        
+        # Replay runtime additions/deletions not yet compacted into the base
+        self._publish(self._drop_compacted(self.delta_log.replay(self.embedding_dim)))
+        self._next_id = int(max(
+            len(self.metadata),
+            int(np.max(self.valid_indices)) + 1 if len(self.valid_indices) else 0,
+            int(self.delta.ids.max()) + 1 if len(self.delta.ids) else 0,
+            int(self.delta.tombstones.max()) + 1 if len(self.delta.tombstones) else 0,
+            self.delta_log.next_id()
+        ))
+        if not self.delta.empty:
+            print(f"Replayed deltas: +{len(self.delta.ids)} / -{len(self.delta.tombstones)} images")
+            # Runtime neighbour rows are not persisted until compaction, so redo them
+            if self.neighbors is not None:
+                if len(self.delta.ids):
+                    self._update_neighbors(self.delta.ids, self.delta.vectors)
+                self.neighbors.clear(self.delta.tombstones)
+    
+    def _load_metadata(self, metadata_path: str, metadata_store_path: str) -> MetadataStore:
+        """Memory-map the metadata store, building it from embedding_metadata.json if needed."""
+        if Path(metadata_store_path).exists():
+            return MetadataStore.load(metadata_store_path)
+        
+        print(f"Metadata store not found, converting {metadata_path}...")
         with open(metadata_path, 'r') as f:
-            self.metadata = json.load(f)
+            store = MetadataStore.from_paths(json.load(f).get("image_paths", []))
         
-        self.image_paths = self.metadata.get("image_paths", [])
-        print(f"Loaded {len(self.image_paths)} image paths")
+        try:
+            store.save(metadata_store_path)
+        except OSError as e:
+            print(f"Could not save metadata store: {e}")
+        return store
     
-    def _create_index(self, embeddings: np.ndarray) -> faiss.Index:
-        """Create normalized FAISS index."""
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        embeddings = embeddings / norms
+    def _read_index(self, faiss_index_path: str) -> faiss.Index:
+        """Read the FAISS index, memory-mapping it unless load_mode is full."""
+        if self.load_mode == "full":
+            return faiss.read_index(faiss_index_path)
         
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        index.add(embeddings.astype('float32'))
-        return index
+        try:
+            return faiss.read_index(faiss_index_path, _MMAP_IO_FLAGS)
+        except RuntimeError as e:
+            print(f"mmap read not supported for this index ({e}), reading into RAM")
+            return faiss.read_index(faiss_index_path)
+    
+    def _create_index(self, embeddings: np.ndarray, ids: Optional[np.ndarray] = None) -> faiss.Index:
+        """Create normalized FAISS index of the configured type."""
+        return build_index(embeddings, self.index_type, ids=ids, **self.build_params)
     
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
-        """Search for similar images."""
+    def _apply_search_defaults(self) -> None:
+        """Apply server-wide nprobe/efSearch defaults to the loaded index."""
+        ivf = _extract_ivf(self.index)
+        if self.nprobe is not None and ivf is not None:
+            ivf.nprobe = self.nprobe
+        
+        hnsw_index = _unwrap(self.index)
+        if self.ef_search is not None and isinstance(hnsw_index, faiss.IndexHNSW):
+            hnsw_index.hnsw.efSearch = self.ef_search
+    
+    def _search_params(
+        self,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        sel: Optional[faiss.IDSelector] = None
+    ) -> Optional[faiss.SearchParameters]:
+        """Build per-request search parameters for the loaded index type.
+        
+        Unset knobs keep the index's own nprobe/efSearch, since FAISS parameter
+        objects otherwise fall back to library defaults.
+        """
+        ivf = _extract_ivf(self.index)
+        hnsw_index = _unwrap(self.index)
+        
+        if ivf is not None and (nprobe is not None or sel is not None):
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe or ivf.nprobe
+        elif isinstance(hnsw_index, faiss.IndexHNSW) and (ef_search is not None or sel is not None):
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = ef_search or hnsw_index.hnsw.efSearch
+        elif sel is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+        
+        if sel is not None:
+            params.sel = sel
+        return params
+    
+    def labels_to_ids(self, labels: np.ndarray) -> np.ndarray:
+        """Translate base index labels to image ids (-1 where there is no hit)."""
+        if self.id_mapped:
+            return labels
+        
+        ids = np.full(labels.shape, -1, dtype=np.int64)
+        valid = (labels >= 0) & (labels < len(self.valid_indices))
+        ids[valid] = self.valid_indices[labels[valid]]
+        return ids
+    
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search for similar images with a (d,) vector or an (n, d) query matrix.
+        
+        Returns (scores, image_ids) of shape (n, top_k * 3), with -1 ids for empty
+        slots. Deleted images are excluded inside the scan and runtime additions
+        are merged in. nprobe (IVF) and ef_search (HNSW) override the server
+        defaults for this call only and are ignored by other index types.
+        filters (an AttributeStore.mask spec) restrict the scan to eligible
+        images, so selective filters still fill all top_k * 3 slots.
+        """
         if self.index is None:
             raise ValueError("Index not loaded")
         
-        scores, indices = self.index.search(
-            query_embedding.astype('float32'), 
-            top_k * 3
+        delta = self.delta
+        k = top_k * 3
+        queries = np.ascontiguousarray(np.atleast_2d(query_embedding), dtype='float32')
+        sel, eligible = delta.base_selector, None
+        if filters:
+            # Held until the scan ends: the selector reads the bitmap by pointer
+            filter_state = self._filter_selector(filters)
+            filter_sel, _, eligible, rows = filter_state
+            sel = faiss.IDSelectorAnd(filter_sel, sel) if sel is not None else filter_sel
+        
+        if filters and len(rows) <= self.filter_exact_max:
+            # Few eligible images: score them all exactly, which approximate
+            # indexes cannot match under a selective filter
+            if len(delta.tombstones):
+                rows = rows[~np.isin(np.asarray(self.valid_indices)[rows], delta.tombstones)]
+            scores, ids = self._search_rows(queries, rows, k)
+        elif self.rerank_factor:
+            params = self._search_params(nprobe, ef_search, sel=sel)
+            scores, labels = self.index.search(queries, k * self.rerank_factor, params=params)
+            scores, ids = self._rerank(queries, self.labels_to_ids(labels), k)
+        else:
+            params = self._search_params(nprobe, ef_search, sel=sel)
+            scores, labels = self.index.search(queries, k, params=params)
+            ids = self.labels_to_ids(labels)
+        
+        if delta.index is not None:
+            delta_params = None
+            if eligible is not None:
+                allowed = delta.ids[delta.ids < len(eligible)]
+                allowed = allowed[eligible[allowed]]
+                delta_params = faiss.SearchParameters()
+                delta_params.sel = faiss.IDSelectorBatch(allowed)
+            if eligible is None or len(allowed):
+                delta_scores, delta_ids = delta.index.search(queries, min(k, delta.index.ntotal), params=delta_params)
+                scores, ids = merge_topk([scores, delta_scores], [ids, delta_ids], k)
+        
+        return scores, ids
+    
+    def nearest_neighbors(
+        self,
+        image_ids: np.ndarray,
+        vectors: np.ndarray,
+        width: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-width neighbours of indexed images from their vectors, themselves excluded.
+        
+        Returns (ids, scores) of shape (n, width), -1 padded, best first.
+        """
+        scores, ids = self.search(vectors, -(-(width + 1) // 3), nprobe=nprobe, ef_search=ef_search)
+        own = ids == np.asarray(image_ids, dtype=np.int64)[:, None]
+        # Stable sort moves each image's own hit to the back, keeping the rest in order
+        order = np.argsort(own, axis=1, kind="stable")[:, :width]
+        ids = np.take_along_axis(np.where(own, -1, ids), order, axis=1)
+        return ids, np.take_along_axis(scores, order, axis=1)
+    
+    def _update_neighbors(self, image_ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Give new images neighbour rows and add them to the rows of their neighbours.
+        
+        The reverse insertion keeps existing rows current as long as neighbour
+        relations are roughly symmetric; a rebuild makes them exact again.
+        """
+        table = self.neighbors
+        ids, scores = self.nearest_neighbors(image_ids, vectors, table.width)
+        table.set_rows(image_ids, ids, scores)
+        for image_id, row_ids, row_scores in zip(image_ids, ids, scores):
+            for neighbor_id, score in zip(row_ids, row_scores):
+                if neighbor_id >= 0:
+                    table.insert(int(neighbor_id), int(image_id), float(score))
+    
+    @property
+    def has_attributes(self) -> bool:
+        """Whether attribute filters can be used."""
+        return self.attributes is not None
+    
+    def _filter_selector(self, filters: Dict[str, Any]) -> Tuple[faiss.IDSelector, np.ndarray, np.ndarray, np.ndarray]:
+        """Bitmap selector over base labels for a filter spec, cached per spec.
+        
+        Returns (selector, bitmap it reads, eligibility by image id, eligible
+        base rows); callers keep the tuple alive for as long as FAISS may use
+        the selector.
+        """
+        key = filter_key(filters)
+        cached = self._filter_selectors.get(key)
+        if cached is None:
+            if self.attributes is None:
+                raise ValueError("Attribute filters need an attributes file (scripts/build_metadata.py --attributes)")
+            
+            eligible = self.attributes.mask(filters)
+            ids = np.asarray(self.valid_indices)
+            by_row = np.zeros(len(ids), dtype=bool)
+            known = ids < len(eligible)
+            by_row[known] = eligible[ids[known]]
+            
+            bitmap = np.packbits(eligible if self.id_mapped else by_row, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+            cached = (selector, bitmap, eligible, np.flatnonzero(by_row))
+            self._filter_selectors.put(key, cached)
+        return cached
+    
+    def _search_rows(self, queries: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact (n, k) top hits among the given base rows, from the float32 embeddings."""
+        exact = np.full((len(queries), max(k, len(rows))), -np.finfo(np.float32).max, dtype=np.float32)
+        row_ids = np.full(exact.shape[1], -1, dtype=np.int64)
+        if len(rows):
+            vectors = np.asarray(self._full_precision()[rows], dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            exact[:, :len(rows)] = queries @ vectors.T
+            row_ids[:len(rows)] = np.asarray(self.valid_indices)[rows]
+        
+        order = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(exact, order, axis=1), row_ids[order]
+    
+    def _full_precision(self) -> np.ndarray:
+        """Float32 embeddings, memory-mapped on first use when they were not loaded."""
+        if self.embeddings is None:
+            self.embeddings = np.load(self.files["embeddings"], mmap_mode="r")
+        return self.embeddings
+    
+    def _rerank(self, queries: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rescore base candidates against full-precision vectors and keep the top k.
+        
+        Only the candidate rows are read, so with a memory-mapped embeddings
+        file the exact vectors stay on disk until a query touches them.
+        """
+        rows = self._rows_of(ids)
+        hit_query, hit_slot = np.nonzero(rows >= 0)
+        unique_rows, inverse = np.unique(rows[hit_query, hit_slot], return_inverse=True)
+        
+        vectors = np.asarray(self._full_precision()[unique_rows], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        
+        exact = np.full(ids.shape, -np.finfo(np.float32).max, dtype=np.float32)
+        exact[hit_query, hit_slot] = np.einsum("ij,ij->i", queries[hit_query], vectors[inverse])
+        
+        order = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+        scores = np.take_along_axis(exact, order, axis=1)
+        ids = np.where(np.take_along_axis(rows, order, axis=1) >= 0, np.take_along_axis(ids, order, axis=1), -1)
+        return scores, ids
+    
+    def _rows_of(self, ids: np.ndarray) -> np.ndarray:
+        """Base rows of an array of image ids (-1 where an id is not in the base)."""
+        valid_indices = self.valid_indices
+        if not len(valid_indices):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        
+        pos = np.searchsorted(valid_indices, ids, sorter=self._id_order)
+        pos = np.minimum(pos, len(valid_indices) - 1)
+        rows = pos if self._id_order is None else self._id_order[pos]
+        return np.where((ids >= 0) & (valid_indices[rows] == ids), rows, -1)
+    
+    def get_vector(self, image_id: int) -> Optional[np.ndarray]:
+        """Return the stored (normalized) vector of an indexed image, or None."""
+        delta = self.delta
+        if delta.is_deleted(image_id):
+            return None
+        
+        vector = delta.vector(image_id)
+        if vector is not None:
+            return vector
+        
+        row = self._row_of(image_id)
+        if row is None:
+            return None
+        
+        try:
+            return self.index.reconstruct(int(image_id if self.id_mapped else row))
+        except RuntimeError:
+            # e.g. IVF without a direct map: fall back to the embeddings file
+            vector = np.asarray(self._full_precision()[row], dtype=np.float32)
+            return vector / np.linalg.norm(vector)
+    
+    def _row_of(self, image_id: int) -> Optional[int]:
+        """Base row of an image id, or None."""
+        row = int(self._rows_of(np.array([image_id], dtype=np.int64))[0])
+        return row if row >= 0 else None
+    
+    def find_image_id(self, filename: str) -> Optional[int]:
+        """Resolve a file name to its image id, or None."""
+        delta = self.delta
+        image_id = delta.find(filename)
+        if image_id is None and self.metadata is not None:
+            image_id = self.metadata.find(filename)
+        if image_id is None or delta.is_deleted(image_id):
+            return None
+        return image_id
+    
+    def get_image_info(self, idx: int) -> Optional[Tuple[str, str]]:
+        """Get (filename, relative URL) by image index."""
+        return self._image_info(self.delta, idx)
+    
+    def _image_info(self, delta: Optional[DeltaState], idx: int) -> Optional[Tuple[str, str]]:
+        if delta is not None:
+            filename = delta.filename(idx)
+            if filename is not None:
+                return filename, f"{URL_PREFIX}/{filename}"
+            if delta.is_deleted(idx):
+                return None
+        return self.metadata.get(idx) if self.metadata is not None else None
+    
+    # =========================
+    # INCREMENTAL UPDATES
+    # =========================
+    
+    def _publish(self, delta: DeltaState) -> None:
+        """Attach the base exclusion selector and make the snapshot visible to searches."""
+        delta.base_selector = None
+        delta.selector_refs = []
+        if len(delta.tombstones):
+            if self.id_mapped:
+                labels = delta.tombstones
+            else:
+                labels = np.flatnonzero(np.isin(self.valid_indices, delta.tombstones))
+            excluded = faiss.IDSelectorBatch(np.ascontiguousarray(labels, dtype=np.int64))
+            delta.base_selector = faiss.IDSelectorNot(excluded)
+            delta.selector_refs = [excluded]
+        self.delta = delta
+    
+    def _drop_compacted(self, delta: DeltaState) -> DeltaState:
+        """Ignore replayed operations already folded into the base.
+        
+        Log files are only removed once their compaction is switched to, so a
+        manager loaded from a new generation (or after a crash) replays them.
+        """
+        in_base = np.isin(delta.ids, self.valid_indices)
+        # Tombstones of ids the base no longer has (deleted before compaction) exclude nothing
+        stale = ~np.isin(delta.tombstones, self.valid_indices)
+        if not in_base.any() and not stale.any():
+            return delta
+        
+        keep = ~in_base
+        return DeltaState(
+            delta.dim,
+            delta.ids[keep],
+            delta.vectors[keep],
+            [f for f, k in zip(delta.filenames, keep) if k],
+            delta.tombstones[~stale]
         )
-        return scores, indices
     
-    def get_image_path(self, idx: int) -> str:
-        """Get image path by index."""
-        return self.image_paths[idx] if 0 <= idx < len(self.image_paths) else ""
+    def add_vectors(self, vectors: np.ndarray, filenames: List[str]) -> np.ndarray:
+        """Insert embeddings for new images and return their stable image ids."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.embedding_dim:
+            raise ValueError(f"Expected {self.embedding_dim}-d vectors, got {vectors.shape[1]}")
+        if len(filenames) != len(vectors):
+            raise ValueError("Need one filename per vector")
+        
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        with self._mutation_lock, self.delta_log.locked():
+            # Other workers may have issued ids since, so claim them through the log
+            ids = self.delta_log.reserve_ids(len(vectors), self._next_id)
+            self.delta_log.append("add", ids, vectors, filenames)
+            self._publish(self.delta.with_added(ids, vectors, filenames))
+            self._next_id = int(ids[-1]) + 1 if len(ids) else self._next_id
+            if self.neighbors is not None:
+                self._update_neighbors(ids, vectors)
+        return ids
+    
+    def delete_ids(self, image_ids: Sequence[int]) -> np.ndarray:
+        """Delete images by id and return the ids that existed."""
+        with self._mutation_lock:
+            candidates = np.unique(np.asarray(image_ids, dtype=np.int64))
+            existing = np.array(
+                [i for i in candidates if self.get_image_info(int(i)) is not None],
+                dtype=np.int64
+            )
+            if len(existing):
+                self.delta_log.append("delete", existing)
+                self._publish(self.delta.with_deleted(existing))
+                # Other rows still list them; lookups skip deleted ids
+                if self.neighbors is not None:
+                    self.neighbors.clear(existing)
+        return existing
+    
+    def delta_size(self) -> int:
+        """Number of pending additions and deletions."""
+        return len(self.delta.ids) + len(self.delta.tombstones)
+    
+    def compact(self) -> Optional[int]:
+        """Fold pending deltas into a new generation of the base files.
+        
+        Only operations logged before the call are consumed; later ones stay in
+        the log and are replayed by the manager that loads the new base. The
+        served names are untouched until commit_compaction(); returns the new
+        generation (None if nothing was pending).
+        """
+        with self._mutation_lock:
+            files = self.delta_log.files()
+            delta = self.delta
+        
+        if not files:
+            return None
+        
+        print(f"Compacting {len(files)} delta files...")
+        embeddings = self.embeddings
+        if embeddings is None:
+            embeddings = np.load(self.files["embeddings"], mmap_mode="r")
+        
+        keep = ~np.isin(self.valid_indices, delta.tombstones)
+        vectors = np.concatenate([np.asarray(embeddings[keep], dtype=np.float32), delta.vectors])
+        ids = np.concatenate([np.asarray(self.valid_indices)[keep], delta.ids]).astype(np.int64)
+        index = self._create_index(vectors, ids)
+        
+        # Metadata keeps one slot per id ever issued; deleted ids become empty entries
+        count = max(len(self.metadata), int(ids.max()) + 1 if len(ids) else 0)
+        infos = (self._image_info(delta, image_id) for image_id in range(count))
+        store = MetadataStore.from_paths(info[0] if info else "" for info in infos)
+        
+        self._pin_files()
+        self._prune_generations()
+        generation = self.generation + 1
+        new_path = lambda key: generation_path(self.paths[key], generation)
+        _replace_file(new_path("embeddings"), lambda path: _save_npy(path, vectors))
+        _replace_file(new_path("indices"), lambda path: _save_npy(path, ids))
+        _replace_file(new_path("metadata_store"), store.save)
+        _replace_file(new_path("index"), lambda path: faiss.write_index(index, path))
+        if self.neighbors is not None:
+            _replace_file(new_path("neighbors"), self.neighbors.save)
+        self._compacted = generation, files
+        print(f"Compaction complete: {index.ntotal} vectors (generation {generation})")
+        return generation
+    
+    def commit_compaction(self, generation: int) -> None:
+        """Point the base names at a compacted generation and drop the log files it consumed.
+        
+        Call once a manager loaded from that generation is serving; this one
+        keeps reading its own files until it is retired.
+        """
+        if self._compacted is None or self._compacted[0] != generation:
+            raise ValueError(f"Generation {generation} was not compacted by this manager")
+        
+        for key in BASE_FILES:
+            if self.paths.get(key) and Path(generation_path(self.paths[key], generation)).exists():
+                _point_to(self.paths[key], generation_path(self.paths[key], generation))
+        self.delta_log.remove(self._compacted[1])
+        self._compacted = None
+    
+    def _pin_files(self) -> None:
+        """Give base files read from plain (built) files a generation name of their own.
+        
+        The names are about to become symlinks to the next generation, so a
+        hard link keeps this manager's files readable under a name that stays.
+        """
+        for key in BASE_FILES:
+            path = self.paths.get(key)
+            if not path or os.path.islink(path) or not os.path.exists(self.files[key]):
+                continue
+            pinned = generation_path(path, self.generation)
+            if self.files[key] != os.path.realpath(pinned):
+                tmp_path = f"{pinned}.tmp"
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+                os.link(self.files[key], tmp_path)
+                os.replace(tmp_path, pinned)
+                self.files[key] = os.path.realpath(pinned)
+    
+    def _prune_generations(self) -> None:
+        """Delete base files of generations older than the one being served.
+        
+        Managers reading them were retired when this generation was swapped in.
+        """
+        in_use = set(self.files.values())
+        for key in BASE_FILES:
+            if not self.paths.get(key):
+                continue
+            path = Path(self.paths[key])
+            pattern = re.compile(rf"{re.escape(path.stem)}\.g(\d+)")
+            for old in path.parent.glob(f"{path.stem}.g*{path.suffix}"):
+                match = pattern.fullmatch(old.stem)
+                if match and int(match.group(1)) < self.generation and os.path.realpath(old) not in in_use:
+                    old.unlink(missing_ok=True)
+    
+    def missing_shards(self) -> List[str]:
+        """Shards left out of the calling thread's last search (never any: one index)."""
+        return []
+    
+    def check_loaded(self) -> None:
+        """Raise ValueError unless the index is non-empty and matches valid_indices."""
+        if self.index is None or self.index.ntotal == 0:
+            raise ValueError("New index is empty")
+        
+        if len(self.valid_indices) != self.index.ntotal:
+            raise ValueError(
+                f"valid_indices has {len(self.valid_indices)} entries "
+                f"for {self.index.ntotal} vectors"
+            )
+    
+    def fingerprint(self) -> str:
+        """Identity of the served data: base files plus the delta log files applied."""
+        base = [self.files[key] for key in ("index", "indices", "metadata_store", "attributes", "duplicates") if key in self.files]
+        return files_fingerprint(base + [str(path) for path in self.delta_log.files()])
+    
+    def close(self) -> None:
+        """Release resources (nothing to do; the index is freed with the manager)."""
     
     def get_status(self) -> Dict[str, Any]:
         """Get index status."""
+        delta = self.delta
         return {
-            "vectors_indexed": self.index.ntotal if self.index else 0,
-            "embedding_dim": self.embeddings.shape[1] if self.embeddings is not None else 0,
-            "total_images": len(self.image_paths),
-            "index_type": type(self.index).__name__ if self.index else "None"
+            "vectors_indexed": (self.index.ntotal if self.index else 0)
+            + (len(delta.ids) if delta else 0) - (len(delta.tombstones) if delta else 0),
+            "embedding_dim": self.embedding_dim,
+            "total_images": len(self.metadata) if self.metadata is not None else 0,
+            "index_type": type(self.index).__name__ if self.index else "None",
+            "index_params": describe_index(self.index),
+            "load_mode": self.load_mode,
+            "read_only": self.read_only,
+            "generation": self.generation,
+            "rerank_factor": self.rerank_factor,
+            "filter_exact_max": self.filter_exact_max,
+            "attributes": self.attributes.get_status() if self.attributes is not None else None,
+            "duplicates": self.duplicates.get_status() if self.duplicates is not None else None,
+            "neighbors": self.neighbors.get_status() if self.neighbors is not None else None,
+            "delta": {
+                "added": len(delta.ids) if delta else 0,
+                "deleted": len(delta.tombstones) if delta else 0,
+                "log_files": len(self.delta_log.files())
+            }
         }
@@ -0,0 +1,102 @@
+import re
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+MAGIC = b"VSSMETA1"
+HEADER_BYTES = len(MAGIC) + 8
+URL_PREFIX = "/images"
+
+def filename_from_path(path: str) -> str:
+    """Return the file name of a POSIX or Windows path."""
+    return re.split(r"[\\/]", path)[-1] if path else ""
+
+class MetadataStore:
+    """Compact per-image metadata: a packed UTF-8 string table plus offset arrays.
+    
+    Entry i holds the relative URL of image id i (e.g. /images/0001.jpg) and the
+    position where its file name starts, so both resolve with two array reads and
+    one small decode at result time. On disk the layout is
+    
+        magic | count (uint64) | offsets (uint64, count + 1) | name_starts (uint32, count) | blob
+    
+    and load() memory-maps it, so nothing is parsed up front.
+    """
+    
+    def __init__(self, offsets: np.ndarray, name_starts: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.name_starts = name_starts
+        self.blob = blob
+        self._ids_by_filename: Optional[Dict[str, int]] = None
+    
+    @classmethod
+    def from_paths(cls, paths: Iterable[str], url_prefix: str = URL_PREFIX) -> "MetadataStore":
+        """Build a store from image paths (absolute, relative or Windows-style)."""
+        encoded = []
+        name_starts = []
+        for path in paths:
+            filename = filename_from_path(path)
+            url = f"{url_prefix}/{filename}" if filename else ""
+            encoded.append(url.encode("utf-8"))
+            name_starts.append(len(url.encode("utf-8")) - len(filename.encode("utf-8")))
+        
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.uint64)
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, np.asarray(name_starts, dtype=np.uint32), blob)
+    
+    @classmethod
+    def load(cls, path: str) -> "MetadataStore":
+        """Memory-map a store written by save()."""
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a metadata store")
+        
+        count = int(raw[len(MAGIC):HEADER_BYTES].view(np.uint64)[0])
+        offsets_end = HEADER_BYTES + (count + 1) * 8
+        names_end = offsets_end + count * 4
+        offsets = raw[HEADER_BYTES:offsets_end].view(np.uint64)
+        name_starts = raw[offsets_end:names_end].view(np.uint32)
+        return cls(offsets, name_starts, raw[names_end:])
+    
+    def save(self, path: str) -> None:
+        """Write the store in its binary layout."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(self)).tobytes())
+            f.write(np.ascontiguousarray(self.offsets, dtype=np.uint64).tobytes())
+            f.write(np.ascontiguousarray(self.name_starts, dtype=np.uint32).tobytes())
+            f.write(np.ascontiguousarray(self.blob, dtype=np.uint8).tobytes())
+    
+    def __len__(self) -> int:
+        return len(self.name_starts)
+    
+    def get(self, idx: int) -> Optional[Tuple[str, str]]:
+        """Return (filename, url) for an image id, or None if unknown."""
+        if not 0 <= idx < len(self):
+            return None
+        
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        if start == end:
+            return None
+        
+        url = bytes(self.blob[start:end]).decode("utf-8")
+        name_start = int(self.name_starts[idx])
+        filename = bytes(self.blob[start + name_start:end]).decode("utf-8")
+        return filename, url
+    
+    def find(self, filename: str) -> Optional[int]:
+        """Reverse lookup of an image id by file name.
+        
+        The reverse map is only built on the first lookup, so servers that
+        never resolve file names do not pay for it.
+        """
+        if self._ids_by_filename is None:
+            ids_by_filename = {}
+            for idx in range(len(self)):
+                entry = self.get(idx)
+                if entry is not None:
+                    ids_by_filename.setdefault(entry[0], idx)
+            self._ids_by_filename = ids_by_filename
+        return self._ids_by_filename.get(filename)
@@ -0,0 +1,176 @@
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond stages up to slow requests
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    """Fixed-bucket histogram with per-bucket counts, sum and count."""
+    
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float) -> None:
+        """Record a single observation."""
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.total += value
+            self.count += 1
+    
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Return (cumulative counts per bucket incl. +Inf, sum, count)."""
+        with self._lock:
+            cumulative, running = [], 0
+            for n in self.counts:
+                running += n
+                cumulative.append(running)
+            return cumulative, self.total, self.count
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get bucket counts keyed by upper bound."""
+        with self._lock:
+            buckets = {str(bound): n for bound, n in zip(self.buckets, self.counts)}
+            buckets["+Inf"] = self.counts[-1]
+            return {
+                "count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else 0.0,
+                "buckets": buckets
+            }
+
+class StageTimer:
+    """Lap timer for the stages of one request.
+    
+    mark(stage) charges the time since the previous mark to that stage, so
+    instrumenting a code path costs one perf_counter call per stage.
+    """
+    
+    __slots__ = ("started_at", "_last", "stages")
+    
+    def __init__(self):
+        self.started_at = self._last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+    
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+    
+    def skip(self) -> None:
+        """Restart the lap without charging the elapsed time to any stage."""
+        self._last = time.perf_counter()
+    
+    def breakdown_ms(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+
+def _labels(pairs: Iterable[Tuple[str, Any]]) -> str:
+    body = ",".join(f'{name}="{str(value)}"' for name, value in pairs)
+    return "{" + body + "}" if body else ""
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metrics:
+    """Process-wide latency histograms and request counters.
+    
+    Stage histograms are created on first use; render() writes them together
+    with caller-supplied counters and gauges in the Prometheus text format.
+    """
+    
+    def __init__(self, prefix: str = "vss", buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._routes: Dict[str, Histogram] = {}
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self.in_flight = 0
+    
+    def _histogram(self, table: Dict[str, Histogram], key: str) -> Histogram:
+        hist = table.get(key)
+        if hist is None:
+            with self._lock:
+                hist = table.setdefault(key, Histogram(self.buckets))
+        return hist
+    
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self._histogram(self._stages, stage).observe(seconds)
+    
+    def observe_stages(self, timer: StageTimer) -> None:
+        for stage, seconds in timer.stages.items():
+            self.observe_stage(stage, seconds)
+    
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+    
+    def request_finished(self, route: str, method: str, status: int, seconds: float) -> None:
+        self._histogram(self._routes, route).observe(seconds)
+        with self._lock:
+            self.in_flight -= 1
+            key = (route, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+    
+    def render(
+        self,
+        counters: Optional[Dict[str, Tuple[str, float]]] = None,
+        gauges: Optional[Dict[str, Tuple[str, float]]] = None,
+        histograms: Optional[Dict[str, Tuple[str, Histogram]]] = None
+    ) -> str:
+        """Prometheus text exposition of the built-in and the given metrics.
+        
+        counters and gauges map a metric name (without prefix) to (help, value);
+        histograms map a name to (help, Histogram).
+        """
+        lines: List[str] = []
+        
+        def family(name: str, kind: str, help_text: str) -> str:
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+        
+        def histogram_family(name: str, help_text: str, label: Optional[str], hists: Dict[str, Histogram]) -> None:
+            full_name = family(name, "histogram", help_text)
+            for key, hist in sorted(hists.items()):
+                base = [(label, key)] if label else []
+                cumulative, total, count = hist.snapshot()
+                for bound, n in zip(list(hist.buckets) + ["+Inf"], cumulative):
+                    lines.append(f"{full_name}_bucket{_labels(base + [('le', bound)])} {n}")
+                lines.append(f"{full_name}_sum{_labels(base)} {_format_number(total)}")
+                lines.append(f"{full_name}_count{_labels(base)} {count}")
+        
+        with self._lock:
+            stages, routes, requests = dict(self._stages), dict(self._routes), dict(self._requests)
+            in_flight = self.in_flight
+        
+        histogram_family("stage_duration_seconds", "Time spent per search stage.", "stage", stages)
+        histogram_family("http_request_duration_seconds", "HTTP request latency by route.", "route", routes)
+        
+        full_name = family("http_requests_total", "counter", "HTTP requests by route, method and status.")
+        for (route, method, status), n in sorted(requests.items()):
+            lines.append(f"{full_name}{_labels([('route', route), ('method', method), ('status', status)])} {n}")
+        
+        full_name = family("http_requests_in_flight", "gauge", "HTTP requests being handled.")
+        lines.append(f"{full_name} {in_flight}")
+        
+        for name, (help_text, value) in (counters or {}).items():
+            lines.append(f"{family(name, 'counter', help_text)} {_format_number(value)}")
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"{family(name, 'gauge', help_text)} {_format_number(value)}")
+        for name, (help_text, hist) in (histograms or {}).items():
+            histogram_family(name, help_text, None, {"": hist})
+        
+        return "\n".join(lines) + "\n"
+
+# Shared by the engine, the model loader and the API
+metrics = Metrics()
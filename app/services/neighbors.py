@@ -0,0 +1,110 @@
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+def neighbor_dtype(width: int) -> np.dtype:
+    """Record of one image: width neighbour ids (int32, -1 padded) and their float16 scores."""
+    return np.dtype([("ids", "<i4", (width,)), ("scores", "<f2", (width,))])
+
+class NeighborTable:
+    """Precomputed nearest neighbours of every image id, one fixed-width record per id.
+    
+    Record i lists the neighbours of image i best first, so a lookup is a
+    single row read from the memory-mapped .npy file (width * 6 bytes).
+    Rows are only -1 for ids without neighbours (never indexed or deleted).
+    
+    Rows changed at runtime (images added since the build, and the images
+    they became neighbours of) live in an in-memory overlay on top of the
+    read-only file; merged() folds it in when the index is compacted.
+    """
+    
+    def __init__(self, records: np.ndarray):
+        self.records = records
+        self.width = records.dtype["ids"].shape[0]
+        self._overlay: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+    
+    @classmethod
+    def empty(cls, count: int, width: int) -> "NeighborTable":
+        """In-memory table of count ids without neighbours yet."""
+        records = np.zeros(count, dtype=neighbor_dtype(width))
+        records["ids"] = -1
+        return cls(records)
+    
+    @classmethod
+    def load(cls, path: str) -> "NeighborTable":
+        """Memory-map a table written by save()."""
+        return cls(np.load(path, mmap_mode="r"))
+    
+    def save(self, path: str) -> None:
+        """Write the table, overlay included, as a single .npy file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.save(f, self.merged())
+    
+    def __len__(self) -> int:
+        return max(len(self.records), max(self._overlay, default=-1) + 1)
+    
+    def get(self, image_id: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(ids, scores) of an image's neighbours, best first, or None if it has none."""
+        row = self._overlay.get(image_id)
+        if row is None and 0 <= image_id < len(self.records):
+            record = self.records[image_id]
+            row = record["ids"], record["scores"]
+        if row is None or row[0][0] < 0:
+            return None
+        
+        count = int(np.count_nonzero(row[0] >= 0))
+        return row[0][:count], row[1][:count]
+    
+    def set_rows(self, image_ids: np.ndarray, ids: np.ndarray, scores: np.ndarray) -> None:
+        """Replace the rows of image_ids with (n, <= width) neighbour ids and scores."""
+        width = min(self.width, ids.shape[1])
+        for image_id, row_ids, row_scores in zip(image_ids, ids, scores):
+            new_ids = np.full(self.width, -1, dtype=np.int32)
+            new_scores = np.zeros(self.width, dtype=np.float16)
+            new_ids[:width] = row_ids[:width]
+            new_scores[:width] = np.where(row_ids[:width] >= 0, row_scores[:width], 0)
+            # Rows are replaced, never edited, so concurrent readers see old or new
+            self._overlay[int(image_id)] = new_ids, new_scores
+    
+    def insert(self, image_id: int, neighbor_id: int, score: float) -> None:
+        """Add neighbor_id to the row of image_id if it ranks among its top width."""
+        row = self.get(image_id)
+        if row is None or neighbor_id in row[0]:
+            return
+        
+        ids, scores = row
+        if len(ids) == self.width and score <= scores[-1]:
+            return
+        pos = int(np.searchsorted(-scores.astype(np.float32), -score, side="right"))
+        self.set_rows(
+            np.array([image_id]),
+            np.insert(ids, pos, neighbor_id)[None, :self.width],
+            np.insert(scores, pos, score)[None, :self.width]
+        )
+    
+    def clear(self, image_ids: np.ndarray) -> None:
+        """Drop the rows of image_ids (e.g. deleted images)."""
+        self.set_rows(
+            np.asarray(image_ids),
+            np.full((len(image_ids), 1), -1, dtype=np.int32),
+            np.zeros((len(image_ids), 1), dtype=np.float16)
+        )
+    
+    def merged(self) -> np.ndarray:
+        """All records with the overlay applied, grown to cover every id."""
+        records = np.zeros(len(self), dtype=self.records.dtype)
+        records["ids"] = -1
+        records[:len(self.records)] = self.records
+        for image_id, (ids, scores) in list(self._overlay.items()):
+            records["ids"][image_id] = ids
+            records["scores"][image_id] = scores
+        return records
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get table size and the number of rows changed since it was built."""
+        return {
+            "images": len(self),
+            "width": self.width,
+            "updated_rows": len(self._overlay)
+        }
@@ -0,0 +1,67 @@
+import secrets
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.cache import LRUCache
+
+class RankedResults:
+    """Fused ranking of one query, deep enough to be served in pages."""
+    
+    __slots__ = ("query", "enhanced_queries", "image_ids", "scores", "num_matches")
+    
+    def __init__(
+        self,
+        query: str,
+        enhanced_queries: List[str],
+        image_ids: np.ndarray,
+        scores: np.ndarray,
+        num_matches: np.ndarray
+    ):
+        self.query = query
+        self.enhanced_queries = enhanced_queries
+        # Compact dtypes: a 1000-deep ranking takes about 14 KB
+        self.image_ids = np.asarray(image_ids, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.num_matches = np.asarray(num_matches, dtype=np.int16)
+    
+    def __len__(self) -> int:
+        return len(self.image_ids)
+
+class ResultPager:
+    """Rankings of paginated searches, addressed by opaque cursors.
+    
+    A cursor is "<token>.<offset>": the token names a stored ranking and the
+    offset is the next position to serve. Each ranking is kept with the
+    parameters that produced it, so a cursor can be checked against the
+    request that presents it. Rankings are kept per process in an LRU with
+    a TTL; an unknown or expired cursor means the client has to run the
+    search again.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = 900):
+        self._rankings = LRUCache(max_size=max_entries, ttl_seconds=ttl_seconds)
+    
+    def store(self, ranked: RankedResults, params: Dict[str, Any]) -> str:
+        """Keep a ranking with the parameters it was ranked under and return its token."""
+        token = secrets.token_urlsafe(12)
+        self._rankings.put(token, (ranked, params))
+        return token
+    
+    def get(self, token: str) -> Optional[Tuple[RankedResults, Dict[str, Any]]]:
+        """Return (ranking, parameters) for a token, or None if unknown or expired."""
+        return self._rankings.get(token)
+    
+    @staticmethod
+    def cursor(token: str, offset: int) -> str:
+        return f"{token}.{offset}"
+    
+    @staticmethod
+    def parse_cursor(cursor: str) -> Tuple[str, int]:
+        """Split a cursor into (token, offset); raises ValueError if malformed."""
+        token, _, offset = cursor.rpartition(".")
+        if not token or not offset.isdigit():
+            raise ValueError(f"Malformed cursor '{cursor}'")
+        return token, int(offset)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get stored ranking count and lookup counters."""
+        return self._rankings.get_status()
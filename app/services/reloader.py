@@ -0,0 +1,101 @@
+import time
+import threading
+from typing import Any, Dict, Optional
+
+# Searches already holding the old index manager get this long before it is closed
+RETIRE_DELAY_SECONDS = 30.0
+
+class IndexReloader:
+    """Rebuilds the index components in the background and swaps them in atomically.
+    
+    The already-loaded CLIP model is reused. The new index is validated before
+    the swap, and searches already running keep their old snapshot until they
+    finish. With compact=True pending runtime additions/deletions are first
+    folded into new base files.
+    """
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"state": "idle", "stage": None}
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, compact: bool = False) -> bool:
+        """Start a background reload; returns False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            
+            self._status = {
+                "state": "running",
+                "stage": "compacting" if compact else "loading",
+                "compact": compact,
+                "started_at": time.time(),
+                "finished_at": None,
+                "duration_seconds": None,
+                "error": None
+            }
+            self._thread = threading.Thread(
+                target=self._run, args=(compact,), name="index-reloader", daemon=True
+            )
+            self._thread.start()
+            return True
+    
+    def _set_stage(self, stage: str) -> None:
+        with self._lock:
+            self._status["stage"] = stage
+    
+    def _finish(self, state: str, error: Optional[str] = None, **extra) -> None:
+        with self._lock:
+            finished_at = time.time()
+            self._status.update({
+                "state": state,
+                "stage": None,
+                "finished_at": finished_at,
+                "duration_seconds": round(finished_at - self._status["started_at"], 2),
+                "error": error,
+                **extra
+            })
+    
+    def _run(self, compact: bool) -> None:
+        try:
+            print("\nReloading search index in background...")
+            generation = None
+            if compact:
+                # Mutations keep flowing into the log while the new base is written
+                generation = self.engine.index_manager.compact()
+                self._set_stage("loading")
+            
+            # Block mutations (not searches) so none land between load and swap
+            with self.engine.mutation_lock:
+                index_manager = self.engine.load_index_manager(generation)
+                
+                self._set_stage("validating")
+                self.engine.validate_index_manager(index_manager)
+                
+                self._set_stage("swapping")
+                old_manager = self.engine.index_manager
+                version = self.engine.swap_index_manager(index_manager)
+                if generation is not None:
+                    # Only now may the file names move on; the old manager keeps its own files
+                    old_manager.commit_compaction(generation)
+            
+            retire = threading.Timer(RETIRE_DELAY_SECONDS, old_manager.close)
+            retire.daemon = True
+            retire.start()
+            
+            vectors_indexed = index_manager.get_status()["vectors_indexed"]
+            self._finish("succeeded", vectors_indexed=vectors_indexed, loaded_version=version)
+            print(f"Index reload complete: version {version}\n")
+        except Exception as e:
+            self._finish("failed", error=str(e))
+            print(f"Index reload failed: {e}\n")
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get reload progress and the serving index version."""
+        with self._lock:
+            return {**self._status, "index_version": self.engine.index_version}
@@ -0,0 +1,140 @@
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from app.services.cache import LRUCache
+
+# off: no response cache
+# memory: per-process LRU
+# redis: shared across workers (needs the redis package and a server)
+RESPONSE_CACHE_BACKENDS = ("off", "memory", "redis")
+
+class MemoryBackend:
+    """In-process LRU of serialized responses."""
+    
+    shared = False
+    
+    def __init__(self, max_size: int = 4096, ttl_seconds: Optional[float] = None):
+        self._cache = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+    
+    def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+    
+    def set(self, key: str, value: bytes) -> None:
+        self._cache.put(key, value)
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {"size": len(self._cache), "max_size": self._cache.max_size}
+
+class RedisBackend:
+    """Shared store behind a Redis-style client.
+    
+    Any object with get(key) and set(key, value, ex=seconds) works as the
+    client, so tests can pass a local stand-in (e.g. fakeredis.FakeRedis).
+    Calls block on the network, so callers run them off the event loop.
+    """
+    
+    shared = True
+    
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl_seconds: Optional[float] = None, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis response cache backend needs the redis package (pip install redis)")
+            client = redis.Redis.from_url(url, socket_timeout=0.05)
+        self.client = client
+        self.url = url
+        self.ttl_seconds = int(ttl_seconds) if ttl_seconds and ttl_seconds > 0 else None
+    
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+    
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(key, value, ex=self.ttl_seconds)
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {"url": self.url}
+
+class ResponseCache:
+    """Whole-response cache for /search keyed by request fields and index generation.
+    
+    The generation identifies the index state that produced a response (see
+    SearchEngine.index_generation), so a reload or a runtime change moves all
+    lookups to fresh keys and old entries simply age out. Backend errors count
+    as misses; the cache must never fail a search.
+    """
+    
+    def __init__(self, backend, prefix: str = "vss:search"):
+        self.backend = backend
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+    
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+    
+    def key(self, generation: str, fields: Dict[str, Any]) -> str:
+        """Cache key of a request: generation plus a digest of its fields."""
+        digest = hashlib.sha1(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{generation}:{digest}"
+    
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Response cache get failed: {e}")
+            value = None
+            with self._lock:
+                self.errors += 1
+        
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+    
+    def put(self, key: str, value: bytes) -> None:
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            print(f"Response cache set failed: {e}")
+            with self._lock:
+                self.errors += 1
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get backend info and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            **self.backend.get_status(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+def create_response_cache(
+    backend: str,
+    max_size: int = 4096,
+    ttl_seconds: Optional[float] = None,
+    url: str = "redis://localhost:6379/0",
+    client=None
+) -> Optional[ResponseCache]:
+    """Create the configured response cache, or None when it is off.
+    
+    client replaces the connection the redis backend would open to url:
+    a preconfigured redis.Redis, or a local stand-in for checks.
+    """
+    if backend not in RESPONSE_CACHE_BACKENDS:
+        raise ValueError(f"Unknown response cache backend '{backend}', expected one of {RESPONSE_CACHE_BACKENDS}")
+    
+    if backend == "off" or (backend == "memory" and max_size <= 0):
+        return None
+    if backend == "memory":
+        return ResponseCache(MemoryBackend(max_size, ttl_seconds))
+    return ResponseCache(RedisBackend(url, ttl_seconds, client=client))
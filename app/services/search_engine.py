@@ -1,16 +1,104 @@
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from PIL import Image
+from typing import Dict, List, Any, Optional, Tuple
 from app.models.clip_loader import CLIPModelLoader
+from app.services.attributes import filter_key
+from app.services.batcher import EncodingBatcher
+from app.services.duplicates import DuplicateGroups
 from app.services.indexer import FAISSIndexManager
+from app.services.metrics import StageTimer, metrics
+from app.services.pagination import RankedResults
+from app.services.shards import create_index_manager
+from app.services.thumbnails import thumbnail_url
+
+def fuse_results(
+    scores: np.ndarray,
+    image_ids: np.ndarray,
+    weights: np.ndarray,
+    top_k: int,
+    threshold: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fuse (n_queries, k) hits into ranked (image_ids, scores, num_matches).
+    
+    Each query row's scores are scaled by its weight. Per image:
+    final = (0.7 * max + 0.3 * mean) * (1 + 0.1 * (matches - 1)).
+    Images below threshold are dropped and the top_k are returned best first.
+    """
+    flat_ids = image_ids.ravel()
+    flat_scores = (scores.astype(np.float64) * weights[:, None]).ravel()
+    valid = flat_ids >= 0
+    flat_ids, flat_scores = flat_ids[valid], flat_scores[valid]
+    
+    if not len(flat_ids):
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty, empty.astype(np.int64)
+    
+    unique_ids, inverse = np.unique(flat_ids, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique_ids))
+    sums = np.bincount(inverse, weights=flat_scores, minlength=len(unique_ids))
+    maxes = np.full(len(unique_ids), -np.inf)
+    np.maximum.at(maxes, inverse, flat_scores)
+    
+    match_bonus = 1.0 + (counts - 1) * 0.1
+    final = (maxes * 0.7 + (sums / counts) * 0.3) * match_bonus
+    
+    keep = np.flatnonzero(final >= threshold)
+    if len(keep) > top_k:
+        keep = keep[np.argpartition(-final[keep], top_k - 1)[:top_k]]
+    keep = keep[np.argsort(-final[keep], kind="stable")]
+    return unique_ids[keep], final[keep], counts[keep]
+
+def collapse_groups(
+    duplicates: DuplicateGroups,
+    top_k: int,
+    *ranked: np.ndarray
+) -> Tuple[np.ndarray, ...]:
+    """Keep the best hit of each near-duplicate group in ranked (ids first) arrays, then the top_k."""
+    keep = np.flatnonzero(duplicates.first_of_groups(ranked[0]))[:top_k]
+    return tuple(array[keep] for array in ranked)
 
 class SearchEngine:
     """Production search engine with query enhancement."""
     
-    def __init__(self, device: str = "cuda"):
-        self.clip_loader = CLIPModelLoader(device=device)
-        self.index_manager = FAISSIndexManager()
+    def __init__(
+        self,
+        device: str = "cuda",
+        text_cache_size: int = 2048,
+        text_cache_ttl: Optional[float] = None,
+        model_cache_path: Optional[str] = None,
+        text_backend: str = "torch",
+        text_backend_path: Optional[str] = None,
+        text_stub_dim: int = 512,
+        encode_batching: bool = False,
+        encode_max_batch_size: int = 32,
+        encode_max_wait_us: int = 2000,
+        index_options: Optional[Dict[str, Any]] = None
+    ):
+        self.clip_loader = CLIPModelLoader(
+            device=device,
+            text_cache_size=text_cache_size,
+            text_cache_ttl=text_cache_ttl,
+            model_cache_path=model_cache_path,
+            text_backend=text_backend,
+            text_backend_path=text_backend_path,
+            text_stub_dim=text_stub_dim
+        )
+        self.index_options = index_options or {}
+        self.index_manager = create_index_manager(self.index_options)
+        self.index_version = 1
+        # Fingerprint of the data behind index_manager; keys the response cache
+        self.index_generation = ""
+        # Serializes index swaps and runtime mutations (searches never take it)
+        self.mutation_lock = threading.RLock()
+        self.batcher = EncodingBatcher(
+            self.clip_loader.forward_texts,
+            max_batch_size=encode_max_batch_size,
+            max_wait_us=encode_max_wait_us
+        ) if encode_batching else None
         self.query_enhancements = {
             "horse": "a horse animal standing in field or stable",
             "person": "a person standing or walking",
@@ -25,14 +113,53 @@ class SearchEngine:
         }
     
     @classmethod
-    def load_from_disk(cls, device: str = "cuda") -> "SearchEngine":
-        """Load search engine with all components."""
-        engine = cls(device=device)
-        engine.clip_loader.load()
-        engine.index_manager.load_from_disk()
+    def load_from_disk(cls, device: str = "cuda", warmup: bool = True, **kwargs) -> "SearchEngine":
+        """Load search engine with all components (model and index in parallel)."""
+        engine = cls(device=device, **kwargs)
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="engine-loader") as pool:
+            model_future = pool.submit(engine.clip_loader.load)
+            index_future = pool.submit(engine.index_manager.load_from_disk)
+            model_future.result()
+            index_future.result()
+        engine.index_generation = engine.index_manager.fingerprint()
+        
+        if engine.batcher is not None:
+            engine.batcher.start()
+        if warmup:
+            engine.warmup()
         print("Search engine initialized successfully")
         return engine
     
+    def warmup(self) -> float:
+        """Pre-encode the enhancement prompts and run one search; returns elapsed ms.
+        
+        Fills the text cache for the enhanced keywords and pays one-off costs
+        (kernel selection, first index scan) before real traffic arrives.
+        """
+        start_time = time.time()
+        texts = []
+        for keyword in self.query_enhancements:
+            texts.extend(self.enhance_query(keyword))
+        
+        query_np = self.clip_loader.encode_texts(texts).cpu().numpy()
+        self.index_manager.search(query_np[:1], top_k=1)
+        
+        warmup_ms = (time.time() - start_time) * 1000
+        print(f"Warmup encoded {len(texts)} prompts in {warmup_ms:.0f}ms")
+        return warmup_ms
+    
+    def encode_queries(self, texts: List[str], timer: Optional[StageTimer] = None) -> np.ndarray:
+        """Encode query texts to an (n, d) float32 matrix via cache and batcher."""
+        batch_encoder = self.batcher.encode if self.batcher is not None else None
+        features = self.clip_loader.encode_texts(texts, batch_encoder=batch_encoder)
+        if timer is not None:
+            timer.mark("encode")
+        
+        query_np = features.cpu().numpy()
+        if timer is not None:
+            timer.mark("to_cpu")
+        return query_np
+    
     def enhance_query(self, query: str, use_enhancement: bool = True) -> List[str]:
         """Enhance query for better matching."""
         if not use_enhancement:
@@ -54,71 +181,406 @@ class SearchEngine:
         query: str, 
         top_k: int = 5, 
         threshold: float = 0.2,
-        use_enhancement: bool = True
+        use_enhancement: bool = True,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        timer: Optional[StageTimer] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        collapse_duplicates: bool = False
     ) -> Tuple[List[Dict[str, Any]], float]:
-        """Execute semantic search with query enhancement."""
+        """Execute semantic search with query enhancement.
+        
+        Returns (results, search_time_ms); see search_with_coverage for the
+        shards a sharded index had to leave out.
+        """
+        results, search_time, _ = self.search_with_coverage(
+            query, top_k, threshold, use_enhancement, nprobe, ef_search, timer, filters, collapse_duplicates
+        )
+        return results, search_time
+    
+    def search_with_coverage(
+        self,
+        query: str,
+        top_k: int = 5,
+        threshold: float = 0.2,
+        use_enhancement: bool = True,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        timer: Optional[StageTimer] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        collapse_duplicates: bool = False
+    ) -> Tuple[List[Dict[str, Any]], float, List[str]]:
+        """search() plus the shards that timed out or failed during it.
+        
+        Stage durations (queue_wait, enhance, encode, to_cpu, index_search,
+        fusion, metadata) are recorded in timer, or in a private one, and
+        reported to the process metrics. filters restrict the index scan to
+        images whose attributes match (see AttributeStore.mask).
+        collapse_duplicates keeps only the best hit of each near-duplicate
+        group (scripts/find_duplicates.py); without a groups file it is a no-op.
+        """
         start_time = time.time()
+        if timer is None:
+            timer = StageTimer()
+        else:
+            # The caller started the timer when the request was queued
+            timer.mark("queue_wait")
+        
+        # Pin the current index snapshot so a concurrent reload cannot swap it mid-search
+        index_manager = self.index_manager
         
         enhanced_queries = self.enhance_query(query, use_enhancement)
-        all_results = {}
-        
-        for i, enhanced_query in enumerate(enhanced_queries):
-            try:
-                query_emb = self.clip_loader.encode_text(enhanced_query)
-                query_np = query_emb.cpu().numpy()
-                
-                scores, indices = self.index_manager.search(query_np, top_k)
-                weight = 1.0 - (i * 0.15)
-                
-                for rank, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                    if idx >= 0 and idx < len(self.index_manager.valid_indices):
-                        image_idx = int(self.index_manager.valid_indices[idx])
-                        weighted_score = float(score) * weight
-                        
-                        if image_idx not in all_results:
-                            all_results[image_idx] = {
-                                'scores': [weighted_score],
-                                'original_score': float(score),
-                                'ranks': [rank]
-                            }
-                        else:
-                            all_results[image_idx]['scores'].append(weighted_score)
-                            all_results[image_idx]['ranks'].append(rank)
-            
-            except Exception as e:
-                print(f"Error with query '{enhanced_query}': {e}")
-                continue
-        
-        final_results = []
-        for image_idx, data in all_results.items():
-            max_score = max(data['scores'])
-            avg_score = np.mean(data['scores'])
-            num_matches = len(data['scores'])
+        timer.mark("enhance")
+        
+        # One batched forward pass and one multi-row index search for all prompts
+        query_np = self.encode_queries(enhanced_queries, timer)
+        scores, image_ids = index_manager.search(
+            query_np, top_k, nprobe=nprobe, ef_search=ef_search, filters=filters
+        )
+        timer.mark("index_search")
+        
+        weights = 1.0 - np.arange(len(enhanced_queries)) * 0.15
+        final_results = self._rank(
+            index_manager, scores, image_ids, weights, top_k, threshold, timer, collapse_duplicates
+        )
+        metrics.observe_stages(timer)
+        
+        search_time = (time.time() - start_time) * 1000
+        # Read from the pinned manager, on this thread: a swap may have replaced self.index_manager
+        return final_results, search_time, index_manager.missing_shards()
+    
+    def search_ranked(
+        self,
+        query: str,
+        depth: int = 1000,
+        threshold: float = 0.2,
+        use_enhancement: bool = True,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        timer: Optional[StageTimer] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        collapse_duplicates: bool = False
+    ) -> RankedResults:
+        """Rank up to depth images for a query, fused as search() does, for paging."""
+        if timer is None:
+            timer = StageTimer()
+        else:
+            timer.mark("queue_wait")
+        
+        index_manager = self.index_manager
+        enhanced_queries = self.enhance_query(query, use_enhancement)
+        timer.mark("enhance")
+        
+        query_np = self.encode_queries(enhanced_queries, timer)
+        # The index returns 3x the requested k per prompt, so this gives depth candidates each
+        scores, image_ids = index_manager.search(
+            query_np, -(-depth // 3), nprobe=nprobe, ef_search=ef_search, filters=filters
+        )
+        timer.mark("index_search")
+        
+        weights = 1.0 - np.arange(len(enhanced_queries)) * 0.15
+        duplicates = index_manager.duplicates if collapse_duplicates else None
+        ranked = fuse_results(scores, image_ids, weights, depth if duplicates is None else image_ids.size, threshold)
+        if duplicates is not None:
+            ranked = collapse_groups(duplicates, depth, *ranked)
+        fused_ids, fused_scores, num_matches = ranked
+        timer.mark("fusion")
+        metrics.observe_stages(timer)
+        return RankedResults(query, enhanced_queries, fused_ids, fused_scores, num_matches)
+    
+    def page(self, ranked: RankedResults, offset: int, count: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Results from position offset of a ranking; returns (results, next offset).
+        
+        Images deleted since the ranking was made are skipped. Ranks are
+        positions in the full ranking, so they continue across pages.
+        """
+        index_manager = self.index_manager
+        positions = []
+        pos = offset
+        while pos < len(ranked) and len(positions) < count:
+            if index_manager.get_image_info(int(ranked.image_ids[pos])) is not None:
+                positions.append(pos)
+            pos += 1
+        
+        positions = np.asarray(positions, dtype=np.int64)
+        results = self._build_results(
+            index_manager, ranked.image_ids[positions], ranked.scores[positions], ranked.num_matches[positions]
+        )
+        for result, position in zip(results, positions):
+            result["rank"] = int(position) + 1
+        return results, pos
+    
+    def search_batch(
+        self,
+        requests: List[Dict[str, Any]]
+    ) -> Tuple[List[Tuple[List[str], List[Dict[str, Any]]]], float]:
+        """Run many searches with one encode pass and one index search per parameter group.
+        
+        Each request is a dict with the SearchRequest fields. Returns one
+        (enhanced_queries, results) pair per request, in order, and the total time.
+        Every request is ranked exactly as search() would rank it.
+        """
+        start_time = time.time()
+        index_manager = self.index_manager
+        
+        enhanced = [
+            self.enhance_query(request["query"], request.get("use_enhancement", True))
+            for request in requests
+        ]
+        offsets = np.cumsum([0] + [len(queries) for queries in enhanced])
+        
+        # The request is already a batch, so skip the micro-batcher and do a single pass
+        texts = [text for queries in enhanced for text in queries]
+        query_np = self.clip_loader.encode_texts(texts).cpu().numpy()
+        
+        # Requests can only share an index search when their depth, search knobs
+        # and filters agree: cutting a deeper search down is not the same search
+        # for IVF/HNSW (wider beams) or rerank (more candidates rescored)
+        groups: Dict[Tuple[int, Optional[int], Optional[int], str], List[int]] = {}
+        for i, request in enumerate(requests):
+            key = (
+                request.get("top_k", 5), request.get("nprobe"), request.get("ef_search"),
+                filter_key(request.get("filters"))
+            )
+            groups.setdefault(key, []).append(i)
+        
+        outputs: List[Tuple[List[str], List[Dict[str, Any]]]] = [None] * len(requests)
+        for (top_k, nprobe, ef_search, _), members in groups.items():
+            rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in members])
+            scores, image_ids = index_manager.search(
+                query_np[rows], top_k, nprobe=nprobe, ef_search=ef_search,
+                filters=requests[members[0]].get("filters")
+            )
             
-            match_bonus = 1.0 + (num_matches - 1) * 0.1
-            final_score = (max_score * 0.7 + avg_score * 0.3) * match_bonus
+            pos = 0
+            for i in members:
+                n = len(enhanced[i])
+                weights = 1.0 - np.arange(n) * 0.15
+                results = self._rank(
+                    index_manager, scores[pos:pos + n], image_ids[pos:pos + n],
+                    weights, top_k, requests[i].get("threshold", 0.2),
+                    collapse_duplicates=requests[i].get("collapse_duplicates", False)
+                )
+                outputs[i] = (enhanced[i], results)
+                pos += n
+        
+        return outputs, (time.time() - start_time) * 1000
+    
+    def search_similar(
+        self,
+        image_id: Optional[int] = None,
+        filename: Optional[str] = None,
+        top_k: int = 5,
+        threshold: float = 0.2,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        collapse_duplicates: bool = False
+    ) -> Tuple[List[Dict[str, Any]], float, Dict[str, Any]]:
+        """"More like this": search with an indexed image's stored vector (no model pass).
+        
+        Raises KeyError if the image is not in the index. The source image itself
+        is excluded from the results; with collapse_duplicates so are its near-duplicates.
+        """
+        start_time = time.time()
+        index_manager = self.index_manager
+        
+        if image_id is None:
+            image_id = index_manager.find_image_id(filename)
+        vector = index_manager.get_vector(image_id) if image_id is not None else None
+        if vector is None:
+            raise KeyError(f"Image not indexed: {filename if filename is not None else image_id}")
+        
+        scores, image_ids = index_manager.search(
+            vector, top_k, nprobe=nprobe, ef_search=ef_search, filters=filters
+        )
+        duplicates = index_manager.duplicates if collapse_duplicates else None
+        source_ids = duplicates.group(image_id) if duplicates is not None else [image_id]
+        image_ids = np.where(np.isin(image_ids, source_ids), -1, image_ids)
+        results = self._rank(
+            index_manager, scores, image_ids, np.ones(1), top_k, threshold,
+            collapse_duplicates=collapse_duplicates
+        )
+        
+        info = index_manager.get_image_info(image_id)
+        source = {"image_idx": int(image_id), "filename": info[0] if info else ""}
+        return results, (time.time() - start_time) * 1000, source
+    
+    def related_images(
+        self,
+        image_id: int,
+        top_k: int = 5,
+        collapse_duplicates: bool = False
+    ) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """Related images of an indexed image, read from the precomputed neighbour table.
+        
+        One table row plus metadata for the results: no model pass and no
+        index search. Deleted neighbours are skipped. Raises KeyError if the
+        image is not indexed and returns None if the table has no row for it
+        (e.g. none was built), so the caller can fall back to search_similar().
+        """
+        start_time = time.time()
+        index_manager = self.index_manager
+        if index_manager.get_image_info(image_id) is None:
+            raise KeyError(f"Image not indexed: {image_id}")
+        
+        row = index_manager.neighbors.get(image_id) if index_manager.neighbors is not None else None
+        if row is None:
+            return None
+        
+        image_ids = row[0].astype(np.int64)
+        scores = row[1].astype(np.float64)
+        keep = np.array([index_manager.get_image_info(int(i)) is not None for i in image_ids], dtype=bool)
+        duplicates = index_manager.duplicates if collapse_duplicates else None
+        if duplicates is not None:
+            keep &= duplicates.first_of_groups(image_ids) & ~np.isin(image_ids, duplicates.group(image_id))
+        
+        image_ids, scores = image_ids[keep][:top_k], scores[keep][:top_k]
+        results = self._build_results(index_manager, image_ids, scores, np.ones(len(image_ids), dtype=np.int64))
+        return results, (time.time() - start_time) * 1000
+    
+    def search_by_image(
+        self,
+        image: Image.Image,
+        top_k: int = 5,
+        threshold: float = 0.2,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """Search with a new (uploaded) image encoded on the fly."""
+        start_time = time.time()
+        index_manager = self.index_manager
+        
+        query_np = self.clip_loader.encode_images([image.convert("RGB")]).cpu().numpy()
+        scores, image_ids = index_manager.search(
+            query_np, top_k, nprobe=nprobe, ef_search=ef_search
+        )
+        results = self._rank(index_manager, scores, image_ids, np.ones(1), top_k, threshold)
+        return results, (time.time() - start_time) * 1000
+    
+    def _rank(
+        self,
+        index_manager: FAISSIndexManager,
+        scores: np.ndarray,
+        image_ids: np.ndarray,
+        weights: np.ndarray,
+        top_k: int,
+        threshold: float,
+        timer: Optional[StageTimer] = None,
+        collapse_duplicates: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Shared ranking for all search modes: fuse, threshold, top-k, build results.
+        
+        When collapsing, every candidate is fused first so the hits a group
+        gives up make room for the next distinct images.
+        """
+        duplicates = index_manager.duplicates if collapse_duplicates else None
+        fused_ids, fused_scores, num_matches = fuse_results(
+            scores, image_ids, weights, top_k if duplicates is None else image_ids.size, threshold
+        )
+        if duplicates is not None:
+            fused_ids, fused_scores, num_matches = collapse_groups(
+                duplicates, top_k, fused_ids, fused_scores, num_matches
+            )
+        if timer is not None:
+            timer.mark("fusion")
+        
+        results = self._build_results(index_manager, fused_ids, fused_scores, num_matches)
+        if timer is not None:
+            timer.mark("metadata")
+        return results
+    
+    @staticmethod
+    def _build_results(
+        index_manager: FAISSIndexManager,
+        image_ids: np.ndarray,
+        scores: np.ndarray,
+        num_matches: np.ndarray
+    ) -> List[Dict[str, Any]]:
+        """Resolve metadata and build result dicts for ranked survivors only."""
+        results = []
+        for rank, (image_idx, final_score, matches) in enumerate(zip(image_ids, scores, num_matches)):
+            image_idx = int(image_idx)
+            final_score = float(final_score)
+            info = index_manager.get_image_info(image_idx)
+            filename, image_url = info if info else (f"img_{image_idx:05d}.jpg", "")
             
-            if final_score >= threshold:
-                image_path = self.index_manager.get_image_path(image_idx)
-                filename = Path(image_path).name if image_path else f"img_{image_idx:05d}.jpg"
-                
-                final_results.append({
-                    'rank': 0,
-                    'image_idx': image_idx,
-                    'filename': filename,
-                    'image_path': image_path,
-                    'similarity_score': final_score,
-                    'confidence_percentage': f"{final_score*100:.1f}%",
-                    'num_query_matches': num_matches,
-                    'path': image_path
-                })
-        
-        final_results.sort(key=lambda x: x['similarity_score'], reverse=True)
-        for i, result in enumerate(final_results[:top_k]):
-            result['rank'] = i + 1
+            results.append({
+                'rank': rank + 1,
+                'image_idx': image_idx,
+                'filename': filename,
+                'image_path': image_url,
+                'thumbnail_url': thumbnail_url(filename) if info else "",
+                'similarity_score': final_score,
+                'confidence_percentage': f"{final_score*100:.1f}%",
+                'num_query_matches': int(matches)
+            })
+        return results
+    
+    def load_index_manager(self, generation: Optional[int] = None) -> FAISSIndexManager:
+        """Load a fresh copy of the index components with the engine's options.
         
-        search_time = (time.time() - start_time) * 1000
-        return final_results[:top_k], search_time
+        generation loads a compacted base before its files are switched to.
+        """
+        index_manager = create_index_manager(self.index_options)
+        if generation is None:
+            index_manager.load_from_disk()
+        else:
+            index_manager.load_from_disk(generation=generation)
+        return index_manager
+    
+    def validate_index_manager(self, index_manager: FAISSIndexManager) -> None:
+        """Check a freshly loaded index before it may serve traffic."""
+        index_manager.check_loaded()
+        
+        # The index must match the loaded CLIP model's embedding size
+        query_np = self.encode_queries(["a photo"])
+        if query_np.shape[1] != index_manager.embedding_dim:
+            raise ValueError(
+                f"Dimension mismatch: index has {index_manager.embedding_dim}, "
+                f"model produces {query_np.shape[1]}"
+            )
+        
+        # Sanity query: the new index must return resolvable images
+        _, image_ids = index_manager.search(query_np, top_k=1)
+        image_idx = int(image_ids[0][0])
+        if image_idx < 0 or index_manager.get_image_info(image_idx) is None:
+            raise ValueError("Sanity query returned no resolvable image")
+    
+    def swap_index_manager(self, index_manager: FAISSIndexManager) -> int:
+        """Atomically replace the serving index and return the new index version."""
+        with self.mutation_lock:
+            self.index_manager = index_manager
+            self.index_version += 1
+            self.index_generation = index_manager.fingerprint()
+            return self.index_version
+    
+    def add_images(self, image_paths: List[str]) -> List[int]:
+        """Encode image files and insert them into the live index; returns their ids."""
+        images = [Image.open(path).convert("RGB") for path in image_paths]
+        vectors = self.clip_loader.encode_images(images).cpu().numpy()
+        filenames = [Path(path).name for path in image_paths]
+        
+        with self.mutation_lock:
+            image_ids = self.index_manager.add_vectors(vectors, filenames)
+            self.index_version += 1
+            self.index_generation = self.index_manager.fingerprint()
+        return [int(i) for i in image_ids]
+    
+    def delete_images(self, image_ids: List[int]) -> List[int]:
+        """Remove images from the live index; returns the ids that existed."""
+        with self.mutation_lock:
+            deleted = self.index_manager.delete_ids(image_ids)
+            if len(deleted):
+                self.index_version += 1
+                self.index_generation = self.index_manager.fingerprint()
+        return [int(i) for i in deleted]
+    
+    def close(self) -> None:
+        """Stop background workers."""
+        if self.batcher is not None:
+            self.batcher.stop()
+        self.index_manager.close()
     
     def get_status(self) -> Dict[str, Any]:
         """Get search engine status."""
@@ -126,5 +588,10 @@ class SearchEngine:
         return {
             "device": self.clip_loader.device,
             "model": self.clip_loader.model_name,
+            "index_version": self.index_version,
+            "index_generation": self.index_generation,
+            "text_encoder": self.clip_loader.text_encoder.backend if self.clip_loader.text_encoder else None,
+            "text_cache": self.clip_loader.text_cache.get_status(),
+            "encode_batcher": self.batcher.get_status() if self.batcher else {"enabled": False},
             **idx_status
         }
@@ -0,0 +1,494 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
+import faiss
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.duplicates import DuplicateGroups
+from app.services.indexer import FAISSIndexManager, ReadOnlyIndexError, files_fingerprint, merge_topk
+from app.services.metadata_store import MetadataStore
+from app.services.neighbors import NeighborTable
+
+# local: every shard is searched on its own thread in this process
+# process: every shard lives in a worker process and is searched over a pipe
+SHARD_MODES = ("local", "process")
+
+# Manager methods a shard answers (the worker process rejects anything else)
+SHARD_METHODS = ("search", "get_vector", "get_status")
+
+# Options that select sharding; everything else configures each shard's index manager
+SHARD_OPTIONS = ("shard_dir", "shard_mode", "shard_timeout_ms", "shard_concurrency")
+
+def list_shards(shard_dir: str) -> List[Path]:
+    """Shard directories (shard_000, shard_001, ...) under shard_dir, in order."""
+    root = Path(shard_dir)
+    if not root.is_dir():
+        return []
+    return sorted(path for path in root.glob("shard_*") if path.is_dir())
+
+def shard_paths(
+    directory: Path,
+    metadata_path: str,
+    metadata_store_path: str,
+    attributes_path: str = "data/attributes.npz"
+) -> Dict[str, str]:
+    """load_from_disk arguments for one shard; metadata and attributes are shared by all shards."""
+    return {
+        "embeddings_path": str(directory / "clip_embeddings_optimized.npy"),
+        "faiss_index_path": str(directory / "faiss_index.bin"),
+        "indices_path": str(directory / "valid_indices.npy"),
+        "metadata_path": metadata_path,
+        "metadata_store_path": metadata_store_path,
+        "attributes_path": attributes_path,
+        # Duplicate groups and neighbour tables are global, so only the sharded manager reads them
+        "duplicates_path": str(directory / "duplicate_groups.npz"),
+        "neighbors_path": str(directory / "neighbors.npy")
+    }
+
+def create_index_manager(options: Dict[str, Any]):
+    """FAISSIndexManager, or ShardedIndexManager when the options name a shard_dir."""
+    if options.get("shard_dir"):
+        return ShardedIndexManager(**options)
+    return FAISSIndexManager(**{k: v for k, v in options.items() if k not in SHARD_OPTIONS})
+
+class ShardCall(Future):
+    """Future of one shard call that also records when the shard began running it."""
+    
+    def __init__(self):
+        super().__init__()
+        self.started_at: Optional[float] = None
+        self._started = threading.Event()
+        # A call that fails before it starts must not keep its caller waiting
+        self.add_done_callback(lambda _: self._started.set())
+    
+    def mark_started(self) -> None:
+        self.started_at = time.perf_counter()
+        self._started.set()
+    
+    def wait_started(self, timeout: float) -> bool:
+        return self._started.wait(timeout)
+
+def _serve_shard(
+    conn,
+    index_options: Dict[str, Any],
+    paths: Dict[str, str],
+    omp_threads: int,
+    concurrency: int = 1
+) -> None:
+    """Worker process loop: load one shard, then answer (call_id, method, args) messages.
+    
+    Calls run on concurrency threads; each sends (call_id, None, None) when it
+    starts and (call_id, ok, result) when it is done.
+    """
+    faiss.omp_set_num_threads(omp_threads)
+    try:
+        manager = FAISSIndexManager(**index_options)
+        manager.load_from_disk(**paths)
+    except Exception as e:
+        conn.send(("failed", str(e)))
+        return
+    conn.send(("ready", None))
+    
+    send_lock = threading.Lock()
+    
+    def send(message) -> None:
+        with send_lock:
+            conn.send(message)
+    
+    def run(call_id: int, method: str, args) -> None:
+        send((call_id, None, None))
+        try:
+            if method not in SHARD_METHODS:
+                raise ValueError(f"Unknown shard method '{method}'")
+            send((call_id, True, getattr(manager, method)(*args)))
+        except Exception as e:
+            send((call_id, False, str(e)))
+    
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="shard-call")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            message = None
+        if message is None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            return
+        pool.submit(run, *message)
+
+class LocalShard:
+    """Shard loaded in this process; calls run on up to concurrency threads of its own.
+    
+    FAISS releases the GIL while scanning, so shards scan on separate cores.
+    """
+    
+    def __init__(self, name: str, index_options: Dict[str, Any], paths: Dict[str, str], concurrency: int = 1):
+        self.name = name
+        self.paths = paths
+        self.manager = FAISSIndexManager(**index_options)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"shard-{name}")
+    
+    def start(self) -> None:
+        self.manager.load_from_disk(**self.paths)
+    
+    def call(self, method: str, *args) -> ShardCall:
+        future = ShardCall()
+        self._pool.submit(self._run, future, method, args)
+        return future
+    
+    def _run(self, future: ShardCall, method: str, args) -> None:
+        # Calls the caller gave up on while queued are skipped
+        if not future.set_running_or_notify_cancel():
+            return
+        future.mark_started()
+        try:
+            future.set_result(getattr(self.manager, method)(*args))
+        except Exception as e:
+            future.set_exception(e)
+    
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+class ProcessShard:
+    """Shard served by a worker process.
+    
+    Calls are multiplexed over one pipe: each gets an id and a future, and a
+    reader thread resolves futures as replies arrive. The worker runs up to
+    concurrency calls at once. Replies to calls the caller has given up on
+    are dropped.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        index_options: Dict[str, Any],
+        paths: Dict[str, str],
+        omp_threads: int = 1,
+        concurrency: int = 1
+    ):
+        self.name = name
+        # spawn: never fork a parent that already runs torch/OpenMP threads
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_serve_shard,
+            args=(child_conn, index_options, paths, omp_threads, concurrency),
+            name=f"shard-{name}",
+            daemon=True
+        )
+        self._lock = threading.Lock()
+        self._pending: Dict[int, ShardCall] = {}
+        self._next_call = 0
+        self._reader: Optional[threading.Thread] = None
+    
+    def launch(self) -> None:
+        """Start the worker process (loading happens there)."""
+        self._process.start()
+    
+    def start(self) -> None:
+        """Wait until the worker has loaded its shard."""
+        try:
+            state, error = self._conn.recv()
+        except EOFError:
+            state, error = "failed", f"worker exited with code {self._process.exitcode}"
+        if state != "ready":
+            raise RuntimeError(f"Shard {self.name} failed to load: {error}")
+        
+        self._reader = threading.Thread(target=self._read_replies, name=f"shard-{self.name}-reader", daemon=True)
+        self._reader.start()
+    
+    def call(self, method: str, *args) -> ShardCall:
+        future = ShardCall()
+        with self._lock:
+            call_id = self._next_call
+            self._next_call += 1
+            self._pending[call_id] = future
+            try:
+                self._conn.send((call_id, method, args))
+            except (OSError, ValueError) as e:
+                del self._pending[call_id]
+                future.set_exception(RuntimeError(f"Shard {self.name} unavailable: {e}"))
+        return future
+    
+    def _read_replies(self) -> None:
+        while True:
+            try:
+                call_id, ok, payload = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            
+            with self._lock:
+                future = self._pending.get(call_id) if ok is None else self._pending.pop(call_id, None)
+            if future is None:
+                continue
+            if ok is None:
+                future.mark_started()
+                continue
+            try:
+                if ok:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(f"Shard {self.name}: {payload}"))
+            except InvalidStateError:
+                # The caller timed out and cancelled the call
+                pass
+        
+        # Worker gone: fail whatever is still waiting
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.cancelled():
+                future.set_exception(RuntimeError(f"Shard {self.name} worker exited"))
+    
+    def close(self) -> None:
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+
+class ShardedIndexManager:
+    """Scatter-gather search over a corpus split into index shards.
+    
+    Each shard directory holds its own FAISS index, valid_indices and
+    embeddings (scripts/build_shards.py writes them); image ids and the
+    metadata store are global. A query goes to every shard at once, each
+    shard returns its own top candidates and the lists are merged, so a flat
+    index gives exactly the monolithic results. Shards that miss the timeout
+    or fail are left out of that query's results and counted in the status.
+    
+    Each shard runs up to shard_concurrency calls at once, and the timeout
+    counts from when a shard starts a call; a call still queued behind
+    others after the timeout is dropped as well.
+    
+    Shards are rebuilt offline, so the index is read-only: runtime add/delete
+    and compaction raise ReadOnlyIndexError.
+    """
+    
+    read_only = True
+    
+    def __init__(
+        self,
+        shard_dir: str = "data/shards",
+        shard_mode: str = "local",
+        shard_timeout_ms: float = 1000,
+        shard_concurrency: int = 1,
+        **index_options
+    ):
+        if shard_mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode '{shard_mode}', expected one of {SHARD_MODES}")
+        
+        self.shard_dir = shard_dir
+        self.shard_mode = shard_mode
+        self.timeout = shard_timeout_ms / 1000
+        self.concurrency = max(1, int(shard_concurrency))
+        self.index_options = index_options
+        self.shards: List[Any] = []
+        self.metadata: Optional[MetadataStore] = None
+        self.duplicates: Optional[DuplicateGroups] = None
+        self.neighbors: Optional[NeighborTable] = None
+        self.data_files: List[str] = []
+        self.embedding_dim = 0
+        self._shard_status: List[Dict[str, Any]] = []
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._counter_lock = threading.Lock()
+        # Shards left out of each thread's last search
+        self._local = threading.local()
+    
+    def load_from_disk(
+        self,
+        metadata_path: str = "data/embedding_metadata.json",
+        metadata_store_path: str = "data/metadata.bin",
+        attributes_path: str = "data/attributes.npz",
+        duplicates_path: str = "data/duplicate_groups.npz",
+        neighbors_path: str = "data/neighbors.npy"
+    ) -> None:
+        """Start and load all shards in parallel."""
+        directories = list_shards(self.shard_dir)
+        if not directories:
+            raise ValueError(f"No shards found in {self.shard_dir}")
+        print(f"Loading {len(directories)} shards ({self.shard_mode})...")
+        
+        for directory in directories:
+            options = {**self.index_options, "delta_dir": str(directory / "index_deltas")}
+            paths = shard_paths(directory, metadata_path, metadata_store_path, attributes_path)
+            if self.shard_mode == "process":
+                omp_threads = max(1, (os.cpu_count() or 1) // len(directories))
+                shard = ProcessShard(directory.name, options, paths, omp_threads, self.concurrency)
+                shard.launch()
+            else:
+                shard = LocalShard(directory.name, options, paths, self.concurrency)
+            self.shards.append(shard)
+            self.data_files += [paths["faiss_index_path"], paths["indices_path"]]
+        self.data_files += [metadata_store_path, attributes_path, duplicates_path]
+        
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard-loader") as pool:
+                for future in [pool.submit(shard.start) for shard in self.shards]:
+                    future.result()
+            self._shard_status = [shard.call("get_status").result() for shard in self.shards]
+        except Exception:
+            self.close()
+            raise
+        
+        self._counters = {shard.name: {"calls": 0, "timeouts": 0, "errors": 0} for shard in self.shards}
+        self.embedding_dim = self._shard_status[0]["embedding_dim"]
+        if any(status["embedding_dim"] != self.embedding_dim for status in self._shard_status):
+            self.close()
+            raise ValueError("Shards have different embedding dimensions")
+        
+        # The shards memory-map the same store, this copy resolves results
+        self.metadata = MetadataStore.load(metadata_store_path)
+        if Path(duplicates_path).exists():
+            self.duplicates = DuplicateGroups.load(duplicates_path)
+        if Path(neighbors_path).exists():
+            self.neighbors = NeighborTable.load(neighbors_path)
+        print(f"Loaded {self.vector_count()} vectors across {len(self.shards)} shards")
+    
+    def _gather(self, method: str, *args) -> List[Any]:
+        """Call every shard at once; None for shards that timed out or failed."""
+        futures = [shard.call(method, *args) for shard in self.shards]
+        called = time.perf_counter()
+        
+        results = []
+        for shard, future in zip(self.shards, futures):
+            outcome = "calls"
+            try:
+                results.append(self._wait(future, called))
+            except FutureTimeoutError:
+                future.cancel()
+                results.append(None)
+                outcome = "timeouts"
+            except Exception as e:
+                print(f"Shard {shard.name} {method} failed: {e}")
+                results.append(None)
+                outcome = "errors"
+            
+            with self._counter_lock:
+                self._counters[shard.name]["calls"] += 1
+                if outcome != "calls":
+                    self._counters[shard.name][outcome] += 1
+        return results
+    
+    def missing_shards(self) -> List[str]:
+        """Shards that timed out or failed in the calling thread's last search."""
+        return list(getattr(self._local, "missing", []))
+    
+    def _wait(self, future: ShardCall, called: float) -> Any:
+        """Result of a shard call, allowing the timeout to start it and again to run it."""
+        if not future.wait_started(max(0.0, called + self.timeout - time.perf_counter())):
+            raise FutureTimeoutError()
+        started = future.started_at or time.perf_counter()
+        return future.result(timeout=max(0.0, started + self.timeout - time.perf_counter()))
+    
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Fan the query out to all shards and merge their (n, top_k * 3) hits.
+        
+        filters are applied inside each shard's scan.
+        """
+        if not self.shards:
+            raise ValueError("Index not loaded")
+        
+        queries = np.ascontiguousarray(np.atleast_2d(query_embedding), dtype='float32')
+        results = self._gather("search", queries, top_k, nprobe, ef_search, filters)
+        self._local.missing = [shard.name for shard, result in zip(self.shards, results) if result is None]
+        answered = [r for r in results if r is not None]
+        if not answered:
+            raise RuntimeError(f"No shard answered within {self.timeout * 1000:.0f}ms")
+        
+        scores, ids = zip(*answered)
+        return merge_topk(scores, ids, top_k * 3)
+    
+    @property
+    def has_attributes(self) -> bool:
+        """Whether attribute filters can be used (all shards load the same file)."""
+        return bool(self._shard_status) and self._shard_status[0].get("attributes") is not None
+    
+    def get_vector(self, image_id: int) -> Optional[np.ndarray]:
+        """Return the stored vector of an image from whichever shard holds it."""
+        for vector in self._gather("get_vector", image_id):
+            if vector is not None:
+                return vector
+        return None
+    
+    def find_image_id(self, filename: str) -> Optional[int]:
+        """Resolve a file name to its image id, or None."""
+        return self.metadata.find(filename) if self.metadata is not None else None
+    
+    def get_image_info(self, idx: int) -> Optional[Tuple[str, str]]:
+        """Get (filename, relative URL) by image index."""
+        return self.metadata.get(idx) if self.metadata is not None else None
+    
+    def vector_count(self) -> int:
+        return sum(status["vectors_indexed"] for status in self._shard_status)
+    
+    def check_loaded(self) -> None:
+        """Raise ValueError unless every shard has a non-empty, consistent index."""
+        if not self._shard_status:
+            raise ValueError("New index is empty")
+        for shard, status in zip(self.shards, self._shard_status):
+            if status["vectors_indexed"] == 0:
+                raise ValueError(f"Shard {shard.name} is empty")
+    
+    def add_vectors(self, vectors: np.ndarray, filenames: List[str]) -> np.ndarray:
+        raise ReadOnlyIndexError("Adding images is not supported with a sharded index; rebuild the shards")
+    
+    def delete_ids(self, image_ids) -> np.ndarray:
+        raise ReadOnlyIndexError("Deleting images is not supported with a sharded index; rebuild the shards")
+    
+    def delta_size(self) -> int:
+        return 0
+    
+    def compact(self) -> None:
+        raise ReadOnlyIndexError("Compaction is not supported with a sharded index; rebuild the shards")
+    
+    def fingerprint(self) -> str:
+        """Identity of the served data: every shard's base files and the metadata store."""
+        return files_fingerprint(self.data_files)
+    
+    def close(self) -> None:
+        """Stop shard threads and worker processes."""
+        for shard in self.shards:
+            shard.close()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get index status summed over shards, with per-shard counters."""
+        first = self._shard_status[0] if self._shard_status else {}
+        with self._counter_lock:
+            shards = [
+                {"name": shard.name, "vectors_indexed": status["vectors_indexed"], **self._counters[shard.name]}
+                for shard, status in zip(self.shards, self._shard_status)
+            ]
+        
+        return {
+            "vectors_indexed": self.vector_count(),
+            "embedding_dim": self.embedding_dim,
+            "total_images": len(self.metadata) if self.metadata is not None else 0,
+            "index_type": first.get("index_type", "None"),
+            "index_params": {**first.get("index_params", {}), "shards": len(self.shards)},
+            "load_mode": first.get("load_mode"),
+            "read_only": self.read_only,
+            "rerank_factor": first.get("rerank_factor", 0),
+            "attributes": first.get("attributes"),
+            "duplicates": self.duplicates.get_status() if self.duplicates is not None else None,
+            "neighbors": self.neighbors.get_status() if self.neighbors is not None else None,
+            "sharding": {
+                "mode": self.shard_mode,
+                "shard_dir": self.shard_dir,
+                "timeout_ms": self.timeout * 1000,
+                "concurrency": self.concurrency,
+                "shards": shards
+            }
+        }
@@ -0,0 +1,98 @@
+import os
+import hashlib
+import threading
+from pathlib import Path
+from PIL import Image
+from typing import Any, Dict, Optional, Tuple
+from app.services.cache import LRUCache
+
+# Fixed variant widths; results link to the default one
+THUMBNAIL_WIDTHS = (128, 256, 512)
+DEFAULT_THUMBNAIL_WIDTH = 256
+THUMBNAIL_URL_PREFIX = "/thumbnails"
+
+# Variant URLs are not versioned and a variant is redrawn when its source
+# changes, so clients keep it briefly and then revalidate with the ETag
+THUMBNAIL_CACHE_CONTROL = "public, max-age=3600, must-revalidate"
+
+def thumbnail_url(filename: str, width: int = DEFAULT_THUMBNAIL_WIDTH) -> str:
+    """Relative URL of a resized variant of an image."""
+    return f"{THUMBNAIL_URL_PREFIX}/{width}/{filename}" if filename else ""
+
+def render_thumbnail(source: Path, target: Path, width: int, quality: int = 85) -> None:
+    """Write a JPEG of the source scaled down to width (never up), atomically."""
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        image.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_path, target)
+
+class ThumbnailCache:
+    """On-disk cache of resized image variants with strong ETags.
+    
+    Variants live at cache_dir/<width>/<filename> and are rendered on first
+    request (or ahead of time by scripts/generate_thumbnails.py); a variant
+    older than its source is rendered again. ETags are content hashes, kept
+    in memory per (path, mtime, size) so a hit costs one stat.
+    """
+    
+    def __init__(self, images_dir: Path, cache_dir: Path, quality: int = 85, etag_cache_size: int = 8192):
+        self.images_dir = Path(images_dir)
+        self.cache_dir = Path(cache_dir)
+        self.quality = quality
+        self._etags = LRUCache(max_size=etag_cache_size)
+        self.rendered = 0
+    
+    def source_path(self, filename: str) -> Optional[Path]:
+        """Path of an original image, or None for unknown or unsafe names."""
+        if Path(filename).name != filename or filename.startswith("."):
+            return None
+        path = self.images_dir / filename
+        return path if path.is_file() else None
+    
+    def get(self, filename: str, width: int) -> Optional[Tuple[Path, str]]:
+        """Return (variant path, ETag), rendering the variant if needed.
+        
+        Raises ValueError for widths outside THUMBNAIL_WIDTHS; returns None if
+        the source image does not exist.
+        """
+        if width not in THUMBNAIL_WIDTHS:
+            raise ValueError(f"Unsupported width {width}, expected one of {THUMBNAIL_WIDTHS}")
+        
+        source = self.source_path(filename)
+        if source is None:
+            return None
+        
+        target = self.cache_dir / str(width) / filename
+        try:
+            stale = target.stat().st_mtime_ns < source.stat().st_mtime_ns
+        except FileNotFoundError:
+            stale = True
+        if stale:
+            render_thumbnail(source, target, width, self.quality)
+            self.rendered += 1
+        
+        return target, self._etag(target)
+    
+    def _etag(self, path: Path) -> str:
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        etag = self._etags.get(key)
+        if etag is None:
+            etag = f'"{hashlib.sha1(path.read_bytes()).hexdigest()}"'
+            self._etags.put(key, etag)
+        return etag
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get variant widths, render count and ETag cache counters."""
+        return {
+            "widths": list(THUMBNAIL_WIDTHS),
+            "cache_dir": str(self.cache_dir),
+            "rendered": self.rendered,
+            "etag_cache": self._etags.get_status()
+        }
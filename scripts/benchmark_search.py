@@ -0,0 +1,339 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from app.services.metadata_store import MetadataStore
+
+CLIP_DIM = 512
+
+# Mix of enhanced single keywords and free-text prompts
+QUERIES = [
+    "dog", "cat", "horse", "sunset", "flower", "food", "car", "building", "tree", "person",
+    "a red double decker bus in the rain",
+    "people riding bicycles along a beach at dusk",
+    "close-up of a child's hands holding a small frog",
+    "snow covered mountains above a quiet lake",
+    "a crowded market street at night",
+    "two kittens sleeping on a wool blanket",
+]
+
+_STAGE_LINE = re.compile(r'^vss_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+def write_synthetic_data(workdir: Path, num_vectors: int, dim: int, seed: int) -> None:
+    """Write random unit embeddings, ids and a metadata store where the API expects them."""
+    data_dir = workdir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num_vectors, dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.save(data_dir / "clip_embeddings_optimized.npy", embeddings)
+    np.save(data_dir / "valid_indices.npy", np.arange(num_vectors, dtype=np.int64))
+    MetadataStore.from_paths(f"{i:06d}.jpg" for i in range(num_vectors)).save(str(data_dir / "metadata.bin"))
+    print(f"Synthetic corpus: {num_vectors} x {dim} in {data_dir}")
+
+def start_server(workdir: Path, port: int, env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    """Run the API under uvicorn with workdir as the current directory (so data/ resolves there)."""
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": str(REPO_ROOT), **env},
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, log_path: Path, timeout: float) -> float:
+    """Poll /health/ready; returns seconds until ready."""
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}:\n{log_path.read_text()[-4000:]}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health/ready", timeout=2) as response:
+                if response.status == 200:
+                    return time.time() - start_time
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"Server not ready after {timeout:.0f}s, see {log_path}")
+
+def scrape_stages(base_url: str) -> Dict[str, List[float]]:
+    """Read per-stage (sum, count) from /metrics; empty if the server has no /metrics."""
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+            text = response.read().decode("utf-8")
+    except (urllib.error.URLError, OSError):
+        return {}
+    
+    stages: Dict[str, List[float]] = {}
+    for line in text.splitlines():
+        match = _STAGE_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            stages.setdefault(stage, [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+    return stages
+
+def stage_means_ms(before: Dict[str, List[float]], after: Dict[str, List[float]]) -> Dict[str, float]:
+    """Mean ms per observation of each stage between two scrapes."""
+    means = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, [0.0, 0.0])
+        if count > prev_count:
+            means[stage] = round((total - prev_total) / (count - prev_count) * 1000, 3)
+    return means
+
+class LoadLevel:
+    """Closed-loop load: `concurrency` clients, each sending its next request when the last returns."""
+    
+    def __init__(self, host: str, port: int, concurrency: int, num_requests: int, top_k: int, unique: bool):
+        self.host = host
+        self.port = port
+        self.concurrency = concurrency
+        self.num_requests = num_requests
+        self.top_k = top_k
+        self.unique = unique
+        self._next = 0
+        self._lock = threading.Lock()
+        self.latencies_ms: List[float] = []
+        self.server_ms: List[float] = []
+        self.statuses: Dict[int, int] = {}
+    
+    def _take(self) -> Optional[int]:
+        with self._lock:
+            if self._next >= self.num_requests:
+                return None
+            self._next += 1
+            return self._next - 1
+    
+    def _body(self, i: int) -> bytes:
+        query = QUERIES[i % len(QUERIES)]
+        if self.unique:
+            # Defeat the text embedding cache so every request is encoded
+            query = f"{query} {i}"
+        return json.dumps({"query": query, "top_k": self.top_k, "threshold": 0.0}).encode("utf-8")
+    
+    def _client(self) -> None:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {"Content-Type": "application/json"}
+        latencies, server_ms, statuses = [], [], {}
+        
+        while True:
+            i = self._take()
+            if i is None:
+                break
+            body = self._body(i)
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/search", body=body, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+                status = response.status
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                status = 0
+            
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+                server_ms.append(json.loads(payload)["timing_ms"])
+        
+        conn.close()
+        with self._lock:
+            self.latencies_ms.extend(latencies)
+            self.server_ms.extend(server_ms)
+            for status, n in statuses.items():
+                self.statuses[status] = self.statuses.get(status, 0) + n
+    
+    def run(self) -> float:
+        """Run all requests; returns wall time in seconds."""
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in [pool.submit(self._client) for _ in range(self.concurrency)]:
+                future.result()
+        return time.perf_counter() - start_time
+
+def summarize(level: LoadLevel, wall_seconds: float) -> Dict:
+    latencies = np.asarray(level.latencies_ms)
+    ok = len(latencies)
+    summary = {
+        "concurrency": level.concurrency,
+        "requests": level.num_requests,
+        "ok": ok,
+        "errors": level.num_requests - ok,
+        "statuses": {str(k): v for k, v in sorted(level.statuses.items())},
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(ok / wall_seconds, 2) if wall_seconds else 0.0
+    }
+    if ok:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary["latency_ms"] = {
+            "mean": round(float(latencies.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(latencies.max()), 3)
+        }
+        summary["server_timing_ms_mean"] = round(float(np.mean(level.server_ms)), 3)
+    return summary
+
+def compare(results: Dict, baseline_path: str, max_regression: float) -> bool:
+    """Print p95/throughput changes against a baseline run; False if any level regressed."""
+    with open(baseline_path) as f:
+        baseline = {level["concurrency"]: level for level in json.load(f)["levels"]}
+    
+    passed = True
+    print(f"\nComparison with {baseline_path} (max regression {max_regression:.0%}):")
+    for level in results["levels"]:
+        base = baseline.get(level["concurrency"])
+        if base is None or "latency_ms" not in base or "latency_ms" not in level:
+            continue
+        
+        p95_change = level["latency_ms"]["p95"] / base["latency_ms"]["p95"] - 1
+        rps_change = level["throughput_rps"] / base["throughput_rps"] - 1
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        passed = passed and not regressed
+        print(f"   c={level['concurrency']:<4} p95 {base['latency_ms']['p95']:.1f} -> {level['latency_ms']['p95']:.1f}ms "
+              f"({p95_change:+.1%}), throughput {base['throughput_rps']:.1f} -> {level['throughput_rps']:.1f} rps "
+              f"({rps_change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return passed
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args) -> Dict:
+    server_env = {
+        "DEVICE": "cpu",
+        "FAISS_INDEX_TYPE": args.index_type,
+        "INDEX_LOAD_MODE": args.load_mode,
+        "BACKGROUND_STARTUP": "1",
+        "STARTUP_WARMUP": "1",
+        # Measure the search path; --env RESPONSE_CACHE_BACKEND=memory measures cache hits
+        "RESPONSE_CACHE_BACKEND": "off"
+    }
+    if args.encoder == "stub":
+        server_env.update(TEXT_ENCODER_BACKEND="stub", TEXT_ENCODER_STUB_DIM=str(args.dim), MODEL_CACHE_PATH="")
+    else:
+        server_env.update(TEXT_ENCODER_BACKEND=args.clip_backend, MODEL_CACHE_PATH=str(REPO_ROOT / "data" / "clip_model.pt"))
+    for item in args.env:
+        key, _, value = item.partition("=")
+        server_env[key] = value
+    
+    with tempfile.TemporaryDirectory(prefix="vss-bench-") as tmp:
+        workdir = Path(tmp)
+        write_synthetic_data(workdir, args.num_vectors, args.dim, args.seed)
+        log_path = workdir / "server.log"
+        base_url = f"http://127.0.0.1:{args.port}"
+        
+        process = start_server(workdir, args.port, server_env, log_path)
+        try:
+            ready_seconds = wait_until_ready(base_url, process, log_path, args.startup_timeout)
+            print(f"Server ready in {ready_seconds:.1f}s ({args.encoder} encoder)")
+            
+            # Untimed warmup at the lowest concurrency
+            LoadLevel("127.0.0.1", args.port, 1, args.warmup, args.top_k, args.unique_queries).run()
+            
+            levels = []
+            for concurrency in args.concurrency:
+                before = scrape_stages(base_url)
+                level = LoadLevel("127.0.0.1", args.port, concurrency, args.requests, args.top_k, args.unique_queries)
+                summary = summarize(level, level.run())
+                summary["stages_ms_mean"] = stage_means_ms(before, scrape_stages(base_url))
+                levels.append(summary)
+                
+                latency = summary.get("latency_ms", {})
+                print(f"   c={concurrency:<4} {summary['throughput_rps']:>8.1f} rps  "
+                      f"p50 {latency.get('p50', 0):.1f}ms  p95 {latency.get('p95', 0):.1f}ms  "
+                      f"p99 {latency.get('p99', 0):.1f}ms  errors {summary['errors']}")
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "config": {
+            "encoder": args.encoder if args.encoder == "stub" else f"clip/{args.clip_backend}",
+            "num_vectors": args.num_vectors,
+            "dim": args.dim,
+            "index_type": args.index_type,
+            "load_mode": args.load_mode,
+            "top_k": args.top_k,
+            "requests_per_level": args.requests,
+            "unique_queries": args.unique_queries,
+            "server_env": server_env
+        },
+        "startup_seconds": round(ready_seconds, 2),
+        "levels": levels
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP load benchmark of /search on a synthetic corpus")
+    parser.add_argument("--encoder", choices=("stub", "clip"), default="stub",
+                        help="stub: deterministic vectors, no model; clip: real CLIP on CPU")
+    parser.add_argument("--clip-backend", default="torch", help="TEXT_ENCODER_BACKEND for --encoder clip")
+    parser.add_argument("--num-vectors", type=int, default=25000)
+    parser.add_argument("--dim", type=int, default=CLIP_DIM, help="Embedding dimension (CLIP needs 512)")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--load-mode", default="full")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed requests before the first level")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--unique-queries", action="store_true",
+                        help="Make every query distinct so the text cache never hits")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra server environment, e.g. --env ENCODE_BATCHING=0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", default=None, help="Result JSON (default data/benchmarks/search_<time>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier result JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Allowed p95 increase / throughput drop vs the baseline")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.encoder == "clip" and args.dim != CLIP_DIM:
+        sys.exit(f"--encoder clip produces {CLIP_DIM}-d embeddings, got --dim {args.dim}")
+    
+    results = run_benchmark(args)
+    
+    output = Path(args.output or f"data/benchmarks/search_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
+    
+    if args.baseline and not compare(results, args.baseline, args.max_regression):
+        sys.exit(1)
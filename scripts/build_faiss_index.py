@@ -1,13 +1,25 @@
+import argparse
+import sys
 import numpy as np
 import faiss
 from pathlib import Path
 
-def build_index():
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.indexer import INDEX_TYPES, build_index as build_faiss_index, describe_index
+
+def build_index(
+    index_type: str = "flat",
+    embeddings_path: str = "data/clip_embeddings_optimized.npy",
+    output_path: str = "data/faiss_index.bin",
+    indices_path: str = "data/valid_indices.npy",
+    **build_params
+):
     """Create and save FAISS index."""
-    print("Building FAISS index...")
+    print(f"Building FAISS index ({index_type})...")
     
-    embeddings_path = Path("data/clip_embeddings_optimized.npy")
-    output_path = Path("data/faiss_index.bin")
+    embeddings_path = Path(embeddings_path)
+    output_path = Path(output_path)
     
     if not embeddings_path.exists():
         print(f"Embeddings not found at {embeddings_path}")
@@ -16,19 +28,41 @@ def build_index():
     embeddings = np.load(embeddings_path)
     print(f"Loaded embeddings: {embeddings.shape}")
     
-    # Normalize
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    embeddings = embeddings / norms
+    # Stable image ids per row, so images can later be added/deleted in place
+    ids = np.load(indices_path) if Path(indices_path).exists() else np.arange(len(embeddings))
     
-    # Create index
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings.astype('float32'))
+    # Normalize, train (IVF) and add
+    index = build_faiss_index(embeddings, index_type, ids=ids, **build_params)
     
     # Save
     faiss.write_index(index, str(output_path))
     print(f"FAISS index saved: {output_path}")
-    print(f"   Vectors: {index.ntotal}, Dimension: {dim}")
+    print(f"   Vectors: {index.ntotal}, Dimension: {index.d}")
+    print(f"   Parameters: {describe_index(index)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS index from CLIP embeddings")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--embeddings", default="data/clip_embeddings_optimized.npy")
+    parser.add_argument("--output", default="data/faiss_index.bin")
+    parser.add_argument("--indices", default="data/valid_indices.npy")
+    parser.add_argument("--nlist", type=int, default=1024, help="IVF clusters")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers (must divide dim)")
+    parser.add_argument("--pq-nbits", type=int, default=8, help="Bits per PQ code")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW links per node")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build beam width")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    build_index()
+    args = parse_args()
+    build_index(
+        index_type=args.index_type,
+        embeddings_path=args.embeddings,
+        output_path=args.output,
+        indices_path=args.indices,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction
+    )
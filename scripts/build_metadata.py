@@ -1,4 +1,15 @@
-import os, json
+import argparse
+import csv
+import os, json, sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.attributes import AttributeStore, orientation_of
+from app.services.metadata_store import MetadataStore, filename_from_path
 
 def build_metadata(image_dir="data/images", output_path="data/metadata.json"):
     files = sorted([
@@ -17,5 +28,147 @@ def build_metadata(image_dir="data/images", output_path="data/metadata.json"):
         json.dump(metadata, f, indent=2)
     print(f"Metadata created for {len(metadata)} images at {output_path}")
 
+def build_metadata_store(
+    metadata_path="data/embedding_metadata.json",
+    output_path="data/metadata.bin",
+    url_prefix="/images",
+    force=False
+):
+    """Pack image_paths from the embedding metadata into the binary store the API loads.
+
+    A store newer than the JSON is kept: compaction writes images added at
+    runtime into the store only, so rebuilding it from the JSON would lose them.
+    """
+    if not force and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(metadata_path):
+        print(f"Metadata store {output_path} is newer than {metadata_path}, kept (--rebuild-store to replace)")
+        return
+
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        image_paths = json.load(f).get("image_paths", [])
+
+    store = MetadataStore.from_paths(image_paths, url_prefix=url_prefix)
+    # Replace rather than overwrite: the name may be a symlink to a store the API serves
+    tmp_path = f"{output_path}.tmp"
+    store.save(tmp_path)
+    os.replace(tmp_path, output_path)
+    size_kb = os.path.getsize(output_path) / 1024
+    print(f"Metadata store created for {len(store)} images at {output_path} ({size_kb:.1f} KB)")
+
+def parse_timestamp(value: str) -> int:
+    """Unix seconds from a number or an ISO 8601 date (naive dates are UTC)."""
+    if value.lstrip("-").isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value)
+    return int((parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp())
+
+def load_attribute_overrides(csv_path):
+    """filename -> {collection, uploaded_at} from a CSV with a filename column."""
+    overrides = {}
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            values = {}
+            if row.get("collection"):
+                values["collection"] = row["collection"]
+            if row.get("uploaded_at"):
+                values["uploaded_at"] = parse_timestamp(row["uploaded_at"])
+            overrides[row["filename"]] = values
+    return overrides
+
+def image_attributes(path, image_dir, overrides):
+    """Attributes of one image, or None if it has no path or its file cannot be read.
+
+    Size comes from the image header, uploaded_at defaults to the file's
+    mtime and collection to its parent folder.
+    """
+    if not path:
+        return None
+    filename = filename_from_path(path)
+    local_path = Path(image_dir) / filename
+    try:
+        with Image.open(local_path) as image:
+            width, height = image.size
+        mtime = int(local_path.stat().st_mtime)
+    except (OSError, ValueError):
+        return None
+
+    folders = path.replace("\\", "/").split("/")[:-1]
+    record = {
+        "collection": folders[-1] if folders else "",
+        "uploaded_at": mtime,
+        "width": width,
+        "height": height,
+        **overrides.get(filename, {})
+    }
+    record["orientation"] = orientation_of(width, height)
+    return record
+
+def attribute_paths(metadata_path, store_path):
+    """Image path per id, following the metadata store the API serves.
+
+    The JSON paths keep parent folders (the default collection) but miss
+    images added at runtime and compacted since; those come from the store,
+    and ids the store has emptied (deleted images) get None.
+    """
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        image_paths = json.load(f).get("image_paths", [])
+    if not os.path.exists(store_path):
+        return image_paths
+
+    store = MetadataStore.load(store_path)
+    paths = []
+    for idx in range(len(store)):
+        info = store.get(idx)
+        if info is None:
+            paths.append(None)
+        elif idx < len(image_paths) and filename_from_path(image_paths[idx]) == info[0]:
+            paths.append(image_paths[idx])
+        else:
+            paths.append(info[0])
+    return paths
+
+def build_attributes(
+    metadata_path="data/embedding_metadata.json",
+    image_dir="data/images",
+    output_path="data/attributes.npz",
+    overrides_csv=None,
+    workers=8,
+    store_path="data/metadata.bin"
+):
+    """Build the columnar attribute file for filtered search, one row per image id."""
+    image_paths = attribute_paths(metadata_path, store_path)
+    overrides = load_attribute_overrides(overrides_csv) if overrides_csv else {}
+
+    # Only image headers are read, so threads keep up with the disk
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        records = list(pool.map(lambda path: image_attributes(path, image_dir, overrides), image_paths))
+
+    store = AttributeStore.from_records(records)
+    store.save(output_path)
+    size_kb = os.path.getsize(output_path) / 1024
+    missing = len(records) - int(store.present.sum())
+    print(f"Attributes created for {len(store)} images at {output_path} ({size_kb:.1f} KB, {missing} unreadable)")
+
 if __name__ == "__main__":
-    build_metadata()
+    parser = argparse.ArgumentParser(description="Build image metadata files")
+    parser.add_argument("--image-dir", default="data/images")
+    parser.add_argument("--output", default="data/metadata.json")
+    parser.add_argument("--embedding-metadata", default="data/embedding_metadata.json")
+    parser.add_argument("--store-output", default="data/metadata.bin")
+    parser.add_argument("--rebuild-store", action="store_true",
+                        help="Rebuild the metadata store from the JSON even if the store is newer")
+    parser.add_argument("--attributes", action="store_true", help="Also build the attribute file for filtered search")
+    parser.add_argument("--attributes-output", default="data/attributes.npz")
+    parser.add_argument("--attributes-csv", default=None,
+                        help="CSV with filename and optional collection, uploaded_at (ISO date or unix seconds) columns")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.image_dir):
+        build_metadata(args.image_dir, args.output)
+    if os.path.exists(args.embedding_metadata):
+        build_metadata_store(args.embedding_metadata, args.store_output, force=args.rebuild_store)
+        if args.attributes:
+            build_attributes(
+                args.embedding_metadata, args.image_dir, args.attributes_output,
+                args.attributes_csv, args.workers, args.store_output
+            )
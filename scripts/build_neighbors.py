@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.indexer import FAISSIndexManager
+from app.services.neighbors import NeighborTable
+
+def build_neighbors(
+    width: int = 32,
+    embeddings_path: str = "data/clip_embeddings_optimized.npy",
+    faiss_index_path: str = "data/faiss_index.bin",
+    indices_path: str = "data/valid_indices.npy",
+    metadata_store_path: str = "data/metadata.bin",
+    output_path: str = "data/neighbors.npy",
+    nprobe: int = 0,
+    ef_search: int = 0,
+    block_size: int = 4096
+):
+    """Precompute the top-width neighbours of every indexed image through the served index.
+    
+    Pending runtime additions and deletions are applied first, so the table
+    matches what the API serves.
+    """
+    if not Path(faiss_index_path).exists():
+        print(f"FAISS index not found at {faiss_index_path}")
+        return
+    
+    started = time.time()
+    manager = FAISSIndexManager(nprobe=nprobe or None, ef_search=ef_search or None, load_mode="mmap")
+    manager.load_from_disk(
+        embeddings_path, faiss_index_path,
+        indices_path=indices_path,
+        metadata_store_path=metadata_store_path,
+        neighbors_path=None
+    )
+    delta = manager.delta
+    base_ids = np.asarray(manager.valid_indices, dtype=np.int64)
+    rows = np.flatnonzero(~np.isin(base_ids, delta.tombstones))
+    count = int(max(base_ids.max(initial=-1), delta.ids.max(initial=-1))) + 1
+    print(f"Finding {width} neighbours of {len(rows) + len(delta.ids)} images...")
+    
+    table = NeighborTable.empty(count, width)
+    records = table.records
+    
+    def fill(image_ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, scores = manager.nearest_neighbors(image_ids, vectors, width)
+        records["ids"][image_ids] = ids
+        records["scores"][image_ids] = np.where(ids >= 0, scores, 0)
+    
+    for block_no, start in enumerate(range(0, len(rows), block_size)):
+        block = rows[start:start + block_size]
+        vectors = np.asarray(manager.embeddings[block], dtype=np.float32)
+        fill(base_ids[block], vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+        if block_no % 20 == 19:
+            print(f"   {start + len(block)}/{len(rows)} done ({time.time() - started:.0f}s)")
+    if len(delta.ids):
+        fill(delta.ids, delta.vectors)
+    
+    # A running server may have the old table memory-mapped, so never overwrite it in place
+    tmp_path = f"{output_path}.tmp"
+    table.save(tmp_path)
+    os.replace(tmp_path, output_path)
+    size_mb = os.path.getsize(output_path) / 1024 ** 2
+    print(f"Neighbour table saved to {output_path} ({size_mb:.1f} MB) in {time.time() - started:.1f}s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute related images (nearest neighbours) of every indexed image")
+    parser.add_argument("--width", type=int, default=32, help="Neighbours stored per image")
+    parser.add_argument("--embeddings", default="data/clip_embeddings_optimized.npy")
+    parser.add_argument("--index", default="data/faiss_index.bin")
+    parser.add_argument("--indices", default="data/valid_indices.npy")
+    parser.add_argument("--metadata-store", default="data/metadata.bin")
+    parser.add_argument("--output", default="data/neighbors.npy")
+    parser.add_argument("--nprobe", type=int, default=0, help="IVF clusters scanned (0 = index default)")
+    parser.add_argument("--ef-search", type=int, default=0, help="HNSW search beam width (0 = index default)")
+    parser.add_argument("--block-size", type=int, default=4096, help="Images searched per block")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    build_neighbors(
+        width=args.width,
+        embeddings_path=args.embeddings,
+        faiss_index_path=args.index,
+        indices_path=args.indices,
+        metadata_store_path=args.metadata_store,
+        output_path=args.output,
+        nprobe=args.nprobe,
+        ef_search=args.ef_search,
+        block_size=args.block_size
+    )
@@ -0,0 +1,78 @@
+import argparse
+import sys
+import numpy as np
+import faiss
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.indexer import INDEX_TYPES, build_index, describe_index
+
+def build_shards(
+    num_shards: int,
+    index_type: str = "flat",
+    embeddings_path: str = "data/clip_embeddings_optimized.npy",
+    indices_path: str = "data/valid_indices.npy",
+    output_dir: str = "data/shards",
+    **build_params
+):
+    """Split the embeddings into num_shards partitions, each with its own FAISS index."""
+    embeddings_path = Path(embeddings_path)
+    if not embeddings_path.exists():
+        print(f"Embeddings not found at {embeddings_path}")
+        return
+    
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    ids = np.load(indices_path) if Path(indices_path).exists() else np.arange(len(embeddings))
+    print(f"Splitting {len(embeddings)} embeddings into {num_shards} shards ({index_type})...")
+    
+    output_dir = Path(output_dir)
+    for old_shard in output_dir.glob("shard_*"):
+        if old_shard.is_dir() and int(old_shard.name.split("_")[1]) >= num_shards:
+            print(f"   Warning: {old_shard} is left over from an earlier build, remove it")
+    
+    # Contiguous row ranges keep each shard's ids ascending
+    for shard_no, rows in enumerate(np.array_split(np.arange(len(embeddings)), num_shards)):
+        shard_dir = output_dir / f"shard_{shard_no:03d}"
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        
+        shard_embeddings = np.asarray(embeddings[rows], dtype=np.float32)
+        shard_ids = np.asarray(ids[rows], dtype=np.int64)
+        index = build_index(shard_embeddings, index_type, ids=shard_ids, **build_params)
+        
+        np.save(shard_dir / "clip_embeddings_optimized.npy", shard_embeddings)
+        np.save(shard_dir / "valid_indices.npy", shard_ids)
+        faiss.write_index(index, str(shard_dir / "faiss_index.bin"))
+        print(f"   {shard_dir.name}: {index.ntotal} vectors")
+    
+    print(f"Shards saved to {output_dir}")
+    print(f"   Parameters: {describe_index(index)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Split the CLIP embeddings into FAISS index shards")
+    parser.add_argument("--num-shards", type=int, required=True)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--embeddings", default="data/clip_embeddings_optimized.npy")
+    parser.add_argument("--indices", default="data/valid_indices.npy")
+    parser.add_argument("--output-dir", default="data/shards")
+    parser.add_argument("--nlist", type=int, default=1024, help="IVF clusters per shard")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers (must divide dim)")
+    parser.add_argument("--pq-nbits", type=int, default=8, help="Bits per PQ code")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW links per node")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build beam width")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    build_shards(
+        num_shards=args.num_shards,
+        index_type=args.index_type,
+        embeddings_path=args.embeddings,
+        indices_path=args.indices,
+        output_dir=args.output_dir,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction
+    )
@@ -0,0 +1,65 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.response_cache import create_response_cache
+
+class LocalRedis:
+    """Stand-in for a Redis server: the get/set subset RedisBackend calls, in a dict."""
+    
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+    
+    def get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+    
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        self.data[key] = value
+
+def check_shared_cache(client, ttl_seconds: float) -> bool:
+    """Two caches on one client (two workers) share entries; a new generation rotates keys."""
+    first = create_response_cache("redis", ttl_seconds=ttl_seconds, client=client)
+    second = create_response_cache("redis", ttl_seconds=ttl_seconds, client=client)
+    fields = {"query": "check_response_cache", "top_k": 5, "threshold": 0.2}
+    body = b'{"results": []}'
+    
+    old_key = first.key("generation-a", fields)
+    first.put(old_key, body)
+    shared = second.get(second.key("generation-a", fields)) == body
+    print(f"   entry written by one cache read by the other: {shared}")
+    
+    new_key = second.key("generation-b", fields)
+    rotated = new_key != old_key and second.get(new_key) is None
+    print(f"   new generation looks up a fresh key and misses: {rotated}")
+    
+    # Old entries are not deleted, they expire (or are evicted) on their own
+    kept = first.get(old_key) == body
+    print(f"   entry of the old generation left to expire: {kept}")
+    
+    errors = first.errors + second.errors
+    print(f"   backend errors: {errors}")
+    return shared and rotated and kept and errors == 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that the redis response cache is shared and keyed by index generation")
+    parser.add_argument("--url", help="Run against this Redis server instead of a local stand-in")
+    parser.add_argument("--ttl-seconds", type=float, default=60)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    
+    if args.url:
+        import redis
+        client = redis.Redis.from_url(args.url, socket_timeout=0.5)
+    else:
+        client = LocalRedis()
+    
+    print(f"Response cache on {args.url or 'a local stand-in'}:")
+    if not check_shared_cache(client, args.ttl_seconds):
+        print("Response cache check FAILED")
+        sys.exit(1)
+    print("Response cache check passed")
@@ -0,0 +1,109 @@
+import argparse
+import sys
+import time
+import numpy as np
+import torch
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models.clip_loader import CLIPModelLoader
+from app.models.text_encoders import create_text_encoder, export_text_encoder
+
+DEFAULT_OUTPUTS = {"torchscript": "data/text_encoder.ts", "onnx": "data/text_encoder.onnx"}
+
+# Minimum cosine similarity to the eager float32 embeddings per backend
+DEFAULT_MIN_COSINE = {"torch": 0.9999, "torchscript": 0.9999, "onnx": 0.9999, "int8": 0.98}
+
+PARITY_PROMPTS = [
+    "dog", "a dog", "a dog animal playing or sitting",
+    "cat", "a cat animal sitting or lying down",
+    "a horse animal standing in field or stable",
+    "a car vehicle on road or street",
+    "a person standing or walking",
+    "a tall building architecture structure",
+    "delicious food meal on plate or table",
+    "green tree in nature park or forest",
+    "beautiful colorful flower in garden",
+    "beautiful sunset sky with orange and pink colors",
+    "people riding bicycles along a beach at dusk",
+    "a red double decker bus in the rain",
+    "close-up of a child's hands holding a small frog",
+]
+
+def time_encoder(encoder, tokens: torch.Tensor, repeats: int) -> float:
+    """Median single-query encode latency in ms."""
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        encoder.encode(tokens[i % len(tokens)].unsqueeze(0))
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def check_parity(
+    loader: CLIPModelLoader,
+    backend: str,
+    path: str,
+    min_cosine: float,
+    embeddings_path: str,
+    top_k: int = 10,
+    repeats: int = 20
+) -> bool:
+    """Compare a backend to the eager float32 text tower on PARITY_PROMPTS."""
+    import clip
+    
+    tokens = clip.tokenize(PARITY_PROMPTS, truncate=True)
+    reference_encoder = create_text_encoder("torch", loader.model, loader.device)
+    candidate_encoder = create_text_encoder(backend, loader.model, loader.device, path)
+    
+    reference = reference_encoder.encode(tokens).float().cpu().numpy()
+    candidate = candidate_encoder.encode(tokens).float().cpu().numpy()
+    cosine = np.sum(reference * candidate, axis=1)
+    
+    print(f"Parity of {backend} vs torch on {len(PARITY_PROMPTS)} prompts:")
+    print(f"   min cosine: {cosine.min():.6f} (required {min_cosine})")
+    print(f"   max abs diff: {np.abs(reference - candidate).max():.6f}")
+    
+    # Retrieval agreement against the stored image embeddings, when available
+    if Path(embeddings_path).exists():
+        embeddings = np.load(embeddings_path, mmap_mode="r").astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        reference_top = np.argsort(-(reference @ embeddings.T), axis=1)[:, :top_k]
+        candidate_top = np.argsort(-(candidate @ embeddings.T), axis=1)[:, :top_k]
+        overlap = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(reference_top, candidate_top)])
+        print(f"   top-{top_k} retrieval overlap: {overlap:.3f}")
+    
+    print(f"   latency (1 query): torch {time_encoder(reference_encoder, tokens, repeats):.1f}ms, "
+          f"{backend} {time_encoder(candidate_encoder, tokens, repeats):.1f}ms")
+    
+    return bool(cosine.min() >= min_cosine)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the CLIP text encoder and check parity")
+    parser.add_argument("--backend", choices=list(DEFAULT_MIN_COSINE), default="onnx")
+    parser.add_argument("--output", help="Export path (default data/text_encoder.ts or .onnx)")
+    parser.add_argument("--model", default="ViT-B/32")
+    parser.add_argument("--embeddings", default="data/clip_embeddings_optimized.npy")
+    parser.add_argument("--min-cosine", type=float, help="Parity threshold (default per backend)")
+    parser.add_argument("--check-only", action="store_true", help="Skip the export, only run the parity check")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = args.output or DEFAULT_OUTPUTS.get(args.backend)
+    
+    # Exports and parity checks run on CPU in float32, the target of these backends
+    loader = CLIPModelLoader(model_name=args.model, device="cpu")
+    loader.load()
+    
+    # int8 and torch are built from the model at load time, so they only get the check
+    if args.backend in DEFAULT_OUTPUTS and not args.check_only:
+        print(f"Exporting {args.backend} text encoder to {output}...")
+        export_text_encoder(loader.model, args.backend, output)
+        print(f"Saved {output} ({Path(output).stat().st_size / 1e6:.1f} MB)")
+    
+    min_cosine = args.min_cosine if args.min_cosine is not None else DEFAULT_MIN_COSINE[args.backend]
+    if not check_parity(loader, args.backend, output, min_cosine, args.embeddings):
+        print("Parity check FAILED")
+        sys.exit(1)
+    print("Parity check passed")
@@ -0,0 +1,190 @@
+import argparse
+import sys
+import time
+import numpy as np
+import faiss
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.duplicates import DuplicateGroups
+
+# auto: exact blocked scan up to this many vectors, int8 IVF above (about 4x less memory)
+FLAT_MAX_VECTORS = 100_000
+# Similarity entries computed per tile of the exact scan (128 MB of float32)
+EXACT_BLOCK_ENTRIES = 1 << 25
+# Candidates from int8 codes are kept this far below the threshold, then rescored exactly
+SQ8_MARGIN = 0.02
+
+def normalized(block: np.ndarray) -> np.ndarray:
+    block = np.asarray(block, dtype=np.float32)
+    return block / np.linalg.norm(block, axis=1, keepdims=True)
+
+def exact_pairs(embeddings: np.ndarray, threshold: float) -> np.ndarray:
+    """All (row, row) pairs, lower row first, with similarity >= threshold.
+    
+    Rows are compared in square tiles, each block of rows against itself and
+    the blocks after it only (the upper triangle), so every pair is scored
+    once. Only two blocks are normalized to float32 at a time and the
+    similarity matrix never exists beyond one tile.
+    """
+    n = len(embeddings)
+    block_size = max(1, int(np.sqrt(EXACT_BLOCK_ENTRIES)))
+    pairs = []
+    started = time.time()
+    for block_no, start in enumerate(range(0, n, block_size)):
+        rows = normalized(embeddings[start:start + block_size])
+        for col_start in range(start, n, block_size):
+            cols = rows if col_start == start else normalized(embeddings[col_start:col_start + block_size])
+            low, high = np.nonzero(rows @ cols.T >= threshold)
+            low, high = low + start, high + col_start
+            upper = high > low
+            pairs.append(np.stack([low[upper], high[upper]], axis=1))
+        
+        if block_no % 5 == 4:
+            print(f"   {min(start + block_size, n)}/{n} scanned ({time.time() - started:.0f}s)")
+    return np.concatenate(pairs).astype(np.int64) if pairs else np.empty((0, 2), dtype=np.int64)
+
+def build_ivf_index(embeddings: np.ndarray, nlist: int, block_size: int, seed: int = 0) -> faiss.Index:
+    """IVF index of int8 codes over the normalized embeddings, filled block by block.
+    
+    Only the codes (dim bytes per vector) are held in memory, never a float
+    copy of the file. The coarse quantizer is trained on a sample with few
+    k-means iterations; duplicates land in the same cell regardless.
+    """
+    n, dim = embeddings.shape
+    # FAISS wants ~39 training points per centroid
+    nlist = max(1, min(nlist or int(2 * np.sqrt(n)), n // 39))
+    index = faiss.IndexIVFScalarQuantizer(
+        faiss.IndexFlatIP(dim), dim, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    index.cp.niter = 10
+    sample = np.sort(np.random.default_rng(seed).choice(n, min(n, nlist * 50), replace=False))
+    index.train(normalized(embeddings[sample]))
+    
+    for start in range(0, n, block_size):
+        index.add(normalized(embeddings[start:start + block_size]))
+    return index
+
+def knn_pairs(
+    embeddings: np.ndarray,
+    index: faiss.Index,
+    min_score: float,
+    k: int,
+    block_size: int
+) -> np.ndarray:
+    """Unique (row, row) pairs, lower row first, among each row's k nearest neighbours.
+    
+    Rows are searched a block at a time, so memory stays at block_size x k
+    scores plus the pairs kept; larger clusters still join up transitively.
+    """
+    n = len(embeddings)
+    pairs = []
+    started = time.time()
+    for block_no, start in enumerate(range(0, n, block_size)):
+        queries = normalized(embeddings[start:start + block_size])
+        scores, rows = index.search(queries, k + 1)
+        own = np.arange(start, start + len(queries))[:, None]
+        
+        # The query itself and padding (-1) drop out; a pair may be found from both ends
+        hit = (scores >= min_score) & (rows >= 0) & (rows != own)
+        low = np.minimum(own, rows)[hit]
+        high = np.maximum(own, rows)[hit]
+        pairs.append(low.astype(np.int64) * n + high)
+        
+        if block_no % 20 == 19:
+            done = start + len(queries)
+            print(f"   {done}/{n} searched ({time.time() - started:.0f}s)")
+    
+    keys = np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.int64)
+    return np.stack([keys // n, keys % n], axis=1)
+
+def pair_scores(embeddings: np.ndarray, pairs: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Exact cosine similarity of row pairs."""
+    scores = np.empty(len(pairs), dtype=np.float32)
+    for start in range(0, len(pairs), chunk):
+        a, b = pairs[start:start + chunk].T
+        scores[start:start + chunk] = np.einsum(
+            "ij,ij->i", normalized(embeddings[a]), normalized(embeddings[b])
+        )
+    return scores
+
+def find_duplicates(
+    embeddings_path: str = "data/clip_embeddings_optimized.npy",
+    indices_path: str = "data/valid_indices.npy",
+    output_path: str = "data/duplicate_groups.npz",
+    threshold: float = 0.95,
+    k: int = 16,
+    index_type: str = "auto",
+    nlist: int = 0,
+    nprobe: int = 8,
+    block_size: int = 8192
+):
+    """Group near-duplicate images (cosine similarity >= threshold) by image id.
+    
+    flat compares every pair exactly; ivf checks the k nearest neighbours of
+    each image in an int8 IVF index and rescores the candidates exactly.
+    """
+    embeddings_path = Path(embeddings_path)
+    if not embeddings_path.exists():
+        print(f"Embeddings not found at {embeddings_path}")
+        return
+    
+    started = time.time()
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    ids = np.load(indices_path) if Path(indices_path).exists() else np.arange(len(embeddings))
+    if index_type == "auto":
+        index_type = "flat" if len(embeddings) <= FLAT_MAX_VECTORS else "ivf"
+    print(f"Finding duplicates among {len(embeddings)} embeddings ({index_type}, threshold={threshold})...")
+    
+    if index_type == "flat":
+        pairs = exact_pairs(embeddings, threshold)
+    else:
+        index = build_ivf_index(embeddings, nlist, block_size)
+        index.nprobe = nprobe
+        print(f"   Index built in {time.time() - started:.1f}s")
+        pairs = knn_pairs(embeddings, index, threshold - SQ8_MARGIN, k, block_size)
+        if len(pairs):
+            pairs = pairs[pair_scores(embeddings, pairs) >= threshold]
+    
+    image_ids = np.asarray(ids, dtype=np.int64)
+    num_ids = int(image_ids.max()) + 1 if len(image_ids) else 0
+    groups = DuplicateGroups.from_pairs(num_ids, image_ids[pairs[:, 0]], image_ids[pairs[:, 1]], threshold)
+    groups.save(output_path)
+    
+    sizes = np.diff(groups.offsets)
+    print(f"Found {len(pairs)} duplicate pairs in {len(groups)} groups covering {len(groups.members)} images")
+    if len(groups):
+        print(f"   Largest group: {int(sizes.max())} images, mean {sizes.mean():.1f}")
+    print(f"Saved to {output_path} in {time.time() - started:.1f}s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images from their CLIP embeddings")
+    parser.add_argument("--embeddings", default="data/clip_embeddings_optimized.npy")
+    parser.add_argument("--indices", default="data/valid_indices.npy")
+    parser.add_argument("--output", default="data/duplicate_groups.npz")
+    parser.add_argument("--threshold", type=float, default=0.95, help="Cosine similarity of duplicates")
+    parser.add_argument("--k", type=int, default=16, help="Neighbours checked per image (ivf)")
+    parser.add_argument("--index-type", choices=("auto", "flat", "ivf"), default="auto",
+                        help=f"flat is exact; auto uses ivf (int8 codes) above {FLAT_MAX_VECTORS} vectors")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF clusters (0 = 2 x sqrt(n))")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF clusters scanned per image")
+    parser.add_argument("--block-size", type=int, default=8192, help="Images searched per block (ivf)")
+    parser.add_argument("--threads", type=int, default=0, help="FAISS threads (0 = all cores)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    find_duplicates(
+        embeddings_path=args.embeddings,
+        indices_path=args.indices,
+        output_path=args.output,
+        threshold=args.threshold,
+        k=args.k,
+        index_type=args.index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        block_size=args.block_size
+    )
@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import numpy as np
+import torch
+from pathlib import Path
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models.clip_loader import CLIPModelLoader
+from app.services.metadata_store import MetadataStore
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MIN_IMAGE_SIZE = 64
+
+def find_images(image_dir: str, max_images: int = 0) -> list:
+    """List images in a directory, ordered by the first number in the file name."""
+    paths = [str(p) for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS]
+    
+    def sort_key(path):
+        numbers = re.findall(r"\d+", Path(path).stem)
+        return (int(numbers[0]) if numbers else float("inf"), Path(path).name)
+    
+    paths.sort(key=sort_key)
+    return paths[:max_images] if max_images else paths
+
+class ImageDataset(Dataset):
+    """Decodes, enhances and preprocesses images in loader workers.
+    
+    Items are (image_id, tensor, ok); unreadable or tiny images come back
+    with ok=False so a bad file never stops the run.
+    """
+    
+    def __init__(self, image_paths: list, ids: list, preprocess, resolution: int):
+        self.image_paths = image_paths
+        self.ids = ids
+        self.preprocess = preprocess
+        self.resolution = resolution
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, i):
+        image_id = self.ids[i]
+        try:
+            image = Image.open(self.image_paths[image_id]).convert("RGB")
+            if min(image.size) < MIN_IMAGE_SIZE:
+                raise ValueError(f"smaller than {MIN_IMAGE_SIZE}px")
+            tensor = self.preprocess(CLIPModelLoader.enhance_image(image))
+            return image_id, tensor, True
+        except Exception as e:
+            print(f"Skipping {self.image_paths[image_id]}: {e}")
+            return image_id, torch.zeros(3, self.resolution, self.resolution), False
+
+def _limit_worker_threads(worker_id: int) -> None:
+    """One intra-op thread per loader worker; the processes provide the parallelism."""
+    torch.set_num_threads(1)
+
+def _atomic_write(path: Path, write) -> None:
+    """Write next to the target and rename, so an interrupted run leaves no partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class ChunkCheckpoint:
+    """Fixed-size chunks of image ids written as .npz files plus a progress file.
+    
+    Chunk c always covers image ids [c * chunk_size, (c + 1) * chunk_size), so a
+    resumed run only has to embed the chunks that are not on disk yet.
+    """
+    
+    def __init__(self, directory: str, image_paths: list, chunk_size: int, model_name: str):
+        self.directory = Path(directory)
+        self.chunk_size = chunk_size
+        self.num_chunks = (len(image_paths) + chunk_size - 1) // chunk_size
+        self.run_key = {
+            "model": model_name,
+            "chunk_size": chunk_size,
+            "num_images": len(image_paths),
+            "image_list_sha1": hashlib.sha1("\n".join(image_paths).encode("utf-8")).hexdigest()
+        }
+    
+    def chunk_path(self, chunk: int) -> Path:
+        return self.directory / f"chunk_{chunk:06d}.npz"
+    
+    def prepare(self, resume: bool) -> list:
+        """Return the chunks still to embed, discarding checkpoints of a different run."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        progress_path = self.directory / "progress.json"
+        
+        if resume and progress_path.exists():
+            with open(progress_path, "r") as f:
+                if json.load(f) == self.run_key:
+                    return [c for c in range(self.num_chunks) if not self.chunk_path(c).exists()]
+            print("Checkpoint belongs to a different image list/model/chunk size, starting over")
+        
+        for old_chunk in self.directory.glob("chunk_*.npz"):
+            old_chunk.unlink()
+        _atomic_write(progress_path, lambda f: f.write(json.dumps(self.run_key, indent=2).encode("utf-8")))
+        return list(range(self.num_chunks))
+    
+    def save(self, chunk: int, ids: np.ndarray, embeddings: np.ndarray, failed: np.ndarray) -> None:
+        _atomic_write(self.chunk_path(chunk), lambda f: np.savez(f, ids=ids, embeddings=embeddings, failed=failed))
+    
+    def load_all(self):
+        """Concatenate all chunks into (ids, embeddings, failed_ids), ordered by id."""
+        ids, embeddings, failed = [], [], []
+        for chunk in range(self.num_chunks):
+            with np.load(self.chunk_path(chunk)) as data:
+                ids.append(data["ids"])
+                embeddings.append(data["embeddings"])
+                failed.append(data["failed"])
+        
+        ids = np.concatenate(ids)
+        order = np.argsort(ids, kind="stable")
+        return ids[order], np.concatenate(embeddings)[order], np.concatenate(failed)
+
+def embed_chunks(
+    loader: CLIPModelLoader,
+    image_paths: list,
+    checkpoint: ChunkCheckpoint,
+    chunks: list,
+    batch_size: int,
+    num_workers: int
+) -> dict:
+    """Embed the given chunks in a multi-process DataLoader, saving each chunk as it completes."""
+    model, preprocess = loader.load()
+    resolution = model.visual.input_resolution
+    total = sum(
+        min(checkpoint.chunk_size, len(image_paths) - c * checkpoint.chunk_size) for c in chunks
+    )
+    print(f"Embedding {total} images in {len(chunks)} chunks "
+          f"(batch {batch_size}, {num_workers} loader workers, {loader.device})")
+    
+    done = 0
+    start_time = time.time()
+    for chunk in chunks:
+        chunk_ids = list(range(chunk * checkpoint.chunk_size, min((chunk + 1) * checkpoint.chunk_size, len(image_paths))))
+        data_loader = DataLoader(
+            ImageDataset(image_paths, chunk_ids, preprocess, resolution),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=loader.device == "cuda",
+            worker_init_fn=_limit_worker_threads if num_workers else None,
+            persistent_workers=False
+        )
+        
+        ids, embeddings, failed = [], [], []
+        for batch_ids, batch, ok in data_loader:
+            failed.append(batch_ids[~ok].numpy())
+            if ok.any():
+                with torch.no_grad():
+                    features = model.encode_image(batch[ok].to(loader.device, non_blocking=True))
+                    features = features / features.norm(dim=-1, keepdim=True)
+                ids.append(batch_ids[ok].numpy())
+                embeddings.append(features.float().cpu().numpy())
+        
+        dim = model.visual.output_dim
+        checkpoint.save(
+            chunk,
+            np.concatenate(ids) if ids else np.empty(0, dtype=np.int64),
+            np.concatenate(embeddings) if embeddings else np.empty((0, dim), dtype=np.float32),
+            np.concatenate(failed) if failed else np.empty(0, dtype=np.int64)
+        )
+        
+        done += len(chunk_ids)
+        elapsed = time.time() - start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else 0.0
+        print(f"   Chunk {chunk + 1}/{checkpoint.num_chunks}: {done}/{total} images, "
+              f"{rate:.1f} imgs/s, ETA {eta / 60:.1f} min")
+    
+    elapsed = time.time() - start_time
+    return {"images_embedded_this_run": done, "seconds_this_run": elapsed,
+            "images_per_sec": done / elapsed if elapsed > 0 else 0.0}
+
+def write_artifacts(
+    image_paths: list,
+    checkpoint: ChunkCheckpoint,
+    output_dir: str,
+    run_stats: dict,
+    loader: CLIPModelLoader,
+    batch_size: int
+) -> None:
+    """Write the embeddings, valid_indices and metadata files the API loads."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ids, embeddings, failed = checkpoint.load_all()
+    
+    metadata = {
+        "total_images_found": len(image_paths),
+        "successful_embeddings": int(len(ids)),
+        "failed_images": int(len(failed)),
+        "embedding_dimension": int(embeddings.shape[1]) if len(embeddings) else 512,
+        "model": loader.model_name,
+        "device": loader.device,
+        "batch_size": batch_size,
+        **run_stats,
+        "image_paths": image_paths,
+        "sample_paths": image_paths[:10]
+    }
+    
+    _atomic_write(output_dir / "clip_embeddings_optimized.npy", lambda f: np.save(f, embeddings.astype(np.float32)))
+    _atomic_write(output_dir / "valid_indices.npy", lambda f: np.save(f, ids.astype(np.int64)))
+    _atomic_write(output_dir / "embedding_metadata.json", lambda f: f.write(json.dumps(metadata, indent=2).encode("utf-8")))
+    # Saved beside and renamed over, like the files above: metadata.bin may be a
+    # symlink into a live index generation, which writing through would truncate
+    metadata_tmp = output_dir / "metadata.bin.tmp"
+    MetadataStore.from_paths(image_paths).save(str(metadata_tmp))
+    os.replace(metadata_tmp, output_dir / "metadata.bin")
+    
+    print(f"Saved {len(ids)} embeddings ({len(failed)} images skipped) to {output_dir}")
+    if (output_dir / "faiss_index.bin").exists():
+        print("Existing faiss_index.bin is now stale: rebuild it with scripts/build_faiss_index.py "
+              "(or delete it to have the API build one)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate CLIP image embeddings for the search index")
+    parser.add_argument("--image-dir", default="data/images")
+    parser.add_argument("--output-dir", default="data")
+    parser.add_argument("--checkpoint-dir", default="data/embedding_chunks")
+    parser.add_argument("--model", default="ViT-B/32")
+    parser.add_argument("--device", default="cuda")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="Decode processes")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Images per checkpoint chunk")
+    parser.add_argument("--max-images", type=int, default=0)
+    parser.add_argument("--no-resume", action="store_true", help="Ignore existing checkpoint chunks")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    
+    image_paths = find_images(args.image_dir, args.max_images)
+    if not image_paths:
+        print(f"No images found in {args.image_dir}")
+        sys.exit(1)
+    print(f"Found {len(image_paths)} images in {args.image_dir}")
+    
+    loader = CLIPModelLoader(model_name=args.model, device=args.device)
+    checkpoint = ChunkCheckpoint(args.checkpoint_dir, image_paths, args.chunk_size, args.model)
+    chunks = checkpoint.prepare(resume=not args.no_resume)
+    if len(chunks) < checkpoint.num_chunks:
+        print(f"Resuming: {checkpoint.num_chunks - len(chunks)}/{checkpoint.num_chunks} chunks already done")
+    
+    run_stats = embed_chunks(loader, image_paths, checkpoint, chunks, args.batch_size, args.workers)
+    write_artifacts(image_paths, checkpoint, args.output_dir, run_stats, loader, args.batch_size)
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.thumbnails import THUMBNAIL_WIDTHS, ThumbnailCache
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+_cache = None
+
+def _init_worker(image_dir: str, cache_dir: str, quality: int) -> None:
+    global _cache
+    _cache = ThumbnailCache(Path(image_dir), Path(cache_dir), quality=quality, etag_cache_size=0)
+
+def _render(filename: str) -> tuple:
+    """Render every width of one image; returns (filename, rendered, error)."""
+    rendered = _cache.rendered
+    try:
+        for width in THUMBNAIL_WIDTHS:
+            _cache.get(filename, width)
+    except OSError as e:
+        return filename, _cache.rendered - rendered, str(e)
+    return filename, _cache.rendered - rendered, None
+
+def generate_thumbnails(image_dir: str, cache_dir: str, workers: int, quality: int = 85) -> None:
+    """Pre-render all thumbnail widths; variants newer than their source are skipped."""
+    filenames = sorted(p.name for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    print(f"Rendering {THUMBNAIL_WIDTHS} for {len(filenames)} images into {cache_dir} ({workers} workers)...")
+    
+    start_time = time.time()
+    rendered = failed = 0
+    with Pool(workers, initializer=_init_worker, initargs=(image_dir, cache_dir, quality)) as pool:
+        for done, (filename, count, error) in enumerate(pool.imap_unordered(_render, filenames, chunksize=16), 1):
+            rendered += count
+            if error is not None:
+                failed += 1
+                print(f"   Skipped {filename}: {error}")
+            if done % 1000 == 0:
+                print(f"   {done}/{len(filenames)} images ({done / (time.time() - start_time):.0f} images/sec)")
+    
+    print(f"Rendered {rendered} variants in {time.time() - start_time:.1f}s ({failed} images failed)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pre-generate thumbnail variants for the image corpus")
+    parser.add_argument("--image-dir", default="data/images")
+    parser.add_argument("--cache-dir", default="data/thumbnails")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate_thumbnails(args.image_dir, args.cache_dir, args.workers, args.quality)